@@ -1,15 +1,24 @@
 import os
 from flask import Flask, jsonify
 from flask_cors import CORS
-from extensions import db, cache, jwt, migrate
+from flask_jwt_extended import jwt_required
+from extensions import db, cache, jwt, migrate, tmdb, tmdb_async, hasher
 from routes.auth import auth_bp
 from routes.review import reviews_bp
 from routes.movies import movies_bp
 from routes.genres import genres_bp
 from routes.cast import cast_bp
+from commands import stats_cli, passwords_cli, movies_cli
+from cache_serializer import CompactSerializer
+import http_cache
+from json_provider import FastJSONProvider
+import query_budget
+import user_lookup  # registers the JWT user loader
 
 def create_app(config_override=None):
     app = Flask(__name__)
+    # orjson (json module without it), msgpack bodies for clients that ask for them
+    app.json = FastJSONProvider(app)
     CORS(app)
 
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
@@ -18,12 +27,114 @@ def create_app(config_override=None):
 
     redis_url = os.environ.get('CACHE_REDIS_URL')
     if redis_url:
-        app.config['CACHE_TYPE'] = 'RedisCache'
+        # in-process LRU (L1) in front of Redis (L2) for the hot keys, see tiered_cache.py
+        if os.environ.get('CACHE_L1_ENABLED', 'true').lower() == 'true':
+            app.config['CACHE_TYPE'] = 'tiered_cache.TieredCache'
+            app.config['CACHE_L2_TYPE'] = 'RedisCache'
+        else:
+            app.config['CACHE_TYPE'] = 'RedisCache'
         app.config['CACHE_REDIS_URL'] = redis_url
+        # msgpack + zstd/zlib values instead of pickles, see cache_serializer.py
+        if os.environ.get('CACHE_COMPACT_SERIALIZER', 'true').lower() == 'true':
+            app.config['CACHE_SERIALIZER'] = CompactSerializer(
+                min_compress_bytes=int(os.environ.get('CACHE_COMPRESS_MIN_BYTES', 1024))
+            )
     else:
         app.config['CACHE_TYPE'] = 'SimpleCache'
 
     app.config['CACHE_DEFAULT_TIMEOUT'] = 300
+    # L1 budget per worker (bytes), how long a copy may live without an invalidation, and the cached keys
+    app.config['CACHE_L1_MAX_BYTES'] = int(os.environ.get('CACHE_L1_MAX_BYTES', 32 * 1024 * 1024))
+    app.config['CACHE_L1_TTL'] = int(os.environ.get('CACHE_L1_TTL', 60))
+    app.config['CACHE_L1_PREFIXES'] = os.environ.get('CACHE_L1_PREFIXES', 'genres,search:,tmdb:search:,cast:,movie:,videos:,similar:,asgi:,user:')
+
+    # cached user records of the JWT identities (current_user), seconds
+    app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 60))
+
+    # TMDB gateway: connect/read timeouts (seconds), retries on 5xx/429 and pool size per worker
+    app.config['TMDB_API_KEY'] = os.environ.get('TMDB_API_KEY')
+    app.config['TMDB_BASE_URL'] = os.environ.get('TMDB_BASE_URL')
+    app.config['TMDB_CONNECT_TIMEOUT'] = float(os.environ.get('TMDB_CONNECT_TIMEOUT', 3.05))
+    app.config['TMDB_READ_TIMEOUT'] = float(os.environ.get('TMDB_READ_TIMEOUT', 10))
+    app.config['TMDB_MAX_RETRIES'] = int(os.environ.get('TMDB_MAX_RETRIES', 2))
+    app.config['TMDB_RETRY_BACKOFF'] = float(os.environ.get('TMDB_RETRY_BACKOFF', 0.25))
+    # longest Retry-After waited for before retrying (default the read timeout), beyond it the 429/503 is returned
+    app.config['TMDB_MAX_RETRY_AFTER'] = float(os.environ.get('TMDB_MAX_RETRY_AFTER', app.config['TMDB_READ_TIMEOUT']))
+    app.config['TMDB_POOL_SIZE'] = int(os.environ.get('TMDB_POOL_SIZE', 10))
+    # calls per second a worker allows itself, only optional work (search prefetch) holds back when they run out
+    app.config['TMDB_RATE_LIMIT'] = int(os.environ.get('TMDB_RATE_LIMIT', 40))
+    # only used by the ASGI serving path (asgi.py), max upstream calls in flight per process
+    app.config['TMDB_ASYNC_MAX_CONNECTIONS'] = int(os.environ.get('TMDB_ASYNC_MAX_CONNECTIONS', 200))
+
+    # cast lists: served fresh for the soft TTL, then stale (and refreshed) until the hard TTL
+    app.config['CAST_CACHE_SOFT_TTL'] = int(os.environ.get('CAST_CACHE_SOFT_TTL', 3600))
+    app.config['CAST_CACHE_TTL'] = int(os.environ.get('CAST_CACHE_TTL', 7 * 86400))
+    # movie details of /movies/<id> (videos, similar movies too), same policy as cast lists
+    app.config['MOVIE_CACHE_SOFT_TTL'] = int(os.environ.get('MOVIE_CACHE_SOFT_TTL', 86400))
+    app.config['MOVIE_CACHE_TTL'] = int(os.environ.get('MOVIE_CACHE_TTL', 7 * 86400))
+
+    # GET /cast?ids=...: movies per request
+    app.config['CAST_BATCH_MAX_IDS'] = int(os.environ.get('CAST_BATCH_MAX_IDS', 50))
+
+    # filled search pages (/movies/search?limit=...): upstream pages read per request and in parallel
+    app.config['SEARCH_FILL_DEFAULT_LIMIT'] = 20
+    app.config['SEARCH_FILL_MAX_LIMIT'] = 100
+    app.config['SEARCH_FILL_MAX_PAGES'] = int(os.environ.get('SEARCH_FILL_MAX_PAGES', 10))
+    app.config['SEARCH_FILL_CONCURRENCY'] = int(os.environ.get('SEARCH_FILL_CONCURRENCY', 4))
+
+    # /movies/search?page=N loads the next pages into the cache in the background (0 turns it off),
+    # while at least SEARCH_PREFETCH_MIN_BUDGET TMDB calls are left this second
+    app.config['SEARCH_PREFETCH_DEPTH'] = int(os.environ.get('SEARCH_PREFETCH_DEPTH', 1))
+    app.config['SEARCH_PREFETCH_MIN_BUDGET'] = int(os.environ.get('SEARCH_PREFETCH_MIN_BUDGET', 10))
+    app.config['SEARCH_PREFETCH_MAX_PENDING'] = 32
+
+    # /movies/search answers from the local catalog first, when it holds this share of the TMDB results
+    app.config['SEARCH_LOCAL_FIRST'] = os.environ.get('SEARCH_LOCAL_FIRST', 'true').lower() == 'true'
+    app.config['SEARCH_LOCAL_MIN_RECALL'] = float(os.environ.get('SEARCH_LOCAL_MIN_RECALL', 0.8))
+    # result ids of the TMDB search pages, what the catalog is checked against, kept longer than the cached pages
+    app.config['SEARCH_REFERENCE_TTL'] = int(os.environ.get('SEARCH_REFERENCE_TTL', 7 * 86400))
+    # search results waiting to be mirrored into the catalog, past that they are dropped
+    app.config['CATALOG_MIRROR_MAX_PENDING'] = int(os.environ.get('CATALOG_MIRROR_MAX_PENDING', 64))
+
+    # metadata refresh of the stored movies (flask movies ..., see movie_refresh.py): stale after MOVIE_REFRESH_MAX_AGE_DAYS,
+    # re-read in batches at MOVIE_REFRESH_RATE TMDB calls per second, the worker looks for stale movies every MOVIE_REFRESH_INTERVAL seconds
+    app.config['MOVIE_REFRESH_MAX_AGE_DAYS'] = int(os.environ.get('MOVIE_REFRESH_MAX_AGE_DAYS', 30))
+    app.config['MOVIE_REFRESH_BATCH_SIZE'] = int(os.environ.get('MOVIE_REFRESH_BATCH_SIZE', 50))
+    app.config['MOVIE_REFRESH_RATE'] = float(os.environ.get('MOVIE_REFRESH_RATE', 10))
+    app.config['MOVIE_REFRESH_INTERVAL'] = int(os.environ.get('MOVIE_REFRESH_INTERVAL', 3600))
+    app.config['MOVIE_REFRESH_SCAN_LIMIT'] = int(os.environ.get('MOVIE_REFRESH_SCAN_LIMIT', 5000))
+
+    # GET /reviews/ratings: keyset pages, the whole list stays available without 'limit' while the flag is on
+    app.config['RATINGS_UNPAGINATED_COMPAT'] = os.environ.get('RATINGS_UNPAGINATED_COMPAT', 'true').lower() == 'true'
+    app.config['RATINGS_PAGE_DEFAULT_LIMIT'] = 50
+    app.config['RATINGS_PAGE_MAX_LIMIT'] = 200
+
+    # POST /reviews/ratings/bulk: rows per request and rows per transaction
+    app.config['BULK_IMPORT_MAX_ROWS'] = int(os.environ.get('BULK_IMPORT_MAX_ROWS', 50000))
+    app.config['BULK_IMPORT_BATCH_SIZE'] = int(os.environ.get('BULK_IMPORT_BATCH_SIZE', 5000))
+    # GET /reviews/ratings/export: rows fetched per server-side cursor round trip
+    app.config['EXPORT_BATCH_SIZE'] = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+
+    # password hashing: werkzeug method (see `flask passwords calibrate`), processes per worker
+    # (0 hashes in the request thread), hashes queued or running per worker before /auth answers 503,
+    # and hashes running at once on the host, across the workers (half the cores by default)
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 1))
+    app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 16))
+    app.config['PASSWORD_HASH_HOST_LIMIT'] = int(os.environ.get('PASSWORD_HASH_HOST_LIMIT', max(1, (os.cpu_count() or 2) // 2)))
+
+    # JSON bodies from this size are gzip/brotli compressed when the client accepts it
+    app.config['COMPRESS_MIN_BYTES'] = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+    app.config['COMPRESS_GZIP_LEVEL'] = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+    app.config['COMPRESS_BROTLI_QUALITY'] = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 5))
+
+    # SQL statements a request may run (routes can set their own with @query_budget),
+    # beyond it a warning is logged, or an error raised in strict mode (tests)
+    app.config['SQL_QUERY_BUDGET'] = int(os.environ.get('SQL_QUERY_BUDGET', 10))
+    app.config['SQL_QUERY_BUDGET_STRICT'] = os.environ.get('SQL_QUERY_BUDGET_STRICT', 'false').lower() == 'true'
+
+    # GET /cache/stats (two-tier cache counters) is only served when turned on, to logged in users
+    app.config['CACHE_STATS_ENABLED'] = os.environ.get('CACHE_STATS_ENABLED', 'false').lower() == 'true'
 
     if config_override:
         app.config.update(config_override)
@@ -32,6 +143,11 @@ def create_app(config_override=None):
     jwt.init_app(app)
     migrate.init_app(app, db)
     cache.init_app(app) 
+    tmdb.init_app(app)
+    tmdb_async.init_app(app)
+    hasher.init_app(app)
+    http_cache.init_app(app)
+    query_budget.init_app(app)
 
     app.register_blueprint(auth_bp, url_prefix='/auth') 
     app.register_blueprint(reviews_bp, url_prefix='/reviews') 
@@ -39,9 +155,26 @@ def create_app(config_override=None):
     app.register_blueprint(genres_bp, url_prefix='/genres') 
     app.register_blueprint(cast_bp, url_prefix='/cast') 
 
+    app.cli.add_command(stats_cli)
+    app.cli.add_command(passwords_cli)
+    app.cli.add_command(movies_cli)
+
     @app.route('/', methods=['GET'])
     def hello():
         return jsonify({"msg": "Hello world!"}), 200
+
+    if app.config['CACHE_STATS_ENABLED']:
+        # hit/miss/eviction counters of this worker per cache tier (none without the two-tier cache),
+        # and the latency counters of its TMDB calls per endpoint (tmdb_async: the ASGI path)
+        @app.route('/cache/stats', methods=['GET'])
+        @jwt_required()
+        def cache_stats():
+            backend = cache.cache
+            return jsonify({
+                **(backend.stats() if hasattr(backend, 'stats') else {}),
+                'tmdb': tmdb.stats(),
+                'tmdb_async': tmdb_async.stats()
+            }), 200
     
     return app
 
@@ -0,0 +1,205 @@
+"""
+ASGI serving path for the TMDB proxy routes.
+
+Responses are always built by the regular Flask app (built with the same create_app
+configuration), so ETags and 304s, compression, MessagePack, the local catalog and
+the search prefetch behave the same on both front ends. What runs on asyncio is the
+slow part: on a cache miss of
+
+    /movies/search (plain pages), /movies/<id>, /genres/, /cast/<id>
+
+the TMDB call is made here on top of httpx and its result is stored in the shared cache,
+under the keys and in the format of the Flask routes (same single-flight lock keys too),
+before Flask answers from the cache. A single process keeps hundreds of upstream calls in
+flight instead of one per worker thread. Everything else (cache hits, filled search pages,
+auth, reviews, ...) goes straight to Flask, which still loads whatever it finds missing.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 2
+"""
+import asyncio
+import math
+import time
+import uuid
+import httpx
+from contextlib import asynccontextmanager
+from a2wsgi import WSGIMiddleware
+from flask import request, jsonify
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.routing import Route, Mount
+
+from app import app as default_flask_app
+from extensions import cache, tmdb_async
+from caching import new_entry
+from singleflight import POLL_INTERVAL, default_lock_ttl
+from routes.movies import search_params, search_cache_key, search_page_key, search_catalog, store_search_page, search_view
+from routes.genres import GENRES_PARAMS, genres_view
+from movie_details import PARTS, MOVIE_PARAMS, split_movie, store_parts, part_ttls
+
+# set on the ASGI scope when the upstream call failed here, Flask answers with it
+FAILURE_KEY = 'tmdb_failure'
+
+
+class FillThenFlask:
+    """ASGI endpoint: fill(request) loads what the Flask route needs into the cache, then Flask answers"""
+
+    def __init__(self, fill, flask_asgi, error_message, log_message=None):
+        self.fill = fill
+        self.flask_asgi = flask_asgi
+        self.error_message = error_message
+        self.log_message = log_message
+
+    async def __call__(self, scope, receive, send):
+        if scope['method'] == 'GET':
+            try:
+                await self.fill(Request(scope, receive))
+            except httpx.HTTPError as e:
+                if self.log_message:
+                    print(f"{self.log_message}: {e}")
+                # same answer as the Flask route, without asking TMDB a second time
+                if isinstance(e, httpx.HTTPStatusError):
+                    scope[FAILURE_KEY] = {'body': e.response.json(), 'status': e.response.status_code}
+                else:
+                    scope[FAILURE_KEY] = {'body': {'error': self.error_message}, 'status': 502}
+        await self.flask_asgi(scope, receive, send)
+
+
+def create_asgi_app(flask_app):
+    # the same Flask-Caching backend as the sync routes, entries are shared
+    backend = flask_app.extensions['cache'][cache]
+    inflight = {}
+
+    @flask_app.before_request
+    def upstream_failure():
+        failure = request.environ.get('asgi.scope', {}).get(FAILURE_KEY)
+        if failure is not None:
+            return jsonify(failure['body']), failure['status']
+
+    async def in_app(function, *args):
+        """Runs shared sync code (cache, SQL) in a thread, inside an app context"""
+        def run():
+            with flask_app.app_context():
+                return function(*args)
+        return await asyncio.to_thread(run)
+
+    async def single_flight(key, loader, timeout):
+        """async twin of singleflight.cached_single_flight: same lock keys, so both front ends coordinate"""
+        value = await asyncio.to_thread(backend.get, key)
+        if value is not None:
+            return value
+
+        task = inflight.get(key)
+        if task is None:
+            task = inflight[key] = asyncio.ensure_future(load_once(key, loader, timeout))
+            task.add_done_callback(lambda done: inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def load_once(key, loader, timeout):
+        lock_key = f"{key}:lock"
+        token = uuid.uuid4().hex
+        lock_ttl = default_lock_ttl()
+        deadline = time.monotonic() + lock_ttl
+
+        while True:
+            if await asyncio.to_thread(backend.add, lock_key, token, max(1, math.ceil(lock_ttl))):
+                try:
+                    value = await loader()
+                    await asyncio.to_thread(backend.set, key, value, timeout)
+                    return value
+                finally:
+                    if await asyncio.to_thread(backend.get, lock_key) == token:
+                        await asyncio.to_thread(backend.delete, lock_key)
+
+            # another worker is fetching it
+            await asyncio.sleep(POLL_INTERVAL)
+            value = await asyncio.to_thread(backend.get, key)
+            if value is not None:
+                return value
+
+            if time.monotonic() >= deadline:
+                value = await loader()
+                await asyncio.to_thread(backend.set, key, value, timeout)
+                return value
+
+    async def fill_search(request):
+        params = request.query_params
+        query = params.get('query', '').strip()
+        # nothing to load for a 400, filled pages are assembled by the Flask route
+        if not query or 'limit' in params or 'cursor' in params:
+            return
+        try:
+            page = int(params.get('page', 1))
+        except ValueError:
+            page = 1
+        year = params.get('year', '').strip() or None
+        genre_id = params.get('genre', '').strip() or None
+
+        key = search_cache_key(query, page, year, genre_id)
+        if await asyncio.to_thread(backend.has, key):
+            return
+        if flask_app.config['SEARCH_LOCAL_FIRST'] and await in_app(search_catalog, query, page, year, genre_id) is not None:
+            return
+
+        async def load_page():
+            data = await tmdb_async.get("/search/movie", params=search_params(query, page, year), endpoint='search')
+            return await in_app(store_search_page, query, page, year, data)
+
+        async def load_view():
+            # same raw TMDB page entry as the sync route, the view is cached on its own
+            return search_view(await single_flight(search_page_key(query, page, year), load_page, 86400), genre_id)
+
+        await single_flight(key, load_view, 86400)
+
+    async def fill_genres(request):
+        async def load():
+            return genres_view(await tmdb_async.get("/genre/movie/list", params=GENRES_PARAMS, endpoint='genres'))
+
+        await single_flight("genres", load, 86400)
+
+    async def fill_movie_parts(tmdb_id, wanted):
+        """Loads the movie when one of the wanted parts is missing (stale ones are refreshed by Flask)"""
+        keys = [f"{part}:{tmdb_id}" for part in wanted]
+        entries = await asyncio.to_thread(backend.get_many, *keys)
+        missing = [part for part, entry in zip(wanted, entries) if entry is None]
+        if not missing:
+            return
+
+        first = missing[0]
+        with flask_app.app_context():
+            soft_ttl, ttl = part_ttls(first)
+
+        async def load():
+            # the details call brings every part, the others are stored along
+            parts = split_movie(await tmdb_async.get(f"/movie/{tmdb_id}", params=MOVIE_PARAMS, endpoint='movie'))
+            await in_app(store_parts, tmdb_id, parts, first)
+            return new_entry(parts[first], soft_ttl)
+
+        await single_flight(f"{first}:{tmdb_id}", load, ttl)
+
+    async def fill_movie(request):
+        await fill_movie_parts(request.path_params['tmdb_id'], PARTS)
+
+    async def fill_cast(request):
+        await fill_movie_parts(request.path_params['movie_id'], ('cast',))
+
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        await tmdb_async.aclose()
+
+    flask_asgi = WSGIMiddleware(flask_app)
+    routes = [
+        Route('/movies/search', FillThenFlask(fill_search, flask_asgi, 'Failed to fetch data from TMDB')),
+        Route('/movies/{tmdb_id:int}', FillThenFlask(fill_movie, flask_asgi, 'Failed to fetch movie from TMDB', 'Error calling TMDB Movie API')),
+        Route('/genres/', FillThenFlask(fill_genres, flask_asgi, 'Failed to fetch genres from TMDB', 'Error calling TMDB Genres API')),
+        Route('/cast/{movie_id:int}', FillThenFlask(fill_cast, flask_asgi, 'Failed to fetch cast from TMDB', 'Error calling TMDB Credits API')),
+        # everything else goes through Flask only (run in a thread pool)
+        Mount('/', app=flask_asgi),
+    ]
+
+    asgi_app = Starlette(routes=routes, lifespan=lifespan)
+    asgi_app.state.flask_app = flask_app
+    return asgi_app
+
+
+app = create_asgi_app(default_flask_app)
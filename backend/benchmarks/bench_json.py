@@ -0,0 +1,70 @@
+"""
+Serialization of the search_movies and get_movie_cast payloads: Flask's default JSON
+provider against FastJSONProvider (orjson) and its MessagePack bodies. Times the building
+of the response (what jsonify costs per request), the body size and the parsing on the
+client side. Run from the backend folder:
+
+    python benchmarks/bench_json.py
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import msgpack
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+import json_provider
+from json_provider import FastJSONProvider, MSGPACK_MIMETYPE
+from movie_details import format_cast
+from routes.movies import format_search_results
+from bench_serializer import tmdb_search_page, tmdb_credits
+
+
+def timed(function, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        function()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    payloads = [
+        ('search page', format_search_results(tmdb_search_page(rng))),
+        ('cast, 15 members', format_cast(tmdb_credits(rng, 15))),
+        ('cast, 80 members', format_cast(tmdb_credits(rng, 80))),
+    ]
+
+    app = Flask(__name__)
+    default = DefaultJSONProvider(app)
+    fast = FastJSONProvider(app)
+    parse_json = json_provider.orjson.loads if json_provider.orjson else json.loads
+    encodings = [
+        # name, provider, Accept of the request, parser of the body
+        ('json (default)', default, 'application/json', json.loads),
+        ('orjson', fast, 'application/json', parse_json),
+        ('msgpack', fast, MSGPACK_MIMETYPE, msgpack.unpackb),
+    ]
+
+    print(f"orjson {'installed' if json_provider.orjson else 'NOT installed (json module)'}\n")
+    print(f"{'payload':<18} {'encoding':<16} {'bytes':>7} {'response µs':>12} {'parse µs':>9}")
+    for name, payload in payloads:
+        for encoding, provider, accept, parse in encodings:
+            with app.test_request_context(headers={'Accept': accept}):
+                body = provider.response(payload).get_data()
+                assert parse(body) == payload
+                build = timed(lambda: provider.response(payload), args.rounds)
+            print(f"{name:<18} {encoding:<16} {len(body):>7} {build:>12.1f} {timed(lambda: parse(body), args.rounds):>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Bytes per key and (de)serialization time of the cache values, default Redis serializer
+(pickle) against CompactSerializer (msgpack, zstd or zlib above CACHE_COMPRESS_MIN_BYTES).
+Payloads have the shape of what the routes cache: raw TMDB search pages, formatted
+search pages, cast lists (stale-while-revalidate entries) and genres. With --redis-url
+the values are also written to Redis and MEMORY USAGE is read back. Run from the backend folder:
+
+    python benchmarks/bench_serializer.py --redis-url redis://localhost:6379/0
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from unittest.mock import patch
+from cachelib.serializers import RedisSerializer
+import cache_serializer
+from cache_serializer import CompactSerializer
+from movie_details import format_cast
+from routes.movies import format_search_results
+
+WORDS = ("the a of in his her to and with an by young world life love story family war city "
+         "after must finds their new when who old secret one two home man woman time dark "
+         "journey friends father mother lost night last death battle stranger power truth").split()
+
+GENRES = [
+    {"id": 28, "name": "Action"}, {"id": 12, "name": "Adventure"}, {"id": 16, "name": "Animation"},
+    {"id": 35, "name": "Comedy"}, {"id": 80, "name": "Crime"}, {"id": 99, "name": "Documentary"},
+    {"id": 18, "name": "Drama"}, {"id": 10751, "name": "Family"}, {"id": 14, "name": "Fantasy"},
+    {"id": 36, "name": "History"}, {"id": 27, "name": "Horror"}, {"id": 10402, "name": "Music"},
+    {"id": 9648, "name": "Mystery"}, {"id": 10749, "name": "Romance"}, {"id": 878, "name": "Science Fiction"},
+    {"id": 10770, "name": "TV Movie"}, {"id": 53, "name": "Thriller"}, {"id": 10752, "name": "War"},
+    {"id": 37, "name": "Western"}
+]
+
+
+def text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def path(rng):
+    return '/' + ''.join(rng.choice('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789') for _ in range(27)) + '.jpg'
+
+
+def tmdb_search_page(rng):
+    """Same fields as a TMDB /search/movie page"""
+    results = []
+    for _ in range(20):
+        title = text(rng, rng.randint(1, 5))
+        results.append({
+            "adult": False,
+            "backdrop_path": path(rng) if rng.random() < 0.8 else None,
+            "genre_ids": rng.sample([genre['id'] for genre in GENRES], rng.randint(1, 3)),
+            "id": rng.randint(1, 1_200_000),
+            "original_language": rng.choice(["en", "en", "fr", "ja", "es"]),
+            "original_title": title,
+            "overview": text(rng, rng.randint(20, 70)) + '.',
+            "popularity": round(rng.uniform(0.5, 120), 3),
+            "poster_path": path(rng) if rng.random() < 0.9 else None,
+            "release_date": f"{rng.randint(1950, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "title": title,
+            "video": False,
+            "vote_average": round(rng.uniform(3, 9), 3),
+            "vote_count": rng.randint(0, 30000)
+        })
+    return {"page": 1, "results": results, "total_pages": 12, "total_results": 231}
+
+
+def tmdb_credits(rng, size):
+    return {"id": 603, "cast": [{
+        "id": rng.randint(1, 5_000_000),
+        "name": text(rng, 2).title(),
+        "original_name": text(rng, 2).title(),
+        "character": text(rng, rng.randint(1, 3)).title(),
+        "profile_path": path(rng) if rng.random() < 0.7 else None,
+        "order": order,
+        "gender": rng.choice([0, 1, 2]),
+        "known_for_department": "Acting",
+        "cast_id": rng.randint(1, 200),
+        "credit_id": '%024x' % rng.getrandbits(96)
+    } for order in range(size)]}
+
+
+def swr_entry(data):
+    """What cached_with_refresh stores"""
+    return {'data': data, 'fresh_until': time.time() + 600}
+
+
+def payloads():
+    rng = random.Random(42)
+    raw_page = tmdb_search_page(rng)
+    return [
+        ('genres', swr_entry(GENRES)),
+        ('search page (view)', format_search_results(raw_page)),
+        ('search page (TMDB)', raw_page),
+        ('cast, 15 members', swr_entry(format_cast(tmdb_credits(rng, 15)))),
+        ('cast, 80 members', swr_entry(format_cast(tmdb_credits(rng, 80)))),
+    ]
+
+
+def timed(function, value, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        function(value)
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def redis_memory(client, data):
+    client.set('bench:serializer', data)
+    try:
+        return client.memory_usage('bench:serializer', samples=0)
+    finally:
+        client.delete('bench:serializer')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=2000)
+    parser.add_argument('--min-compress-bytes', type=int, default=1024)
+    parser.add_argument('--redis-url', help='also report MEMORY USAGE of each value')
+    args = parser.parse_args()
+
+    serializers = [('pickle (default)', RedisSerializer())]
+    if cache_serializer.zstandard:
+        serializers.append(('msgpack+zstd', CompactSerializer(args.min_compress_bytes)))
+    with patch.object(cache_serializer, 'zstandard', None):
+        serializers.append(('msgpack+zlib', CompactSerializer(args.min_compress_bytes)))
+
+    client = None
+    if args.redis_url:
+        import redis
+        client = redis.Redis.from_url(args.redis_url)
+
+    print(f"{'payload':<20} {'serializer':<18} {'bytes':>7} {'redis':>7} {'dumps µs':>9} {'loads µs':>9}")
+    for name, value in payloads():
+        for serializer_name, serializer in serializers:
+            data = serializer.dumps(value)
+            assert serializer.loads(data) == value
+            memory = redis_memory(client, data) if client else '-'
+            print(f"{name:<20} {serializer_name:<18} {len(data):>7} {memory:>7} "
+                  f"{timed(serializer.dumps, value, args.rounds):>9.1f} {timed(serializer.loads, data, args.rounds):>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
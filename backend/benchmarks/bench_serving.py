@@ -0,0 +1,136 @@
+"""
+Serving of the TMDB proxy routes by the gunicorn profile (gunicorn.conf.py) with each
+worker class, and by the async path (uvicorn asgi:app).
+
+The servers talk to benchmarks/fake_tmdb.py, which answers after a fixed delay. By
+default every request uses a new search query, so each one is a cache miss that goes
+upstream; with --cached they all ask the same search (cache hits after the first one).
+Run from the backend folder:
+
+    python benchmarks/bench_serving.py --workers 2 --concurrency 200 --requests 2000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+import httpx
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+UPSTREAM_PORT = 5901
+
+def gunicorn(worker_class):
+    """Production profile, the worker count comes from WEB_CONCURRENCY"""
+    def command(workers, port):
+        return [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-b', f'127.0.0.1:{port}', 'app:app']
+    return command, {'GUNICORN_WORKER_CLASS': worker_class}
+
+
+# name -> (command for (workers, port), extra environment)
+SERVERS = {
+    'gunicorn sync': gunicorn('sync'),
+    'gunicorn gthread': gunicorn('gthread'),
+    'gunicorn gevent': gunicorn('gevent'),
+    'uvicorn asgi:app': (lambda workers, port: [
+        sys.executable, '-m', 'uvicorn', 'asgi:app', '--workers', str(workers),
+        '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'
+    ], {}),
+}
+
+
+def start(cmd, env, url):
+    process = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            httpx.get(url, timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"server did not start: {' '.join(cmd)}")
+
+
+async def load(base_url, total, concurrency, tag, cached):
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def one(i):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.get('/movies/search', params={'query': f'{tag}-cached' if cached else f'{tag}-{i}'})
+                    if response.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'rps': total / elapsed,
+        'p50': statistics.median(latencies) * 1000,
+        'p99': latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.1, help='fake TMDB latency in seconds')
+    parser.add_argument('--cached', action='store_true', help='same search for every request')
+    parser.add_argument('--servers', nargs='+', choices=list(SERVERS), default=list(SERVERS), metavar='SERVER')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': 'sqlite://',
+        'TMDB_BASE_URL': f'http://127.0.0.1:{UPSTREAM_PORT}/3',
+        'TMDB_API_KEY': 'bench',
+        'FAKE_TMDB_LATENCY': str(args.latency),
+        'WEB_CONCURRENCY': str(args.workers),
+        # the in-memory database has no catalog to search
+        'SEARCH_LOCAL_FIRST': 'false',
+    })
+    env.pop('CACHE_REDIS_URL', None)
+
+    upstream = start(
+        [sys.executable, '-m', 'uvicorn', 'benchmarks.fake_tmdb:app', '--port', str(UPSTREAM_PORT), '--log-level', 'warning'],
+        env, f'http://127.0.0.1:{UPSTREAM_PORT}/3/genre/movie/list'
+    )
+
+    kind = 'cached' if args.cached else 'cache-miss'
+    print(f"{args.requests} {kind} searches, {args.concurrency} concurrent clients, "
+          f"{args.workers} workers, upstream latency {args.latency * 1000:.0f} ms\n")
+    print(f"{'server':<24} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+
+    try:
+        for port, name in enumerate(args.servers, start=5910):
+            build, extra_env = SERVERS[name]
+            server = start(build(args.workers, port), {**env, **extra_env}, f'http://127.0.0.1:{port}/')
+            try:
+                result = asyncio.run(load(f'http://127.0.0.1:{port}', args.requests, args.concurrency, port, args.cached))
+            finally:
+                server.terminate()
+                server.wait()
+            print(f"{name:<24} {result['rps']:>8.1f} {result['p50']:>8.1f} {result['p99']:>8.1f} {result['errors']:>7}")
+    finally:
+        upstream.terminate()
+        upstream.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Fake TMDB upstream for the benchmarks: answers every request after a fixed delay,
+like a remote API would (FAKE_TMDB_LATENCY seconds, default 0.1).
+"""
+import asyncio
+import os
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+LATENCY = float(os.environ.get('FAKE_TMDB_LATENCY', 0.1))
+
+MOVIE = {
+    "id": 603,
+    "title": "The Matrix",
+    "poster_path": "/f89U3ADr1oiB1s9GkdPOEpXUk5H.jpg",
+    "backdrop_path": "/fNG7i7RqMErkcqhohV2a6cV1Ehy.jpg",
+    "overview": "Set in the 22nd century, The Matrix tells the story of a computer hacker...",
+    "release_date": "1999-03-31",
+    "genre_ids": [28, 878]
+}
+
+CAST_MEMBER = {
+    "id": 6384,
+    "name": "Keanu Reeves",
+    "original_name": "Keanu Reeves",
+    "character": "Neo",
+    "profile_path": "/4D0PpNI0kmP58hgrwGC3wCjxhnm.jpg",
+    "order": 0,
+    "gender": 2,
+    "known_for_department": "Acting",
+    "cast_id": 34,
+    "credit_id": "52fe425bc3a36847f80181c1"
+}
+
+
+async def search(request):
+    await asyncio.sleep(LATENCY)
+    page = int(request.query_params.get('page', 1))
+    return JSONResponse({"page": page, "total_pages": 50, "results": [MOVIE] * 20})
+
+
+async def genres(request):
+    await asyncio.sleep(LATENCY)
+    return JSONResponse({"genres": [{"id": 28, "name": "Action"}, {"id": 878, "name": "Science Fiction"}]})
+
+
+async def credits(request):
+    await asyncio.sleep(LATENCY)
+    return JSONResponse({"id": request.path_params['movie_id'], "cast": [CAST_MEMBER] * 40})
+
+
+app = Starlette(routes=[
+    Route('/3/search/movie', search),
+    Route('/3/genre/movie/list', genres),
+    Route('/3/movie/{movie_id:int}/credits', credits),
+])
@@ -0,0 +1,80 @@
+"""
+Compact serializer for the Redis cache backend: msgpack instead of pickle, compressed
+(zstd when the zstandard package is installed, zlib otherwise) above a size threshold.
+
+Stored values start with a one byte tag, so entries written by the default serializer
+(pickle, tag '!') and plain integers (INCR/DECR counters) are still readable.
+"""
+import pickle
+import zlib
+import msgpack
+from cachelib.serializers import BaseRedisSerializer
+
+try:
+    import zstandard
+except ImportError:  # optional, zlib is used instead
+    zstandard = None
+
+LOAD_ERRORS = (ValueError, zlib.error, pickle.PickleError, msgpack.UnpackException)
+if zstandard:
+    LOAD_ERRORS += (zstandard.ZstdError,)
+
+PICKLE = b'!'
+MSGPACK = b'\x01'
+MSGPACK_ZLIB = b'\x02'
+MSGPACK_ZSTD = b'\x03'
+
+
+class CompactSerializer(BaseRedisSerializer):
+
+    def __init__(self, min_compress_bytes=1024, level=3):
+        self.min_compress_bytes = min_compress_bytes
+        self.level = level
+        self._zstd_compressor = zstandard.ZstdCompressor(level=level) if zstandard else None
+        self._zstd_decompressor = zstandard.ZstdDecompressor() if zstandard else None
+
+    def dumps(self, value, protocol=pickle.HIGHEST_PROTOCOL):
+        # check type instead of isinstance since bool is an int subclass
+        if type(value) is int:
+            return str(value).encode('ascii')
+
+        try:
+            packed = msgpack.packb(value, use_bin_type=True)
+        except (TypeError, ValueError, OverflowError):
+            # not msgpack friendly (datetimes, custom objects...): same format as the default serializer
+            return PICKLE + pickle.dumps(value, protocol)
+
+        if len(packed) < self.min_compress_bytes:
+            return MSGPACK + packed
+        if self._zstd_compressor is not None:
+            return MSGPACK_ZSTD + self._zstd_compressor.compress(packed)
+        return MSGPACK_ZLIB + zlib.compress(packed, self.level)
+
+    def loads(self, value):
+        if value is None:
+            return None
+
+        tag, body = value[:1], value[1:]
+        try:
+            if tag == MSGPACK:
+                return self._unpack(body)
+            if tag == MSGPACK_ZSTD:
+                if self._zstd_decompressor is None:
+                    # written by a worker with zstandard installed: a miss here
+                    return None
+                return self._unpack(self._zstd_decompressor.decompress(body))
+            if tag == MSGPACK_ZLIB:
+                return self._unpack(zlib.decompress(body))
+            if tag == PICKLE:
+                return pickle.loads(body)
+        except LOAD_ERRORS as e:
+            self._warn(e)
+            return None
+
+        try:
+            return int(value)
+        except ValueError:
+            return value
+
+    def _unpack(self, packed):
+        return msgpack.unpackb(packed, raw=False, strict_map_key=False)
@@ -0,0 +1,119 @@
+import math
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from flask import current_app
+from extensions import cache
+from singleflight import cached_single_flight, default_lock_ttl
+
+# small pool: refreshes are rare (at most one per key per soft TTL) and I/O bound
+refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='cache-refresh')
+
+_pending = {}
+_pending_lock = threading.Lock()
+
+
+def cached_with_refresh(key, loader, soft_ttl, ttl):
+    """
+    Stale-while-revalidate lookup on the Flask-Caching backend.
+    - fresh entry: returned as is
+    - stale entry (older than soft_ttl): returned right away, refreshed in the background
+    - missing entry: loaded inline, once for all concurrent callers (loader errors go to the caller)
+    The entry itself lives for ttl seconds, so a stale copy is kept around long enough to serve.
+    """
+    entry = cache.get(key)
+
+    if entry is not None:
+        if entry['fresh_until'] <= time.time():
+            schedule_refresh(key, loader, soft_ttl, ttl)
+        return entry['data']
+
+    entry = cached_single_flight(key, lambda: new_entry(loader(), soft_ttl), timeout=ttl)
+    return entry['data']
+
+
+def cached_many_with_refresh(loaders, soft_ttl, ttl, executor):
+    """
+    cached_with_refresh for several keys at once, loaders being {key: loader}:
+    - all keys are read in one multi-get (MGET on Redis)
+    - stale entries are returned and refreshed in the background, as with single lookups
+    - misses are loaded concurrently on executor (its size bounds the fan-out), each one
+      single-flighted with the other requests loading the same key
+    Returns ({key: data}, {key: exception}) so one failing loader doesn't lose the others.
+    """
+    keys = list(loaders)
+    results = {}
+    misses = []
+
+    for key, entry in zip(keys, cache.get_many(*keys)):
+        if entry is None:
+            misses.append(key)
+            continue
+        if entry['fresh_until'] <= time.time():
+            schedule_refresh(key, loaders[key], soft_ttl, ttl)
+        results[key] = entry['data']
+
+    app = current_app._get_current_object()
+
+    def load(key):
+        with app.app_context():
+            try:
+                return cached_single_flight(key, lambda: new_entry(loaders[key](), soft_ttl), timeout=ttl)['data'], None
+            except Exception as e:
+                return None, e
+
+    errors = {}
+    for key, (data, error) in zip(misses, executor.map(load, misses)):
+        if error is None:
+            results[key] = data
+        else:
+            errors[key] = error
+    return results, errors
+
+
+def schedule_refresh(key, loader, soft_ttl, ttl):
+    """Refreshes key in the background, at most once at a time per key (across workers too)"""
+    with _pending_lock:
+        if key in _pending:
+            return _pending[key]
+
+        # cache.add is atomic (SET NX on Redis), so only one worker wins the refresh; the marker
+        # outlives one upstream call at its worst, a worker dying mid-refresh doesn't block the next
+        if not cache.add(f"{key}:refreshing", 1, timeout=math.ceil(default_lock_ttl())):
+            return None
+
+        app = current_app._get_current_object()
+        future = refresh_executor.submit(_refresh, app, key, loader, soft_ttl, ttl)
+        _pending[key] = future
+
+    return future
+
+
+def wait_for_refreshes(timeout=None):
+    """Blocks until the background refreshes started so far are done (tests, shutdown)"""
+    with _pending_lock:
+        futures = list(_pending.values())
+    wait(futures, timeout=timeout)
+
+
+def _refresh(app, key, loader, soft_ttl, ttl):
+    with app.app_context():
+        try:
+            store_entry(key, loader(), soft_ttl, ttl)
+        except Exception as e:
+            # keep serving the stale copy, next request past the soft TTL will retry
+            print(f"Error refreshing cache key {key}: {e}")
+        finally:
+            cache.delete(f"{key}:refreshing")
+            with _pending_lock:
+                _pending.pop(key, None)
+
+
+def new_entry(data, soft_ttl):
+    """Stale-while-revalidate entry of data, fresh for soft_ttl seconds"""
+    return {'data': data, 'fresh_until': time.time() + soft_ttl}
+
+
+def store_entry(key, data, soft_ttl, ttl):
+    """Stores data as a fresh entry of key (values loaded along with another key)"""
+    cache.set(key, new_entry(data, soft_ttl), timeout=ttl)
@@ -0,0 +1,226 @@
+import math
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from urllib.parse import urlencode
+from flask import current_app
+from sqlalchemy import select, func, text, literal_column, table, cast, or_
+from extensions import cache
+from models import db, Movie, MovieRatingStats
+from ratings_store import upsert_insert
+from http_cache import bump_version
+
+# TMDB search pages have 20 results, local pages are cut the same way
+PAGE_SIZE = 20
+
+# changed when the details of a rated movie change, part of the ratings list ETag
+CATALOG_VERSION_KEY = "catalog:version"
+
+# movies columns shown by the ratings list
+RATED_COLUMNS = ('title', 'poster_path', 'backdrop_path', 'overview', 'release_date')
+
+# catalog writes run on a single thread, off the request path and without competing with each other
+mirror_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='catalog-mirror')
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def catalog_values(movie):
+    """movies row of a formatted TMDB search result (format_movie fields + genre_ids, popularity)"""
+    release_date = None
+    if movie.get('release_date'):
+        try:
+            release_date = datetime.strptime(movie['release_date'], '%Y-%m-%d')
+        except ValueError:
+            pass
+
+    return {
+        'tmdb_id': movie['tmdb_id'],
+        'title': movie['title'][:255],
+        'poster_path': movie.get('poster_path'),
+        'backdrop_path': movie.get('backdrop_path'),
+        'overview': movie.get('overview'),
+        'release_date': release_date,
+        'genre_ids': movie.get('genre_ids') or [],
+        'popularity': movie.get('popularity'),
+        'refreshed_at': datetime.utcnow()
+    }
+
+
+def mirror_movies(movies):
+    """
+    Upserts search results into movies (in the caller's transaction): new movies are
+    added to the catalog, known ones get the current TMDB metadata. Returns the number
+    of rows written (unchanged movies aren't rewritten) and whether the details of a
+    rated movie changed (see changes_rated_movies).
+    """
+    # a statement can't update the same row twice
+    rows = list({row['tmdb_id']: row for row in map(catalog_values, movies)}.values())
+    stmt = upsert_insert(Movie)
+    if not rows or stmt is None:
+        return 0, False
+
+    rated_changed = changes_rated_movies(rows, 'tmdb_id')
+    columns = ['title', 'poster_path', 'backdrop_path', 'overview', 'release_date', 'genre_ids', 'popularity']
+    stmt = stmt.values(rows)
+    # json has no equality operator on Postgres, it is compared as text
+    changed = [
+        cast(Movie.__table__.c[name], db.Text).is_distinct_from(cast(stmt.excluded[name], db.Text))
+        if name == 'genre_ids' else Movie.__table__.c[name].is_distinct_from(stmt.excluded[name])
+        for name in columns
+    ]
+    written = db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['tmdb_id'],
+        # refreshed_at is written with the changes, but isn't one
+        set_={name: stmt.excluded[name] for name in columns + ['refreshed_at']},
+        where=or_(*changed)
+    )).rowcount
+    return written, rated_changed
+
+
+def changes_rated_movies(rows, key):
+    """
+    Whether writing rows (movies values, with their key column: id or tmdb_id) changes what
+    a ratings list shows: the RATED_COLUMNS of a movie someone rated. New popularity or
+    genres, and movies nobody rated, leave the ratings ETags alone.
+    """
+    values = {row[key]: row for row in rows}
+    column = Movie.__table__.c[key]
+    stored = db.session.execute(
+        select(column, *(Movie.__table__.c[name] for name in RATED_COLUMNS))
+        .join(MovieRatingStats, MovieRatingStats.movie_id == Movie.id)
+        .where(column.in_(values), MovieRatingStats.rating_count > 0)
+    ).all()
+    return any(
+        name in values[row[0]] and values[row[0]][name] != getattr(row, name)
+        for row in stored for name in RATED_COLUMNS
+    )
+
+
+def schedule_mirror(movies):
+    """
+    Writes search results into the catalog in the background. No more than
+    CATALOG_MIRROR_MAX_PENDING writes wait at a time, the others are dropped: the same
+    results are mirrored by the next search, stored ones by the refresh job.
+    """
+    if not movies:
+        return None
+
+    app = current_app._get_current_object()
+    with _pending_lock:
+        if len(_pending) >= app.config['CATALOG_MIRROR_MAX_PENDING']:
+            return None
+        future = mirror_executor.submit(_mirror, app, movies)
+        _pending.add(future)
+    future.add_done_callback(_forget)
+    return future
+
+
+def wait_for_mirrors(timeout=None):
+    """Blocks until the scheduled catalog writes are done (tests, shutdown)"""
+    with _pending_lock:
+        futures = list(_pending)
+    wait(futures, timeout=timeout)
+
+
+def _forget(future):
+    with _pending_lock:
+        _pending.discard(future)
+
+
+def _mirror(app, movies):
+    with app.app_context():
+        try:
+            rated_changed = mirror_movies(movies)[1]
+            db.session.commit()
+            if rated_changed:
+                bump_version(CATALOG_VERSION_KEY)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error mirroring search results into the catalog: {e}")
+
+
+def search_reference_key(query, year, page):
+    params = {'query': ' '.join(query.split()).casefold(), 'year': year or '', 'page': page}
+    return "catalog:results:" + urlencode(sorted(params.items()))
+
+
+def search_source_key(query, year):
+    params = {'query': ' '.join(query.split()).casefold(), 'year': year or ''}
+    return "catalog:source:" + urlencode(sorted(params.items()))
+
+
+def remember_search_page(query, year, page, data):
+    """Keeps the result ids of a TMDB search page (in TMDB order), the reference the catalog is judged against"""
+    reference = {
+        'ids': [item['id'] for item in data.get('results', []) if item.get('id') and item.get('title')],
+        'total_pages': data.get('total_pages') or 0
+    }
+    cache.set(search_reference_key(query, year, page), reference, timeout=current_app.config['SEARCH_REFERENCE_TTL'])
+
+
+def local_search_page(query, year, page, min_recall):
+    """
+    The movies of a TMDB search page found by the full-text search of the catalog, in TMDB
+    order, with the reference they come from. Local recall is the share of the results of
+    that page the title index finds: None without a reference for this page, or under
+    min_recall (or without full-text search).
+    """
+    reference = cache.get(search_reference_key(query, year, page))
+    if reference is None:
+        return None
+
+    ids = reference['ids']
+    if not ids:
+        return [], reference
+    # the reference already has the year filter of TMDB
+    found = search_local(query, None, tmdb_ids=ids)
+    if found is None:
+        return None
+    movies = {movie.tmdb_id: movie for movie in found[0]}
+    if len(movies) < math.ceil(len(ids) * min_recall):
+        return None
+    return [movies[tmdb_id] for tmdb_id in ids if tmdb_id in movies], reference
+
+
+def search_local(query, year, page=None, tmdb_ids=None):
+    """
+    Full-text search of the catalog titles, every word of the query as a prefix, best
+    matches first (then most popular). Returns the movies of the page (every match without
+    a page) and the number of matches, or None when the database has no full-text search.
+    tmdb_ids limits the search to these movies.
+    """
+    words = re.findall(r'\w+', query.casefold())
+    dialect = db.engine.dialect.name
+    if not words or dialect not in ('postgresql', 'sqlite'):
+        return None
+
+    stmt = select(Movie, func.count().over().label('total'))
+
+    if dialect == 'postgresql':
+        # same expression as the GIN index, the config must be a literal for the planner to use it
+        vector = func.to_tsvector(literal_column("'simple'"), Movie.title)
+        tsquery = func.to_tsquery(literal_column("'simple'"), ' & '.join(f"{word}:*" for word in words))
+        stmt = stmt.where(vector.op('@@')(tsquery)).order_by(func.ts_rank(vector, tsquery).desc())
+    else:
+        # bm25() can't be called next to the window function, it is computed in a subquery
+        match = ' '.join(f'"{word}"*' for word in words)
+        matches = select(
+            literal_column('rowid').label('movie_id'),
+            literal_column('bm25(movies_fts)').label('score')
+        ).select_from(table('movies_fts')).where(text("movies_fts MATCH :match").bindparams(match=match)).subquery()
+        stmt = stmt.join(matches, matches.c.movie_id == Movie.id).order_by(matches.c.score)
+
+    if year and str(year).isdigit():
+        year = int(year)
+        stmt = stmt.where(Movie.release_date >= datetime(year, 1, 1), Movie.release_date < datetime(year + 1, 1, 1))
+    if tmdb_ids is not None:
+        stmt = stmt.where(Movie.tmdb_id.in_(tmdb_ids))
+
+    stmt = stmt.order_by(Movie.popularity.desc().nulls_last(), Movie.id)
+    if page is not None:
+        stmt = stmt.limit(PAGE_SIZE).offset((page - 1) * PAGE_SIZE)
+
+    rows = db.session.execute(stmt).all()
+    return [row.Movie for row in rows], rows[0].total if rows else 0
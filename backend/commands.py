@@ -0,0 +1,67 @@
+import click
+from flask.cli import AppGroup
+from ratings_store import rebuild_rating_stats
+from passwords import calibrate, DEFAULT_METHOD
+from movie_refresh import get_queue, enqueue_stale, count_stale, drain, run_worker, describe, RefreshStats, STATS_KEY
+from extensions import cache
+
+# flask stats ...: maintenance of the movie_rating_stats aggregates
+stats_cli = AppGroup('stats', help='Community rating stats of movies.')
+
+
+@stats_cli.command('rebuild')
+def rebuild_stats():
+    """Recompute movie_rating_stats from the ratings table."""
+    movies = rebuild_rating_stats()
+    click.echo(f'Rebuilt rating stats of {movies} movies')
+
+
+# flask passwords ...: tuning of the password hash cost
+passwords_cli = AppGroup('passwords', help='Password hashing.')
+
+
+@passwords_cli.command('calibrate')
+@click.option('--target-ms', default=250, show_default=True, help='Wanted time of one hash.')
+@click.option('--algorithm', type=click.Choice(['scrypt', 'pbkdf2']), default='scrypt', show_default=True)
+def calibrate_passwords(target_ms, algorithm):
+    """Pick the hash cost for a target latency on this machine."""
+    method, timings = calibrate(target_ms / 1000, algorithm)
+    for candidate, elapsed in timings:
+        click.echo(f'{candidate:<24} {elapsed * 1000:>8.1f} ms')
+
+    if algorithm == 'scrypt' and int(method.split(':')[1]) < int(DEFAULT_METHOD.split(':')[1]):
+        click.echo(f'Warning: weaker than the default {DEFAULT_METHOD}, prefer more PASSWORD_HASH_WORKERS')
+    click.echo(f'PASSWORD_HASH_METHOD={method}')
+    click.echo('Stored hashes are upgraded at the next login of each user.')
+
+
+# flask movies ...: refresh of the stored movies metadata from TMDB
+movies_cli = AppGroup('movies', help='Metadata of the stored movies.')
+
+
+@movies_cli.command('refresh')
+@click.option('--limit', type=int, help='Stale movies to queue at most (default MOVIE_REFRESH_SCAN_LIMIT).')
+def refresh_movies(limit):
+    """Queue the stale movies and refresh them until the queue is empty."""
+    queue = get_queue()
+    queued = enqueue_stale(queue, limit)
+    click.echo(f'Queued {queued} stale movies, backlog {queue.size()}')
+
+    stats = drain(queue, RefreshStats(), log=click.echo)
+    click.echo(f'Done: {describe(stats.snapshot(queue.size()))}')
+
+
+@movies_cli.command('worker')
+@click.option('--interval', type=int, help='Seconds between two looks for stale movies (default MOVIE_REFRESH_INTERVAL).')
+def movies_worker(interval):
+    """Refresh stale movies continuously: scheduler and queue worker."""
+    run_worker(interval, log=click.echo)
+
+
+@movies_cli.command('status')
+def movies_status():
+    """Backlog and throughput of the refresh."""
+    click.echo(f'Stale movies: {count_stale()}')
+    click.echo(f'Queued: {get_queue().size()}')
+    last = cache.get(STATS_KEY)
+    click.echo(f"Last batch ({last['updated_at']}): {describe(last)}" if last else 'No refresh has run yet')
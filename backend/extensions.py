@@ -2,8 +2,13 @@ from flask_caching import Cache
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_migrate import Migrate
+from tmdb import TMDBClient, AsyncTMDBClient
+from passwords import PasswordHasher
 
 db = SQLAlchemy()
 cache = Cache()
 jwt = JWTManager()
-migrate = Migrate()
\ No newline at end of file
+migrate = Migrate()
+tmdb = TMDBClient()
+tmdb_async = AsyncTMDBClient()
+hasher = PasswordHasher()
\ No newline at end of file
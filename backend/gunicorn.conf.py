@@ -0,0 +1,70 @@
+"""
+Production serving profile:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+The app is built once in the master (preload_app), its objects are moved out of the
+garbage collector's tracking (gc.freeze) so the forked workers share those memory pages
+instead of copying them on the first collection, and every worker drops the sockets it
+inherited (database engine, Redis pools) to open its own.
+
+GUNICORN_WORKER_CLASS picks the worker: sync (one request at a time), gthread (default,
+GUNICORN_THREADS requests per worker) or gevent (GUNICORN_WORKER_CONNECTIONS greenlets per
+worker, needs the gevent package; psycogreen makes psycopg2 cooperative).
+"""
+import gc
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_class == 'gevent':
+    # before the app is preloaded: locks and queues built at import time (executors...)
+    # must already be gevent's, or a greenlet waiting on one blocks the whole worker
+    from gevent import monkey
+    monkey.patch_all()
+
+# each worker also has PASSWORD_HASH_WORKERS hashing processes (and a forkserver), but no more
+# than PASSWORD_HASH_HOST_LIMIT hashes run at once across them: preloading shares that limit
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 8)) if worker_class == 'gthread' else 1
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 200))
+
+preload_app = True
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+# recycle workers now and then (slow leaks), not all at the same time
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    # the app is loaded (preload_app), workers are forked next
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        try:
+            from psycogreen.gevent import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            server.log.warning("psycogreen is not installed, database calls block the gevent workers")
+
+    from extensions import db, cache
+    app = server.app.wsgi()
+
+    with app.app_context():
+        # close=False: the parent's connections are left alone, this worker just forgets them
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+        backend = getattr(cache.cache, 'l2', cache.cache)
+        for client in {getattr(backend, '_write_client', None), getattr(backend, '_read_client', None)} - {None}:
+            client.connection_pool.reset()
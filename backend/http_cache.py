@@ -0,0 +1,141 @@
+"""
+HTTP validators and compression of the JSON responses.
+
+- strong ETags: a content hash computed once when a TMDB payload is cached (stored next to
+  it), version tokens for the ratings list (one per user, one for the movie details of
+  the catalog); a request whose If-None-Match matches is answered 304 before the body is built
+- gzip, or brotli when the package is installed, for bodies of at least COMPRESS_MIN_BYTES
+  when the client accepts it (Vary: Accept-Encoding)
+- strong ETags differ per representation: the tag sent, on a 200 as on a 304, is the content
+  tag with the negotiated representation as suffix (-msgpack, -br or -gzip), whether the
+  body is actually compressed or not (small bodies), so it is known before the body is built
+"""
+import gzip
+import hashlib
+import json
+import uuid
+from flask import request, jsonify, current_app
+from extensions import cache
+from json_provider import wants_msgpack
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/msgpack', 'text/plain', 'text/html', 'text/csv')
+
+
+def content_etag(payload):
+    """Hash of the canonical JSON of a payload"""
+    raw = json.dumps(payload, sort_keys=True, separators=(',', ':'), default=str).encode()
+    return hashlib.sha256(raw).hexdigest()[:32]
+
+
+def tagged(payload):
+    """Cache entry of a payload with its ETag"""
+    return {'etag': content_etag(payload), 'data': payload}
+
+
+def untag(entry):
+    """(etag, payload) of a tagged entry, or of a plain payload cached by an older worker"""
+    if isinstance(entry, dict) and entry.keys() == {'etag', 'data'}:
+        return entry['etag'], entry['data']
+    return content_etag(entry), entry
+
+
+def negotiated_encoding():
+    """Encoding a large enough body gets for this request, None when the client accepts none"""
+    return request.accept_encodings.best_match(['br', 'gzip'] if brotli else ['gzip'])
+
+
+def representation_etag(etag):
+    """Tag of the representation negotiated for this request, of the content tagged etag"""
+    if wants_msgpack():
+        etag = f"{etag}-msgpack"
+    encoding = negotiated_encoding()
+    if encoding:
+        etag = f"{etag}-{encoding}"
+    return etag
+
+
+def etag_matches(etag):
+    tags = request.if_none_match
+    return tags.star_tag or tags.contains(representation_etag(etag))
+
+
+def with_validator(response, etag, cache_control='no-cache'):
+    """Adds the ETag; no-cache: browsers keep the body but revalidate it on every use"""
+    response.set_etag(representation_etag(etag))
+    response.headers['Cache-Control'] = cache_control
+    response.vary.update(['Accept', 'Accept-Encoding'])
+    return response
+
+
+def not_modified(etag, cache_control='no-cache'):
+    """Same validator headers as the 200 of the same request"""
+    return with_validator(current_app.response_class(status=304), etag, cache_control)
+
+
+def conditional_json(etag, payload, cache_control='no-cache'):
+    """304 when the client has this version, the JSON body otherwise"""
+    if etag_matches(etag):
+        return not_modified(etag, cache_control)
+    return with_validator(jsonify(payload), etag, cache_control)
+
+
+def version(key):
+    """
+    Current version token stored under key. Random tokens rather than counters: if the
+    key is evicted, the next one can't collide with a version a client already has.
+    """
+    token = cache.get(key)
+    if token is None:
+        cache.add(key, uuid.uuid4().hex, timeout=0)
+        token = cache.get(key)
+    return token
+
+
+def bump_version(key):
+    """Called after the write is committed, a read before the commit can't get the new version"""
+    cache.set(key, uuid.uuid4().hex, timeout=0)
+
+
+def ratings_version_key(user_id):
+    return f"ratings:version:{user_id}"
+
+
+def ratings_version(user_id):
+    return version(ratings_version_key(user_id))
+
+
+def bump_ratings_version(user_id):
+    bump_version(ratings_version_key(user_id))
+
+
+def compress_response(response):
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+
+    data = response.get_data()
+    if len(data) < current_app.config['COMPRESS_MIN_BYTES']:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiated_encoding()
+    if encoding == 'br':
+        data = brotli.compress(data, quality=current_app.config['COMPRESS_BROTLI_QUALITY'])
+    elif encoding == 'gzip':
+        data = gzip.compress(data, compresslevel=current_app.config['COMPRESS_GZIP_LEVEL'])
+    else:
+        return response
+
+    # the ETag already names the encoding (see representation_etag)
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
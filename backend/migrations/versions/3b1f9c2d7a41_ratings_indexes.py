@@ -0,0 +1,79 @@
+"""Ratings indexes: unique (user_id, movie_id) and (user_id, created_at)
+
+Before this revision a user could have several ratings of the same movie. The unique
+index can't be built over them, so the upgrade DELETES the duplicates: the first rating
+(lowest id) of each (user, movie) pair is kept, the later ones are removed. The number of
+removed rows and the pairs they belonged to are logged. To choose which rating to keep,
+remove the duplicates by hand before upgrading; the upgrade then deletes nothing.
+
+Revision ID: 3b1f9c2d7a41
+Revises: fada42d32c84
+Create Date: 2026-10-18 10:12:31.482915
+
+"""
+import logging
+from alembic import op, context
+import sqlalchemy as sa
+
+log = logging.getLogger('alembic.runtime.migration')
+
+
+# revision identifiers, used by Alembic.
+revision = '3b1f9c2d7a41'
+down_revision = 'fada42d32c84'
+branch_labels = None
+depends_on = None
+
+
+DELETE_DUPLICATES = (
+    "DELETE FROM ratings WHERE id NOT IN "
+    "(SELECT MIN(id) FROM ratings GROUP BY user_id, movie_id)"
+)
+
+
+def remove_duplicates(bind):
+    """Deletes the duplicate ratings and logs what was removed"""
+    duplicates = bind.execute(sa.text(
+        "SELECT user_id, movie_id, COUNT(*) - 1 FROM ratings "
+        "GROUP BY user_id, movie_id HAVING COUNT(*) > 1 ORDER BY user_id, movie_id"
+    )).fetchall()
+    if not duplicates:
+        return
+
+    removed = bind.execute(sa.text(DELETE_DUPLICATES)).rowcount
+    pairs = ", ".join(f"user {user_id} movie {movie_id} (-{extra})" for user_id, movie_id, extra in duplicates[:100])
+    log.warning(
+        "Removed %d duplicate ratings of %d (user, movie) pairs, the first rating of each pair is kept: %s%s",
+        removed, len(duplicates), pairs, " ..." if len(duplicates) > 100 else ""
+    )
+
+
+def upgrade():
+    # a unique index can't be built over duplicates (possible before it existed):
+    # keep the first rating of each (user, movie) pair, see the module docstring
+    if context.is_offline_mode():
+        # --sql: nothing to count, the DELETE goes to the script
+        op.execute(DELETE_DUPLICATES)
+    else:
+        remove_duplicates(op.get_bind())
+
+    if op.get_bind().dialect.name == 'postgresql':
+        # build without locking writes on ratings; CONCURRENTLY can't run inside a transaction
+        with op.get_context().autocommit_block():
+            op.create_index('ix_ratings_user_id_movie_id', 'ratings', ['user_id', 'movie_id'],
+                            unique=True, postgresql_concurrently=True)
+            op.create_index('ix_ratings_user_id_created_at', 'ratings', ['user_id', 'created_at'],
+                            postgresql_concurrently=True)
+    else:
+        op.create_index('ix_ratings_user_id_movie_id', 'ratings', ['user_id', 'movie_id'], unique=True)
+        op.create_index('ix_ratings_user_id_created_at', 'ratings', ['user_id', 'created_at'])
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.drop_index('ix_ratings_user_id_created_at', table_name='ratings', postgresql_concurrently=True)
+            op.drop_index('ix_ratings_user_id_movie_id', table_name='ratings', postgresql_concurrently=True)
+    else:
+        op.drop_index('ix_ratings_user_id_created_at', table_name='ratings')
+        op.drop_index('ix_ratings_user_id_movie_id', table_name='ratings')
@@ -0,0 +1,63 @@
+"""Local movie catalog: TMDB search fields and full-text index on movies.title
+
+Revision ID: 5d7b3e9a2c18
+Revises: 8c4e2a6f1d93
+Create Date: 2026-10-18 16:21:07.913542
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d7b3e9a2c18'
+down_revision = '8c4e2a6f1d93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('movies', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('genre_ids', sa.JSON(), nullable=True))
+        batch_op.add_column(sa.Column('popularity', sa.Float(), nullable=True))
+
+    if op.get_bind().dialect.name == 'postgresql':
+        # build without locking writes on movies; CONCURRENTLY can't run inside a transaction
+        with op.get_context().autocommit_block():
+            op.execute(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_movies_title_fts "
+                "ON movies USING gin (to_tsvector('simple', title))"
+            )
+    elif op.get_bind().dialect.name == 'sqlite':
+        # external content FTS5 table, kept in sync with movies by triggers
+        op.execute("CREATE VIRTUAL TABLE movies_fts USING fts5(title, content='movies', content_rowid='id')")
+        op.execute(
+            "CREATE TRIGGER movies_fts_insert AFTER INSERT ON movies BEGIN "
+            "INSERT INTO movies_fts (rowid, title) VALUES (new.id, new.title); END"
+        )
+        op.execute(
+            "CREATE TRIGGER movies_fts_delete AFTER DELETE ON movies BEGIN "
+            "INSERT INTO movies_fts (movies_fts, rowid, title) VALUES ('delete', old.id, old.title); END"
+        )
+        op.execute(
+            "CREATE TRIGGER movies_fts_update AFTER UPDATE OF title ON movies BEGIN "
+            "INSERT INTO movies_fts (movies_fts, rowid, title) VALUES ('delete', old.id, old.title); "
+            "INSERT INTO movies_fts (rowid, title) VALUES (new.id, new.title); END"
+        )
+        # index the movies already stored
+        op.execute("INSERT INTO movies_fts (movies_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_movies_title_fts")
+    elif op.get_bind().dialect.name == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS movies_fts_update")
+        op.execute("DROP TRIGGER IF EXISTS movies_fts_delete")
+        op.execute("DROP TRIGGER IF EXISTS movies_fts_insert")
+        op.execute("DROP TABLE IF EXISTS movies_fts")
+
+    with op.batch_alter_table('movies', schema=None) as batch_op:
+        batch_op.drop_column('popularity')
+        batch_op.drop_column('genre_ids')
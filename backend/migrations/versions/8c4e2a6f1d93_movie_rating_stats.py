@@ -0,0 +1,50 @@
+"""movie_rating_stats: per-movie rating count, sum, histogram and last_rated_at
+
+Revision ID: 8c4e2a6f1d93
+Revises: 3b1f9c2d7a41
+Create Date: 2026-10-18 14:03:52.107334
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c4e2a6f1d93'
+down_revision = '3b1f9c2d7a41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('movie_rating_stats',
+        sa.Column('movie_id', sa.Integer(), nullable=False),
+        sa.Column('rating_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('score_sum', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('score_1', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('score_2', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('score_3', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('score_4', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('score_5', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('score_6', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('score_7', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('score_8', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('score_9', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('score_10', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('last_rated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['movie_id'], ['movies.id'], ),
+        sa.PrimaryKeyConstraint('movie_id')
+    )
+
+    # backfill from the existing ratings, same query as `flask stats rebuild`
+    op.execute(
+        "INSERT INTO movie_rating_stats (movie_id, rating_count, score_sum, "
+        + ", ".join(f"score_{score}" for score in range(1, 11))
+        + ", last_rated_at) SELECT movie_id, COUNT(id), SUM(score), "
+        + ", ".join(f"SUM(CASE WHEN score = {score} THEN 1 ELSE 0 END)" for score in range(1, 11))
+        + ", MAX(created_at) FROM ratings GROUP BY movie_id"
+    )
+
+
+def downgrade():
+    op.drop_table('movie_rating_stats')
@@ -0,0 +1,40 @@
+"""Movie metadata refresh: movies.refreshed_at
+
+Revision ID: c2a7d5e8f014
+Revises: 5d7b3e9a2c18
+Create Date: 2026-10-18 21:04:52.317406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2a7d5e8f014'
+down_revision = '5d7b3e9a2c18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # null for every existing row: all of them are stale until the refresh worker gets to them
+    with op.batch_alter_table('movies', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('refreshed_at', sa.DateTime(), nullable=True))
+
+    if op.get_bind().dialect.name == 'postgresql':
+        # build without locking writes on movies; CONCURRENTLY can't run inside a transaction
+        with op.get_context().autocommit_block():
+            op.create_index('ix_movies_refreshed_at', 'movies', ['refreshed_at'], postgresql_concurrently=True)
+    else:
+        op.create_index('ix_movies_refreshed_at', 'movies', ['refreshed_at'])
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.drop_index('ix_movies_refreshed_at', table_name='movies', postgresql_concurrently=True)
+    else:
+        op.drop_index('ix_movies_refreshed_at', table_name='movies')
+
+    with op.batch_alter_table('movies', schema=None) as batch_op:
+        batch_op.drop_column('refreshed_at')
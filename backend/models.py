@@ -1,5 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from sqlalchemy import DDL, event
 from werkzeug.security import generate_password_hash, check_password_hash
 from extensions import db
 
@@ -35,14 +36,48 @@ class Movie(db.Model):
     backdrop_path = db.Column(db.String(255))
     release_date = db.Column(db.DateTime)
     overview = db.Column(db.Text)
+    # TMDB search fields, filled when search results are mirrored into the local catalog
+    genre_ids = db.Column(db.JSON)
+    popularity = db.Column(db.Float)
+    # last time the metadata came from TMDB (null: as sent by the client that rated it), see movie_refresh.py
+    refreshed_at = db.Column(db.DateTime, index=True)
     
     ratings = db.relationship('Rating', backref='movie', lazy=True)
 
     def __repr__(self):
         return f'<Movie {self.title}>'
 
+# full-text index on movies.title for the local catalog search, not expressible as a portable Index:
+# an expression GIN index on Postgres, an external content FTS5 table kept in sync by triggers on SQLite
+# (created with the table by create_all, the migrations create the same objects)
+MOVIE_SEARCH_DDL = {
+    'postgresql': [
+        "CREATE INDEX IF NOT EXISTS ix_movies_title_fts ON movies USING gin (to_tsvector('simple', title))"
+    ],
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5(title, content='movies', content_rowid='id')",
+        "CREATE TRIGGER IF NOT EXISTS movies_fts_insert AFTER INSERT ON movies BEGIN "
+        "INSERT INTO movies_fts (rowid, title) VALUES (new.id, new.title); END",
+        "CREATE TRIGGER IF NOT EXISTS movies_fts_delete AFTER DELETE ON movies BEGIN "
+        "INSERT INTO movies_fts (movies_fts, rowid, title) VALUES ('delete', old.id, old.title); END",
+        "CREATE TRIGGER IF NOT EXISTS movies_fts_update AFTER UPDATE OF title ON movies BEGIN "
+        "INSERT INTO movies_fts (movies_fts, rowid, title) VALUES ('delete', old.id, old.title); "
+        "INSERT INTO movies_fts (rowid, title) VALUES (new.id, new.title); END"
+    ]
+}
+
+for dialect, statements in MOVIE_SEARCH_DDL.items():
+    for statement in statements:
+        event.listen(Movie.__table__, 'after_create', DDL(statement).execute_if(dialect=dialect))
+event.listen(Movie.__table__, 'after_drop', DDL("DROP TABLE IF EXISTS movies_fts").execute_if(dialect='sqlite'))
+
 class Rating(db.Model):
     __tablename__ = 'ratings'
+    # one rating per user and movie (also the lookup of every write), and the user's list in creation order
+    __table_args__ = (
+        db.Index('ix_ratings_user_id_movie_id', 'user_id', 'movie_id', unique=True),
+        db.Index('ix_ratings_user_id_created_at', 'user_id', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     score = db.Column(db.Integer, nullable=False)
@@ -53,4 +88,39 @@ class Rating(db.Model):
     movie_id = db.Column(db.Integer, db.ForeignKey('movies.id'), nullable=False)
 
     def __repr__(self):
-        return f'<Rating {self.score}>'
\ No newline at end of file
+        return f'<Rating {self.score}>'
+
+
+# scores with a histogram bucket in MovieRatingStats (other scores only count in count/sum)
+HISTOGRAM_SCORES = range(1, 11)
+
+class MovieRatingStats(db.Model):
+    __tablename__ = 'movie_rating_stats'
+
+    # community aggregates of a movie, updated in the same transaction as every rating write
+    movie_id = db.Column(db.Integer, db.ForeignKey('movies.id'), primary_key=True)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Integer, nullable=False, default=0)
+    # histogram: number of ratings per score
+    score_1 = db.Column(db.Integer, nullable=False, default=0)
+    score_2 = db.Column(db.Integer, nullable=False, default=0)
+    score_3 = db.Column(db.Integer, nullable=False, default=0)
+    score_4 = db.Column(db.Integer, nullable=False, default=0)
+    score_5 = db.Column(db.Integer, nullable=False, default=0)
+    score_6 = db.Column(db.Integer, nullable=False, default=0)
+    score_7 = db.Column(db.Integer, nullable=False, default=0)
+    score_8 = db.Column(db.Integer, nullable=False, default=0)
+    score_9 = db.Column(db.Integer, nullable=False, default=0)
+    score_10 = db.Column(db.Integer, nullable=False, default=0)
+    last_rated_at = db.Column(db.DateTime)
+
+    @property
+    def average(self):
+        return self.score_sum / self.rating_count if self.rating_count else None
+
+    @property
+    def histogram(self):
+        return {score: getattr(self, f'score_{score}') for score in HISTOGRAM_SCORES}
+
+    def __repr__(self):
+        return f'<MovieRatingStats {self.movie_id}: {self.rating_count}>'
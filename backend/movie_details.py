@@ -0,0 +1,142 @@
+"""
+Movie details from TMDB in a single call: /movie/<id>?append_to_response=credits,videos,similar.
+
+The answer is split into sub-resources cached on their own stale-while-revalidate keys
+(movie:<id>, cast:<id>, videos:<id>, similar:<id>): whichever of /movies/<id> and
+/cast/<id> comes first pays for the upstream call, the other one finds its part cached.
+"""
+import time
+from flask import current_app
+from extensions import cache, tmdb
+from caching import cached_with_refresh, schedule_refresh, store_entry
+
+# sub-resources of a movie, each cached under '<part>:<tmdb_id>'
+PARTS = ('movie', 'cast', 'videos', 'similar')
+
+
+def format_movie(item):
+    """Keeps only the fields of a TMDB search result used by the front end"""
+    poster_url = f"https://image.tmdb.org/t/p/w500{item.get('poster_path')}" if item.get('poster_path') else None
+
+    return {
+        "tmdb_id": item.get('id'),
+        "title": item.get('title'),
+        "poster_path": poster_url,
+        "overview": item.get('overview'),
+        "release_date": item.get('release_date'),
+        "backdrop_path": item.get('backdrop_path')
+    }
+
+
+def format_cast(data):
+    """Keeps only the cast fields used by the front end"""
+    formatted_cast = []
+    for member in data.get('cast', []):
+        formatted_cast.append({
+            "id": member.get('id'),
+            "name": member.get('name'),
+            "original_name": member.get('original_name'),
+            "character": member.get('character'),
+            "profile_path": f"https://image.tmdb.org/t/p/w200{member.get('profile_path')}" if member.get('profile_path') else None,
+            "order": member.get('order'),
+            "gender": member.get('gender'),
+            "known_for_department": member.get('known_for_department'),
+            "cast_id": member.get('cast_id'),
+            "credit_id": member.get('credit_id')
+        })
+    return formatted_cast
+
+
+def format_details(data):
+    """Search result fields plus what only the details have"""
+    return {
+        **format_movie(data),
+        "runtime": data.get('runtime'),
+        "genres": [{"id": genre.get('id'), "name": genre.get('name')} for genre in data.get('genres', [])],
+        "tagline": data.get('tagline'),
+        "vote_average": data.get('vote_average'),
+        "vote_count": data.get('vote_count')
+    }
+
+
+def format_video(video):
+    return {
+        "key": video.get('key'),
+        "name": video.get('name'),
+        "site": video.get('site'),
+        "type": video.get('type'),
+        "official": video.get('official')
+    }
+
+
+def split_movie(data):
+    """TMDB movie with its appended responses -> {part: formatted data}"""
+    return {
+        'movie': format_details(data),
+        'cast': format_cast(data.get('credits', {})),
+        'videos': [format_video(video) for video in data.get('videos', {}).get('results', [])],
+        'similar': [format_movie(item) for item in data.get('similar', {}).get('results', [])]
+    }
+
+
+def part_ttls(part):
+    """(soft TTL, TTL) of a part, the cast keeps its own"""
+    if part == 'cast':
+        return current_app.config['CAST_CACHE_SOFT_TTL'], current_app.config['CAST_CACHE_TTL']
+    return current_app.config['MOVIE_CACHE_SOFT_TTL'], current_app.config['MOVIE_CACHE_TTL']
+
+
+MOVIE_PARAMS = {
+    "language": "en-US",
+    "append_to_response": "credits,videos,similar"
+}
+
+
+def fetch_movie(tmdb_id):
+    return tmdb.get(f"/movie/{tmdb_id}", params=MOVIE_PARAMS, endpoint='movie')
+
+
+def load_movie_part(tmdb_id, part):
+    """Fetches the whole movie, stores every other part and returns this one (its caller stores it)"""
+    parts = split_movie(fetch_movie(tmdb_id))
+    store_parts(tmdb_id, parts, skip=part)
+    return parts[part]
+
+
+def store_parts(tmdb_id, parts, skip=None):
+    """Caches the parts of a movie as fresh entries, but skip (stored by the caller)"""
+    for name, data in parts.items():
+        if name != skip:
+            store_entry(f"{name}:{tmdb_id}", data, *part_ttls(name))
+
+
+def get_movie_parts(tmdb_id):
+    """
+    {part: data} of a movie, read in one cache multi-get. When parts are missing, loading the
+    first one fills the others (a single upstream call); when parts are stale, only the first
+    one is refreshed in the background, which refreshes them all.
+    """
+    keys = {part: f"{part}:{tmdb_id}" for part in PARTS}
+    entries = dict(zip(PARTS, cache.get_many(*keys.values())))
+    parts = {}
+
+    def loader(part):
+        return lambda: load_movie_part(tmdb_id, part)
+
+    missing = [part for part in PARTS if entries[part] is None]
+    if missing:
+        first = missing[0]
+        parts[first] = cached_with_refresh(keys[first], loader(first), *part_ttls(first))
+        # written by that load, unless they were evicted in between
+        rest = missing[1:]
+        for part, entry in zip(rest, cache.get_many(*(keys[part] for part in rest)) if rest else []):
+            parts[part] = entry['data'] if entry is not None else cached_with_refresh(keys[part], loader(part), *part_ttls(part))
+    else:
+        stale = [part for part in PARTS if entries[part]['fresh_until'] <= time.time()]
+        if stale:
+            schedule_refresh(keys[stale[0]], loader(stale[0]), *part_ttls(stale[0]))
+
+    for part in PARTS:
+        if part not in parts:
+            parts[part] = entries[part]['data']
+    return parts
@@ -0,0 +1,260 @@
+"""
+Refresh of the metadata of stored movies.
+
+Movies are stored with what the client sent when rating them (title, poster, overview),
+and search results only update the movies that show up in searches. This job re-reads
+from TMDB the stale ones: never refreshed, or longer ago than MOVIE_REFRESH_MAX_AGE_DAYS.
+
+- enqueue_stale puts their ids on a job queue: a Redis set when the cache is on Redis
+  (shared by every process, an id is queued once), a set of this process otherwise
+- drain pops MOVIE_REFRESH_BATCH_SIZE ids at a time, fetches them at MOVIE_REFRESH_RATE
+  TMDB calls per second at most (none while TMDB rate limits us) and writes each batch
+  with one bulk UPDATE
+- run_worker is the scheduler: it looks for stale movies every MOVIE_REFRESH_INTERVAL
+  seconds and works the queue in between
+
+    flask movies refresh    # queue the stale movies and work the queue until it is empty
+    flask movies worker     # the scheduler, as a long running process
+    flask movies status     # backlog, and throughput of the last batches
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+import requests
+from flask import current_app
+from sqlalchemy import select, update, func, or_
+from extensions import cache, tmdb
+from models import db, Movie
+from catalog import catalog_values, changes_rated_movies, CATALOG_VERSION_KEY
+from http_cache import bump_version
+from movie_details import format_movie
+
+QUEUE_KEY = 'movies:refresh:queue'
+STATS_KEY = 'movies:refresh:stats'
+SCAN_LOCK_KEY = 'movies:refresh:scan'
+
+
+class RedisQueue:
+    """Job queue shared by every process: a Redis set, so a queued id isn't queued twice"""
+
+    def __init__(self, client, key=QUEUE_KEY):
+        self.client = client
+        self.key = key
+
+    def push(self, ids):
+        """Queues ids, returns how many weren't queued yet"""
+        return self.client.sadd(self.key, *ids) if ids else 0
+
+    def pop(self, count):
+        return [int(movie_id) for movie_id in self.client.spop(self.key, count) or []]
+
+    def size(self):
+        return self.client.scard(self.key)
+
+    def clear(self):
+        self.client.delete(self.key)
+
+
+class LocalQueue:
+    """Same queue inside this process (no Redis: tests, development)"""
+
+    def __init__(self):
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def push(self, ids):
+        with self._lock:
+            new = [movie_id for movie_id in dict.fromkeys(ids) if movie_id not in self._ids]
+            self._ids.update(dict.fromkeys(new))
+            return len(new)
+
+    def pop(self, count):
+        with self._lock:
+            ids = list(self._ids)[:count]
+            for movie_id in ids:
+                del self._ids[movie_id]
+            return ids
+
+    def size(self):
+        with self._lock:
+            return len(self._ids)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+
+_local_queue = LocalQueue()
+
+
+def get_queue():
+    """The Redis queue when the cache is on Redis, the one of this process otherwise"""
+    backend = getattr(cache.cache, 'l2', cache.cache)
+    client = getattr(backend, '_write_client', None)
+    return RedisQueue(client) if client is not None else _local_queue
+
+
+class Pacer:
+    """Spaces calls evenly at rate per second, and holds them while the TMDB gateway has no budget"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_at = 0.0
+
+    def wait(self):
+        delay = self.next_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        while tmdb.budget() < 1:
+            time.sleep(0.25)
+        self.next_at = time.monotonic() + self.interval
+
+
+class RefreshStats:
+    """Counters of a run, published in the cache after every batch for flask movies status"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.batches = 0
+        self.refreshed = 0
+        self.not_found = 0
+        self.errors = 0
+
+    def add(self, counts):
+        self.batches += 1
+        self.refreshed += counts['refreshed']
+        self.not_found += counts['not_found']
+        self.errors += counts['errors']
+
+    def snapshot(self, backlog):
+        elapsed = time.monotonic() - self.started
+        return {
+            'batches': self.batches,
+            'refreshed': self.refreshed,
+            'not_found': self.not_found,
+            'errors': self.errors,
+            'elapsed_s': round(elapsed, 1),
+            'per_second': round((self.refreshed + self.not_found) / elapsed, 2) if elapsed else 0.0,
+            'backlog': backlog,
+            'updated_at': datetime.utcnow().isoformat(timespec='seconds')
+        }
+
+
+def describe(snapshot):
+    return (
+        f"{snapshot['refreshed']} refreshed, {snapshot['not_found']} not found on TMDB, {snapshot['errors']} errors "
+        f"in {snapshot['elapsed_s']}s ({snapshot['per_second']} movies/s), backlog {snapshot['backlog']}"
+    )
+
+
+def stale_condition():
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config['MOVIE_REFRESH_MAX_AGE_DAYS'])
+    return or_(Movie.refreshed_at.is_(None), Movie.refreshed_at < cutoff)
+
+
+def count_stale():
+    return db.session.scalar(select(func.count()).select_from(Movie).where(stale_condition()))
+
+
+def enqueue_stale(queue, limit=None):
+    """Queues the stale movies, never refreshed ones first then the oldest. Returns how many were new to the queue"""
+    limit = limit or current_app.config['MOVIE_REFRESH_SCAN_LIMIT']
+    ids = db.session.scalars(
+        select(Movie.id)
+        .where(stale_condition())
+        .order_by(Movie.refreshed_at.asc().nulls_first(), Movie.id)
+        .limit(limit)
+    ).all()
+    return queue.push(ids)
+
+
+def fetch_values(tmdb_id):
+    """movies columns from the TMDB details of a movie"""
+    data = tmdb.get(f"/movie/{tmdb_id}", params={"language": "en-US"}, endpoint='movie_refresh')
+    movie = format_movie(data)
+    if not movie['title']:
+        # nothing better than what we have
+        return {'refreshed_at': datetime.utcnow()}
+
+    values = catalog_values({
+        **movie,
+        'genre_ids': [genre.get('id') for genre in data.get('genres', [])],
+        'popularity': data.get('popularity')
+    })
+    del values['tmdb_id']
+    return values
+
+
+def refresh_batch(ids, pacer):
+    """Re-reads a batch of movies from TMDB and writes them with one bulk UPDATE. Returns its counters"""
+    counts = {'refreshed': 0, 'not_found': 0, 'errors': 0}
+    # refreshed since they were queued (search results): skipped
+    movies = db.session.execute(select(Movie.id, Movie.tmdb_id).where(Movie.id.in_(ids), stale_condition())).all()
+    rows = []
+
+    for movie_id, tmdb_id in movies:
+        pacer.wait()
+        try:
+            rows.append({'id': movie_id, **fetch_values(tmdb_id)})
+            counts['refreshed'] += 1
+        except requests.exceptions.RequestException as e:
+            if e.response is not None and e.response.status_code == 404:
+                # gone from TMDB: what we have is kept, and not asked for again before the max age
+                rows.append({'id': movie_id, 'refreshed_at': datetime.utcnow()})
+                counts['not_found'] += 1
+            else:
+                # still stale, the next scan queues it again
+                print(f"Error refreshing movie {tmdb_id}: {e}")
+                counts['errors'] += 1
+
+    if rows:
+        rated_changed = changes_rated_movies(rows, 'id')
+        # ORM bulk UPDATE by primary key: one executemany per set of columns
+        db.session.execute(update(Movie), rows)
+        db.session.commit()
+        if rated_changed:
+            bump_version(CATALOG_VERSION_KEY)
+    return counts
+
+
+def drain(queue, stats, log=print):
+    """Works the queue until it is empty, logs and publishes the counters after every batch"""
+    config = current_app.config
+    pacer = Pacer(config['MOVIE_REFRESH_RATE'])
+
+    while True:
+        ids = queue.pop(config['MOVIE_REFRESH_BATCH_SIZE'])
+        if not ids:
+            return stats
+        try:
+            stats.add(refresh_batch(ids, pacer))
+        except Exception:
+            db.session.rollback()
+            # back on the queue for the next run
+            queue.push(ids)
+            raise
+
+        snapshot = stats.snapshot(queue.size())
+        cache.set(STATS_KEY, snapshot, timeout=0)
+        log(describe(snapshot))
+
+
+def run_worker(interval=None, poll=5, log=print, should_stop=lambda: False):
+    """Scheduler: queues the stale movies every interval seconds (one process of all does it) and works the queue"""
+    interval = interval or current_app.config['MOVIE_REFRESH_INTERVAL']
+    queue = get_queue()
+    stats = RefreshStats()
+
+    while not should_stop():
+        if cache.add(SCAN_LOCK_KEY, 1, timeout=interval):
+            queued = enqueue_stale(queue)
+            log(f"Queued {queued} stale movies, backlog {queue.size()}")
+
+        try:
+            drain(queue, stats, log)
+        except Exception as e:
+            print(f"Error refreshing movies: {e}")
+        finally:
+            # long running process: don't keep a connection checked out between batches
+            db.session.remove()
+        time.sleep(poll)
@@ -0,0 +1,184 @@
+import multiprocessing
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+# a worker has threads (request threads, cache listeners) that may hold locks when the pool
+# starts: its processes are forked from a clean single-threaded server instead of the worker
+# (started afresh where there is no forkserver)
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# seconds a pool process waits for a host slot before the request gets a 503
+HOST_SLOT_TIMEOUT = 5
+
+# slots of the host, in a pool process (set by its initializer)
+_host_slots = None
+_host_wait = HOST_SLOT_TIMEOUT
+
+
+class HasherBusy(Exception):
+    """Too many password hashes queued, the request should be retried later"""
+
+
+def _init_pool_process(slots, wait):
+    global _host_slots, _host_wait
+    _host_slots, _host_wait = slots, wait
+
+
+def _run_in_host_slot(function, *args):
+    """Runs in a pool process: function once one of the hash slots of the host is free"""
+    if _host_slots is None:
+        return function(*args)
+    if not _host_slots.acquire(timeout=_host_wait):
+        raise HasherBusy()
+    try:
+        return function(*args)
+    finally:
+        _host_slots.release()
+
+
+def normalize_method(method):
+    """werkzeug method string with its default parameters filled in, as stored in hashes"""
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        n, r, p = args or (2 ** 15, 8, 1)
+        return f"scrypt:{n}:{r}:{p}"
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = args[1] if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    return method
+
+
+class PasswordHasher:
+    """
+    Password hashing off the request threads, on a pool of PASSWORD_HASH_WORKERS processes
+    per worker, at most PASSWORD_HASH_MAX_PENDING hashes queued or running per worker (beyond
+    that HasherBusy is raised, 503 for the client). PASSWORD_HASH_HOST_LIMIT bounds the
+    hashes running at once across the workers: its semaphore is made when the app is
+    configured, so the workers forked from a preloading master (gunicorn.conf.py) share it,
+    other servers get one per process. PASSWORD_HASH_WORKERS = 0 hashes in the calling thread
+    (tests, scripts).
+    """
+
+    extension_name = 'hasher'
+
+    def __init__(self, app=None):
+        self.method = DEFAULT_METHOD
+        self.workers = 1
+        self.max_pending = 16
+        self.host_limit = None
+        self.host_wait = HOST_SLOT_TIMEOUT
+
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._host_slots = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = normalize_method(app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD))
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.max_pending = app.config.get('PASSWORD_HASH_MAX_PENDING', self.max_pending)
+        self.host_limit = app.config.get('PASSWORD_HASH_HOST_LIMIT')
+
+        self.close()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        # made before the workers fork, shared by them and handed to their pool processes
+        self._host_slots = None
+        if self.workers and self.host_limit:
+            self._host_slots = multiprocessing.get_context(START_METHOD).BoundedSemaphore(self.host_limit)
+        app.extensions[self.extension_name] = self
+
+    @property
+    def executor(self):
+        """Pool of the current process (a forked worker starts its own)"""
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    context = multiprocessing.get_context(START_METHOD)
+                    if START_METHOD == 'forkserver':
+                        # hashing module loaded once in the server, not in every pool process
+                        context.set_forkserver_preload(['werkzeug.security'])
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=context,
+                        initializer=_init_pool_process, initargs=(self._host_slots, self.host_wait)
+                    )
+                    self._pid = os.getpid()
+        return self._executor
+
+    def close(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._pid = None
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when the hash was made with other parameters than the configured ones"""
+        return password_hash.split('$', 1)[0] != self.method
+
+    def _run(self, function, *args):
+        if not self.workers:
+            return function(*args)
+
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            return self.executor.submit(_run_in_host_slot, function, *args).result()
+        except BrokenProcessPool:
+            # a pool process died (OOM killer...), the next call starts a new pool
+            self.close()
+            raise HasherBusy()
+        finally:
+            self._slots.release()
+
+
+def time_method(method, rounds=3):
+    """Median time (seconds) of one hash with method"""
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        generate_password_hash('calibration-password', method)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def calibrate(target, algorithm='scrypt'):
+    """
+    Most expensive parameters whose hash takes at most target seconds on this machine,
+    with the measured timings: scrypt doubles N (r=8, p=1, up to 128 MiB per hash),
+    pbkdf2 scales the iterations of a measured run.
+    """
+    if algorithm == 'pbkdf2':
+        sample = 100_000
+        elapsed = time_method(f"pbkdf2:sha256:{sample}")
+        iterations = max(10_000, int(sample * target / elapsed) // 10_000 * 10_000)
+        method = f"pbkdf2:sha256:{iterations}"
+        return method, [(method, time_method(method))]
+
+    timings = []
+    method = 'scrypt:16384:8:1'
+    for exponent in range(14, 18):
+        candidate = f"scrypt:{2 ** exponent}:8:1"
+        elapsed = time_method(candidate)
+        timings.append((candidate, elapsed))
+        if elapsed > target:
+            break
+        method = candidate
+    return method, timings
@@ -0,0 +1,56 @@
+"""
+Per-request SQL statement counter with a budget.
+
+Every statement sent while handling a request is counted; when a route runs more than
+its budget (SQL_QUERY_BUDGET, or the one given with @query_budget) it is logged, or
+raised as QueryBudgetExceeded when SQL_QUERY_BUDGET_STRICT is on (tests), so an N+1
+shows up as soon as it is written.
+"""
+from flask import g, request, current_app, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(statements):
+    """Budget of a route, None for routes whose statements grow with the input (imports)"""
+    def decorator(view):
+        view.query_budget = statements
+        return view
+    return decorator
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    # background work (catalog mirror, refreshes) has no request
+    if has_request_context():
+        g.sql_statements = g.get('sql_statements', 0) + 1
+        if current_app.config['SQL_QUERY_BUDGET_STRICT']:
+            g.setdefault('sql_log', []).append(statement)
+
+
+def reset_counter():
+    g.sql_statements = 0
+    g.sql_log = []
+
+
+def check_budget(response):
+    count = g.get('sql_statements', 0)
+    statements = g.get('sql_log', [])
+    view = current_app.view_functions.get(request.endpoint)
+    budget = getattr(view, 'query_budget', current_app.config['SQL_QUERY_BUDGET'])
+
+    if budget is not None and count > budget:
+        message = f"{request.method} {request.path} ran {count} SQL statements (budget {budget})"
+        if current_app.config['SQL_QUERY_BUDGET_STRICT']:
+            raise QueryBudgetExceeded(message + ':\n' + '\n'.join(statements))
+        print(f"Warning: {message}")
+    return response
+
+
+def init_app(app):
+    app.before_request(reset_counter)
+    app.after_request(check_budget)
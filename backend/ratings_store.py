@@ -0,0 +1,432 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from sqlalchemy import select, text, insert, update, delete, func, case
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Movie, Rating, MovieRatingStats, HISTOGRAM_SCORES
+
+# columns of an uploaded CSV (the movie ones are only needed for movies not stored yet)
+CSV_COLUMNS = ['tmdb_id', 'score', 'title', 'release_date', 'poster_path', 'backdrop_path', 'overview']
+
+# rows per multi-row INSERT, keeps the bound parameters under the SQLite limit
+INSERT_CHUNK = 500
+
+# movie_rating_stats columns that are summed up (count, sum and the histogram buckets)
+STATS_COUNTERS = ['rating_count', 'score_sum'] + [f'score_{score}' for score in HISTOGRAM_SCORES]
+
+
+def upsert_insert(model):
+    """INSERT with ON CONFLICT support on Postgres and SQLite, None on other databases"""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(model)
+    if dialect == 'sqlite':
+        return sqlite.insert(model)
+    return None
+
+
+# size of the movies varchar columns (title, poster_path, backdrop_path)
+MAX_COLUMN_LENGTH = 255
+
+
+def movie_values(tmdb_id, movie_data, release_date):
+    return {
+        'tmdb_id': tmdb_id,
+        'title': (movie_data.get('title') or 'Unknown Title')[:MAX_COLUMN_LENGTH],
+        'poster_path': movie_data.get('poster_path'),
+        'backdrop_path': movie_data.get('backdrop_path'),
+        'overview': movie_data.get('overview'),
+        'release_date': release_date
+    }
+
+
+SCORE_ERROR = f'Score must be an integer from {HISTOGRAM_SCORES[0]} to {HISTOGRAM_SCORES[-1]}'
+
+
+def valid_score(score):
+    """Scores are whole numbers of the histogram range, the stats count them by bucket"""
+    return isinstance(score, int) and not isinstance(score, bool) and score in HISTOGRAM_SCORES
+
+
+def histogram_column(score):
+    return f'score_{score}' if score in HISTOGRAM_SCORES else None
+
+
+def stats_rows(ratings, rated_at):
+    """Aggregates (movie_id, score) pairs into one movie_rating_stats row per movie"""
+    rows = {}
+    for movie_id, score in ratings:
+        row = rows.get(movie_id)
+        if row is None:
+            row = rows[movie_id] = {'movie_id': movie_id, 'last_rated_at': rated_at, **dict.fromkeys(STATS_COUNTERS, 0)}
+        row['rating_count'] += 1
+        row['score_sum'] += score
+        column = histogram_column(score)
+        if column:
+            row[column] += 1
+    return list(rows.values())
+
+
+def add_rating_stats(ratings, rated_at):
+    """
+    Adds new ratings ((movie_id, score) pairs) to the per-movie aggregates, in the caller's
+    transaction: INSERT ... ON CONFLICT DO UPDATE adding to the stored counters.
+    """
+    rows = stats_rows(ratings, rated_at)
+    if not rows:
+        return
+    if upsert_insert(MovieRatingStats) is None:
+        return add_rating_stats_portable(rows)
+
+    # one statement compiled once and executed for every row (batched by the driver)
+    stmt = upsert_insert(MovieRatingStats)
+    set_ = {column: getattr(MovieRatingStats, column) + stmt.excluded[column] for column in STATS_COUNTERS}
+    set_['last_rated_at'] = stmt.excluded.last_rated_at
+    db.session.execute(stmt.on_conflict_do_update(index_elements=['movie_id'], set_=set_), rows)
+
+
+def stats_upsert_sql(source):
+    """
+    SQL adding the ratings of a (movie_id, score) relation to the stats in one
+    INSERT ... SELECT ... GROUP BY ... ON CONFLICT DO UPDATE (last_rated_at is :now)
+    """
+    buckets = ', '.join(f"SUM(CASE WHEN score = {score} THEN 1 ELSE 0 END)" for score in HISTOGRAM_SCORES)
+    increments = ', '.join(f"{column} = movie_rating_stats.{column} + excluded.{column}" for column in STATS_COUNTERS)
+    return (
+        f"INSERT INTO movie_rating_stats (movie_id, {', '.join(STATS_COUNTERS)}, last_rated_at)"
+        f" SELECT movie_id, COUNT(*), SUM(score), {buckets}, :now FROM {source} GROUP BY movie_id"
+        f" ON CONFLICT (movie_id) DO UPDATE SET {increments}, last_rated_at = excluded.last_rated_at"
+    )
+
+
+def add_rating_stats_portable(rows):
+    """ORM version of add_rating_stats for databases without ON CONFLICT"""
+    for row in rows:
+        stats = db.session.get(MovieRatingStats, row['movie_id'])
+        if stats is None:
+            db.session.add(MovieRatingStats(**row))
+            continue
+        for column in STATS_COUNTERS:
+            setattr(stats, column, getattr(stats, column) + row[column])
+        stats.last_rated_at = row['last_rated_at']
+    db.session.flush()
+
+
+def change_rating_stats(movie_id, old_score, new_score):
+    """Moves one rating of a movie from old_score to new_score in its aggregates"""
+    if old_score == new_score:
+        return
+
+    values = {'score_sum': MovieRatingStats.score_sum + new_score - old_score}
+    old_column, new_column = histogram_column(old_score), histogram_column(new_score)
+    if old_column:
+        values[old_column] = getattr(MovieRatingStats, old_column) - 1
+    if new_column:
+        values[new_column] = getattr(MovieRatingStats, new_column) + 1
+
+    db.session.execute(
+        update(MovieRatingStats).where(MovieRatingStats.movie_id == movie_id).values(values)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def remove_rating_stats(movie_id, score):
+    """Takes one deleted rating out of the aggregates of its movie"""
+    values = {
+        'rating_count': MovieRatingStats.rating_count - 1,
+        'score_sum': MovieRatingStats.score_sum - score
+    }
+    column = histogram_column(score)
+    if column:
+        values[column] = getattr(MovieRatingStats, column) - 1
+
+    db.session.execute(
+        update(MovieRatingStats).where(MovieRatingStats.movie_id == movie_id).values(values)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def rebuild_rating_stats():
+    """
+    Recomputes the aggregates of every movie from ratings with one INSERT ... SELECT ... GROUP BY
+    (for drift repair and backfills). Returns the number of movies with stats.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        # rating writes wait until the rebuild commits, so none is counted twice or lost
+        db.session.execute(text("LOCK TABLE movie_rating_stats IN EXCLUSIVE MODE"))
+
+    aggregates = select(
+        Rating.movie_id,
+        func.count(Rating.id),
+        func.sum(Rating.score),
+        *[func.sum(case((Rating.score == score, 1), else_=0)) for score in HISTOGRAM_SCORES],
+        func.max(Rating.created_at)
+    ).group_by(Rating.movie_id)
+
+    db.session.execute(delete(MovieRatingStats))
+    result = db.session.execute(
+        insert(MovieRatingStats).from_select(['movie_id'] + STATS_COUNTERS + ['last_rated_at'], aggregates)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def parse_csv_rows(content):
+    """Rows of an uploaded CSV as dicts, movie fields flat like CSV_COLUMNS"""
+    return list(csv.DictReader(io.StringIO(content)))
+
+
+def normalize_row(raw):
+    """
+    Validates one import row: either the POST /reviews/ratings payload
+    ({tmdb_id, score, movie_data}) or a flat row with the movie fields next to the score.
+    Raises ValueError with the message of the row result.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError('Row must be an object')
+
+    try:
+        tmdb_id = int(raw.get('tmdb_id'))
+    except (TypeError, ValueError):
+        raise ValueError('Missing or invalid tmdb_id or score')
+
+    score = raw.get('score')
+    if score is None:
+        raise ValueError('Missing or invalid tmdb_id or score')
+    # CSV fields are strings
+    if isinstance(score, str) and score.strip().isdigit():
+        score = int(score)
+    if not valid_score(score):
+        raise ValueError(SCORE_ERROR)
+
+    movie_data = raw.get('movie_data')
+    if movie_data is None and raw.get('title'):
+        movie_data = {column: raw.get(column) or None for column in CSV_COLUMNS[2:]}
+
+    movie = None
+    if movie_data:
+        release_date = None
+        if movie_data.get('release_date'):
+            try:
+                release_date = datetime.strptime(movie_data['release_date'], '%Y-%m-%d')
+            except (TypeError, ValueError):
+                raise ValueError('Release date is not in the default pattern.')
+        # a cut URL is no URL: refused here rather than failing the whole batch in the database
+        for column in ('poster_path', 'backdrop_path'):
+            if len(movie_data.get(column) or '') > MAX_COLUMN_LENGTH:
+                raise ValueError(f'{column} is longer than {MAX_COLUMN_LENGTH} characters')
+        movie = movie_values(tmdb_id, movie_data, release_date)
+
+    return {'tmdb_id': tmdb_id, 'score': score, 'movie': movie}
+
+
+def import_ratings(user_id, raw_rows, batch_size):
+    """
+    Imports ratings for a user with set-based statements, batch_size rows per transaction.
+    Missing movies are created from the row data, existing ratings are left untouched.
+    Returns a summary with one result per input row.
+    """
+    results = []
+    valid = []
+    seen = set()
+
+    for index, raw in enumerate(raw_rows, start=1):
+        result = {'row': index, 'tmdb_id': raw.get('tmdb_id') if isinstance(raw, dict) else None}
+        results.append(result)
+        try:
+            row = normalize_row(raw)
+        except ValueError as e:
+            result.update(status='error', error=str(e))
+            continue
+
+        result['tmdb_id'] = row['tmdb_id']
+        if row['tmdb_id'] in seen:
+            result.update(status='error', error='Duplicate tmdb_id in import')
+            continue
+        seen.add(row['tmdb_id'])
+        valid.append((result, row))
+
+    for start in range(0, len(valid), batch_size):
+        batch = valid[start:start + batch_size]
+        created, known = import_batch(user_id, [row for _, row in batch])
+        db.session.commit()
+
+        for result, row in batch:
+            if row['tmdb_id'] in created:
+                result['status'] = 'created'
+            elif row['tmdb_id'] in known:
+                result['status'] = 'exists'
+            else:
+                result.update(status='error', error='Movie not found locally and no data provided to create it')
+
+    summary = {'created': 0, 'exists': 0, 'error': 0}
+    for result in results:
+        summary[result['status']] += 1
+
+    return {**summary, 'results': results}
+
+
+def import_batch(user_id, rows):
+    """Returns the tmdb ids whose rating was created and the tmdb ids of the movies found"""
+    now = datetime.utcnow()
+    connection = db.session.connection()
+
+    # COPY goes through psycopg2's copy_expert
+    if connection.dialect.name == 'postgresql' and connection.dialect.driver == 'psycopg2':
+        return copy_batch(connection, user_id, rows, now)
+    return multirow_batch(user_id, rows, now)
+
+
+def copy_batch(connection, user_id, rows, now):
+    """Postgres: COPY the batch into a temp table, then two INSERT ... SELECT ... ON CONFLICT and the stats upsert"""
+    connection.execute(text(
+        "CREATE TEMP TABLE bulk_ratings ("
+        "tmdb_id integer, score integer, title varchar(255), poster_path varchar(255), "
+        "backdrop_path varchar(255), overview text, release_date timestamp"
+        ") ON COMMIT DROP"
+    ))
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        movie = row['movie'] or {}
+        # empty unquoted CSV fields are NULL for COPY
+        writer.writerow([
+            row['tmdb_id'], row['score'], movie.get('title'), movie.get('poster_path'),
+            movie.get('backdrop_path'), movie.get('overview'), movie.get('release_date')
+        ])
+    buffer.seek(0)
+
+    cursor = connection.connection.cursor()
+    cursor.copy_expert(
+        "COPY bulk_ratings (tmdb_id, score, title, poster_path, backdrop_path, overview, release_date) "
+        "FROM STDIN WITH (FORMAT csv)",
+        buffer
+    )
+
+    connection.execute(text(
+        "INSERT INTO movies (tmdb_id, title, poster_path, backdrop_path, overview, release_date) "
+        "SELECT tmdb_id, title, poster_path, backdrop_path, overview, release_date "
+        "FROM bulk_ratings WHERE title IS NOT NULL "
+        "ON CONFLICT (tmdb_id) DO NOTHING"
+    ))
+
+    created = connection.execute(text(
+        "WITH inserted AS ("
+        " INSERT INTO ratings (user_id, movie_id, score, created_at)"
+        " SELECT :user_id, m.id, b.score, :now FROM bulk_ratings b JOIN movies m ON m.tmdb_id = b.tmdb_id"
+        " ON CONFLICT (user_id, movie_id) DO NOTHING"
+        " RETURNING movie_id, score"
+        "), stats AS (" + stats_upsert_sql('inserted') + ")"
+        " SELECT m.tmdb_id FROM inserted JOIN movies m ON m.id = inserted.movie_id"
+    ), {'user_id': user_id, 'now': now}).scalars().all()
+
+    known = connection.execute(text(
+        "SELECT m.tmdb_id FROM bulk_ratings b JOIN movies m ON m.tmdb_id = b.tmdb_id"
+    )).scalars().all()
+
+    return set(created), set(known)
+
+
+def multirow_batch(user_id, rows, now):
+    """SQLite (and tests): multi-row INSERT ... ON CONFLICT statements"""
+    movies = [row['movie'] for row in rows if row['movie']]
+    for start in range(0, len(movies), INSERT_CHUNK):
+        db.session.execute(
+            upsert_insert(Movie).values(movies[start:start + INSERT_CHUNK])
+            .on_conflict_do_nothing(index_elements=['tmdb_id'])
+        )
+
+    movie_ids = {}
+    tmdb_ids = [row['tmdb_id'] for row in rows]
+    for start in range(0, len(tmdb_ids), INSERT_CHUNK):
+        chunk = tmdb_ids[start:start + INSERT_CHUNK]
+        movie_ids.update(db.session.execute(
+            select(Movie.tmdb_id, Movie.id).where(Movie.tmdb_id.in_(chunk))
+        ).all())
+
+    ratings = [
+        {'user_id': user_id, 'movie_id': movie_ids[row['tmdb_id']], 'score': row['score'], 'created_at': now}
+        for row in rows if row['tmdb_id'] in movie_ids
+    ]
+    inserted = []
+    for start in range(0, len(ratings), INSERT_CHUNK):
+        inserted.extend(db.session.execute(
+            upsert_insert(Rating).values(ratings[start:start + INSERT_CHUNK])
+            .on_conflict_do_nothing(index_elements=['user_id', 'movie_id'])
+            .returning(Rating.movie_id, Rating.score)
+        ).all())
+    add_rating_stats(inserted, now)
+
+    created_movie_ids = {movie_id for movie_id, _ in inserted}
+
+    created = {tmdb_id for tmdb_id, movie_id in movie_ids.items() if movie_id in created_movie_ids}
+    return created, set(movie_ids)
+
+
+# export rows = import columns + rating date, so an export can be imported back
+EXPORT_COLUMNS = CSV_COLUMNS + ['rated_at']
+
+
+def iter_user_ratings(user_id, batch_size):
+    """
+    Streams a user's ratings (export columns only) in (created_at, id) order through a
+    server-side cursor: one batch of rows in memory at a time, whatever the library size.
+    """
+    query = select(
+        Movie.tmdb_id,
+        Rating.score,
+        Movie.title,
+        Movie.release_date,
+        Movie.poster_path,
+        Movie.backdrop_path,
+        Movie.overview,
+        Rating.created_at.label('rated_at')
+    ).join(Movie, Rating.movie_id == Movie.id).where(Rating.user_id == user_id) \
+        .order_by(Rating.created_at, Rating.id).execution_options(yield_per=batch_size)
+
+    for partition in db.session.execute(query).partitions():
+        yield partition
+
+
+def export_value(column, value):
+    if value is None:
+        return None
+    if column == 'release_date':
+        return value.strftime('%Y-%m-%d')
+    if column == 'rated_at':
+        return value.isoformat()
+    return value
+
+
+def export_chunks(partitions, fmt):
+    """Encodes each batch of rows as one chunk of NDJSON lines or CSV rows"""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        yield buffer.getvalue()
+
+    for rows in partitions:
+        if fmt == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerows([export_value(c, v) for c, v in zip(EXPORT_COLUMNS, row)] for row in rows)
+            yield buffer.getvalue()
+        else:
+            yield ''.join(
+                json.dumps({c: export_value(c, v) for c, v in zip(EXPORT_COLUMNS, row)}) + '\n'
+                for row in rows
+            )
+
+
+def gzip_chunks(chunks):
+    """Compresses a stream of text chunks on the fly (gzip container)"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
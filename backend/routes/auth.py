@@ -1,6 +1,9 @@
 from flask import Blueprint, jsonify, request
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import create_access_token, jwt_required, current_user
+from extensions import hasher
+from passwords import HasherBusy
 from models import db, User
+from user_lookup import remember_user
 
 # /auth/...
 auth_bp = Blueprint('auth', __name__)
@@ -17,11 +20,15 @@ def register():
     if User.query.filter_by(email=email).first():
         return jsonify({"msg": "User already exists"}), 400
 
-    new_user = User(email=email)
-    new_user.set_password(password)
+    # hashed on the password pool, 503 when it is saturated
+    try:
+        new_user = User(email=email, password_hash=hasher.hash(password))
+    except HasherBusy:
+        return hasher_busy()
 
     db.session.add(new_user)
     db.session.commit()
+    remember_user(new_user)
 
     return jsonify({"msg": "User created successfully"}), 201
 
@@ -33,19 +40,41 @@ def login():
 
     user = User.query.filter_by(email=email).first()
 
-    if user and user.check_password(password):
+    try:
+        valid = user is not None and hasher.verify(user.password_hash, password)
+    except HasherBusy:
+        return hasher_busy()
+
+    if valid:
+        rehash(user, password)
+        # the next authenticated requests find it in the cache
+        remember_user(user)
         access_token = create_access_token(identity=str(user.id))
         return jsonify(access_token=access_token), 200
 
     return jsonify({"msg": "Bad email or password"}), 401
 
+
+def rehash(user, password):
+    """Upgrades a hash made with older parameters, the password is only known at login"""
+    if not hasher.needs_rehash(user.password_hash):
+        return
+    try:
+        user.password_hash = hasher.hash(password)
+        db.session.commit()
+    except HasherBusy:
+        # the next login will do it
+        pass
+
+
+def hasher_busy():
+    response = jsonify({"msg": "Too many logins, try again in a moment"})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+# the user comes from the JWT user loader (cached record, see user_lookup.py),
+# a valid token of a deleted user gets a 404
 @auth_bp.route('/protected', methods=['GET'])
 @jwt_required()
 def protected():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(int(current_user_id))
-    
-    if not user:
-        return jsonify({"msg": "User not found"}), 404
-        
-    return jsonify(logged_in_as=user.email), 200
\ No newline at end of file
+    return jsonify(logged_in_as=current_user.email), 200
\ No newline at end of file
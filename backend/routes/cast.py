@@ -1,48 +1,98 @@
 # routes/cast.py
-import os
 import requests
-from flask import Blueprint, request, jsonify
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, request, jsonify, current_app
+from caching import cached_with_refresh, cached_many_with_refresh
+from movie_details import load_movie_part
 
 cast_bp = Blueprint('cast', __name__)
 
-TMDB_API_KEY = os.environ.get('TMDB_API_KEY')
-TMDB_BASE_URL = os.environ.get('TMDB_BASE_URL')
+# cast lists missing from the cache in a batch are fetched in parallel (fewer threads than TMDB pool connections)
+batch_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='cast-fetch')
 
+
+def fetch_cast(movie_id):
+    # the details call brings the cast along, and caches the rest of the movie for /movies/<id>
+    return load_movie_part(movie_id, 'cast')
+
+
+def top_billed(cast, limit):
+    """The first limit members by billing order (members without one go last)"""
+    return sorted(cast, key=lambda member: (member['order'] is None, member['order'] or 0))[:limit]
+
+
+def parse_ids(value):
+    """'1,2,3' -> [1, 2, 3] without duplicates, None when an id is not a positive integer"""
+    ids = []
+    for part in value.split(','):
+        part = part.strip()
+        if not part.isdigit() or int(part) <= 0:
+            return None
+        if int(part) not in ids:
+            ids.append(int(part))
+    return ids
+
+
+# several movies at once (/cast?ids=1,2,3&limit=10): one cache multi-get, the misses fetched concurrently
+# {id: cast}, null for a movie unknown to TMDB, {'error'} for one that failed (502 when they all failed)
+@cast_bp.route('', methods=['GET'])
+def get_casts():
+    ids = parse_ids(request.args.get('ids', ''))
+    if not ids:
+        return jsonify({'error': 'ids must be a comma separated list of movie ids'}), 400
+
+    max_ids = current_app.config['CAST_BATCH_MAX_IDS']
+    if len(ids) > max_ids:
+        return jsonify({'error': f'At most {max_ids} ids per request'}), 400
+
+    limit = request.args.get('limit', type=int)
+    if 'limit' in request.args and (limit is None or limit < 1):
+        return jsonify({'error': 'limit must be a positive integer'}), 400
+
+    casts, errors = cached_many_with_refresh(
+        {f"cast:{movie_id}": (lambda movie_id=movie_id: fetch_cast(movie_id)) for movie_id in ids},
+        soft_ttl=current_app.config['CAST_CACHE_SOFT_TTL'],
+        ttl=current_app.config['CAST_CACHE_TTL'],
+        executor=batch_executor
+    )
+
+    result = {}
+    failed = 0
+    for movie_id in ids:
+        key = f"cast:{movie_id}"
+        error = errors.get(key)
+        if error is not None and not isinstance(error, requests.exceptions.RequestException):
+            raise error
+        if error is None:
+            result[str(movie_id)] = top_billed(casts[key], limit) if limit else casts[key]
+        elif getattr(error, 'response', None) is not None and error.response.status_code == 404:
+            # unknown movie: no cast rather than failing the whole batch
+            result[str(movie_id)] = None
+        else:
+            # the casts that loaded are still returned, this one can be asked again
+            print(f"Error calling TMDB Credits API: {error}")
+            result[str(movie_id)] = {'error': 'Failed to fetch cast from TMDB'}
+            failed += 1
+
+    if failed == len(ids):
+        return jsonify({'error': 'Failed to fetch cast from TMDB'}), 502
+    return jsonify(result), 200
+
+
+# formatted cast is cached per movie, stale entries are served while refreshed in background
 @cast_bp.route('/<int:movie_id>', methods=['GET'])
 def get_movie_cast(movie_id):
-    headers = {
-        "accept": "application/json",
-        "Authorization": f"Bearer {TMDB_API_KEY}"
-    }
-    
-    params = {
-        "language": "en-US"
-    }
-
     try:
-        response = requests.get(f"{TMDB_BASE_URL}/movie/{movie_id}/credits", headers=headers, params=params)
-        response.raise_for_status()
-        data = response.json()
-        
-        formatted_cast = []
-        for member in data.get('cast', []):
-            formatted_cast.append({
-                "id": member.get('id'),
-                "name": member.get('name'),
-                "original_name": member.get('original_name'),
-                "character": member.get('character'),
-                "profile_path": f"https://image.tmdb.org/t/p/w200{member.get('profile_path')}" if member.get('profile_path') else None,
-                "order": member.get('order'),
-                "gender": member.get('gender'),
-                "known_for_department": member.get('known_for_department'),
-                "cast_id": member.get('cast_id'),
-                "credit_id": member.get('credit_id')
-            })
-            
+        formatted_cast = cached_with_refresh(
+            f"cast:{movie_id}",
+            lambda: fetch_cast(movie_id),
+            soft_ttl=current_app.config['CAST_CACHE_SOFT_TTL'],
+            ttl=current_app.config['CAST_CACHE_TTL']
+        )
         return jsonify(formatted_cast), 200
 
     except requests.exceptions.RequestException as e:
         print(f"Error calling TMDB Credits API: {e}")
         if e.response is not None:
              return jsonify(e.response.json()), e.response.status_code
-        return jsonify({'error': 'Failed to fetch cast from TMDB'}), 502
\ No newline at end of file
+        return jsonify({'error': 'Failed to fetch cast from TMDB'}), 502
@@ -1,31 +1,32 @@
-import os
 import requests
-from flask import Blueprint, request, jsonify
-from extensions import cache
+from flask import Blueprint, jsonify
+from extensions import tmdb
+from singleflight import cached_single_flight
+from http_cache import tagged, untag, conditional_json
 
 genres_bp = Blueprint('genres', __name__)
 
-TMDB_API_KEY = os.environ.get('TMDB_API_KEY')
-TMDB_BASE_URL = os.environ.get('TMDB_BASE_URL')
+GENRES_PARAMS = {
+    "language": "en-US"
+}
+
+
+def genres_view(data):
+    """Cache entry of the TMDB genre list: the genres with their ETag"""
+    return tagged(data.get('genres', []))
+
 
 # Gets the list of genres, used list in front end selection inputs
+# 24h cache, concurrent misses make a single TMDB call
+# cached with its content hash: ETag, 304 on a matching If-None-Match
 @genres_bp.route('/', methods=['GET'])
-@cache.cached(timeout=86400, query_string=True) # 24h cache
 def get_genres():
-    headers = {
-        "accept": "application/json",
-        "Authorization": f"Bearer {TMDB_API_KEY}"
-    }
-    params = {
-        "language": "en-US"
-    }
+    def load():
+        return genres_view(tmdb.get("/genre/movie/list", params=GENRES_PARAMS, endpoint='genres'))
 
     try:
-        response = requests.get(f"{TMDB_BASE_URL}/genre/movie/list", headers=headers, params=params)
-        response.raise_for_status()
-        data = response.json()
-        
-        return jsonify(data.get('genres', [])), 200
+        etag, genres = untag(cached_single_flight("genres", load, timeout=86400))
+        return conditional_json(etag, genres)
 
     except requests.exceptions.RequestException as e:
         print(f"Error calling TMDB Genres API: {e}")
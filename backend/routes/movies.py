@@ -1,31 +1,52 @@
-import os
+import base64
+import json
+import threading
 import requests
-from flask import Blueprint, request, jsonify
-from extensions import cache
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlencode
+from flask import Blueprint, request, jsonify, current_app
+from extensions import cache, tmdb
+from singleflight import cached_single_flight
+from http_cache import tagged, untag, content_etag, conditional_json
+from movie_details import format_movie, get_movie_parts
+from catalog import schedule_mirror, remember_search_page, local_search_page, search_source_key
 
 movies_bp = Blueprint('movies', __name__)
 
-TMDB_API_KEY = os.environ.get('TMDB_API_KEY')
-TMDB_BASE_URL = os.environ.get('TMDB_BASE_URL')
+# upstream pages needed by one filtered search are fetched in parallel
+fetch_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='tmdb-fetch')
 
-# connects to the TMDB API and searches for movies
-# a query string is mandatory (movie title), not year, page and genre have defaultss
-@movies_bp.route('/search', methods=['GET'])
-@cache.cached(timeout=86400, query_string=True) # 24h cache
-def search_movies():
-    query = request.args.get('query')
-    page = request.args.get('page', 1, type=int)
-    year = request.args.get('year')
-    genre_id = request.args.get('genre')
+# next pages of a search are loaded ahead of the infinite scroll, two at a time at most
+prefetch_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='search-prefetch')
+_prefetching = {}
+_prefetching_lock = threading.Lock()
 
-    if not query:
-        return jsonify({'error': 'Query parameter is required'}), 400
 
-    headers = {
-        "accept": "application/json",
-        "Authorization": f"Bearer {TMDB_API_KEY}"
-    }
+def normalize_query(query):
+    """Search text as TMDB matches it: case and extra whitespace make no difference"""
+    return ' '.join(query.split()).casefold()
+
+
+def search_cache_key(query, page, year=None, genre_id=None):
+    """
+    Canonical key of a (genre filtered) search view: normalized query, page defaulting to 1,
+    empty year/genre dropped and parameters sorted, so equivalent requests share one entry.
+    """
+    params = {'query': normalize_query(query), 'page': page or 1}
+    if year:
+        params['year'] = year
+    if genre_id:
+        params['genre'] = genre_id
+    return "search:" + urlencode(sorted(params.items()))
+
 
+def search_page_key(query, page, year):
+    """Key of a raw TMDB search page, shared by every genre filter of the search"""
+    return "tmdb:search:" + urlencode(sorted(search_params(normalize_query(query), page, year).items()))
+
+
+def search_params(query, page, year):
+    """TMDB /search/movie parameters for a search request"""
     params = {
         "query": query,
         "include_adult": "false",
@@ -36,34 +57,322 @@ def search_movies():
     if year:
         params["primary_release_year"] = year
 
-    try:
-        response = requests.get(f"{TMDB_BASE_URL}/search/movie", headers=headers, params=params)
-        response.raise_for_status()
-        data = response.json()
-        
-        results = []
-        for item in data.get('results', []):
-            if genre_id and int(genre_id) not in item.get('genre_ids', []):
+    return params
+
+
+def matches_genre(item, genre_id):
+    return not genre_id or int(genre_id) in item.get('genre_ids', [])
+
+
+def format_search_results(data, genre_id=None):
+    """Filters a TMDB search page by genre and formats it"""
+    results = [format_movie(item) for item in data.get('results', []) if matches_genre(item, genre_id)]
+
+    return {
+        'results': results,
+        'page': data.get('page'),
+        'total_pages': data.get('total_pages')
+    }
+
+
+def format_catalog_movie(movie):
+    """Same item shape as format_movie, from a movies row of the local catalog"""
+    return {
+        "tmdb_id": movie.tmdb_id,
+        "title": movie.title,
+        "poster_path": movie.poster_path,
+        "overview": movie.overview,
+        "release_date": movie.release_date.strftime('%Y-%m-%d') if movie.release_date else None,
+        "backdrop_path": movie.backdrop_path
+    }
+
+
+def load_search_page(query, page, year):
+    """TMDB search page, see store_search_page"""
+    data = tmdb.get("/search/movie", params=search_params(query, page, year), endpoint='search')
+    return store_search_page(query, page, year, data)
+
+
+def store_search_page(query, page, year, data):
+    """
+    What a TMDB search page brings to the catalog (both front ends): its results are written
+    into the local catalog in the background, and its result ids are kept to judge the
+    local recall of the same page later.
+    """
+    remember_search_page(query, year, page, data)
+    schedule_mirror([
+        {**format_movie(item), 'genre_ids': item.get('genre_ids'), 'popularity': item.get('popularity')}
+        for item in data.get('results', []) if item.get('id') and item.get('title')
+    ])
+    return data
+
+
+def search_catalog(query, page, year, genre_id):
+    """
+    Search page answered from the local catalog, or None for TMDB. The catalog only answers
+    a page TMDB returned before (its result ids are kept, see remember_search_page) when the
+    full-text search of its titles finds SEARCH_LOCAL_MIN_RECALL of those results, and serves
+    them in the TMDB order.
+    The first page picks the source of the whole page sequence of a search: once it went to
+    TMDB, the next pages do too. A later page the catalog can't answer comes from TMDB, with
+    the same ranking, so no result is repeated or skipped between pages.
+    """
+    source_key = search_source_key(query, year)
+    source = None if page == 1 else cache.get(source_key)
+    if source == 'tmdb':
+        return None
+
+    found = local_search_page(query, year, page, current_app.config['SEARCH_LOCAL_MIN_RECALL'])
+    if source is None:
+        cache.set(source_key, 'tmdb' if found is None else 'catalog', timeout=86400)
+    if found is None:
+        # no reference for this page (never asked, or expired), or not enough of it stored
+        return None
+    movies, reference = found
+
+    return {
+        'results': [
+            format_catalog_movie(movie) for movie in movies
+            if matches_genre({'genre_ids': movie.genre_ids or []}, genre_id)
+        ],
+        'page': page,
+        'total_pages': reference['total_pages']
+    }
+
+
+def fetch_search_page(query, page, year):
+    """Raw TMDB search page, cached on its own so every genre filter of a search can reuse it"""
+    return cached_single_flight(search_page_key(query, page, year), lambda: load_search_page(query, page, year), timeout=86400)
+
+
+def load_search_view(query, page, year, genre_id):
+    """Search view of the cached TMDB page"""
+    return search_view(fetch_search_page(query, page, year), genre_id)
+
+
+def search_view(data, genre_id):
+    """Cache entry of a search view: a TMDB page filtered by genre, with its ETag"""
+    return tagged(format_search_results(data, genre_id))
+
+
+def schedule_prefetch(query, page, year, genre_id, total_pages):
+    """
+    Loads the SEARCH_PREFETCH_DEPTH views after page into the cache in the background, so
+    the next scroll is a cache hit. Nothing past the last page, nothing already pending in
+    this process, no more than SEARCH_PREFETCH_MAX_PENDING waiting, and nothing when fewer
+    than SEARCH_PREFETCH_MIN_BUDGET TMDB calls are left this second (user requests first).
+    """
+    config = current_app.config
+    last_page = min(page + config['SEARCH_PREFETCH_DEPTH'], total_pages or 0)
+    if last_page <= page or tmdb.budget() < config['SEARCH_PREFETCH_MIN_BUDGET']:
+        return []
+
+    app = current_app._get_current_object()
+    futures = []
+    with _prefetching_lock:
+        for next_page in range(page + 1, last_page + 1):
+            key = search_cache_key(query, next_page, year, genre_id)
+            if key in _prefetching or len(_prefetching) >= config['SEARCH_PREFETCH_MAX_PENDING']:
                 continue
+            _prefetching[key] = prefetch_executor.submit(_prefetch, app, key, query, next_page, year, genre_id)
+            futures.append(_prefetching[key])
+    return futures
+
+
+def wait_for_prefetches(timeout=None):
+    """Blocks until the scheduled prefetches are done (tests, shutdown)"""
+    with _prefetching_lock:
+        futures = list(_prefetching.values())
+    wait(futures, timeout=timeout)
+
+
+def _prefetch(app, key, query, page, year, genre_id):
+    with app.app_context():
+        try:
+            # it may have waited in the queue: the page was requested since, or TMDB got busy
+            if cache.has(key) or tmdb.budget() < app.config['SEARCH_PREFETCH_MIN_BUDGET']:
+                return
+            # one worker prefetches a view, the others skip it
+            if not cache.add(f"{key}:prefetching", 1, timeout=30):
+                return
+            # no TMDB call for a page the local catalog will answer
+            if app.config['SEARCH_LOCAL_FIRST'] and search_catalog(query, page, year, genre_id) is not None:
+                return
+            cached_single_flight(key, lambda: load_search_view(query, page, year, genre_id), timeout=86400)
+        except Exception as e:
+            print(f"Error prefetching search page {key}: {e}")
+        finally:
+            with _prefetching_lock:
+                _prefetching.pop(key, None)
+
 
-            poster_url = f"https://image.tmdb.org/t/p/w500{item.get('poster_path')}" if item.get('poster_path') else None
-            
-            results.append({
-                "tmdb_id": item.get('id'),
-                "title": item.get('title'),
-                "poster_path": poster_url,
-                "overview": item.get('overview'),
-                "release_date": item.get('release_date'),
-                "backdrop_path": item.get('backdrop_path')
-            })
-            
-        return jsonify({
+def fetch_search_pages(query, pages, year):
+    """Fetches several raw search pages concurrently, returned in the order of pages"""
+    app = current_app._get_current_object()
+
+    def fetch(page):
+        with app.app_context():
+            return fetch_search_page(query, page, year)
+
+    return list(fetch_executor.map(fetch, pages))
+
+
+def encode_cursor(page, offset):
+    """Opaque cursor: upstream page and position of the next result to read in it"""
+    raw = json.dumps([page, offset], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        page, offset = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(page, int) or not isinstance(offset, int) or page < 1 or offset < 0:
+        raise ValueError('Invalid cursor')
+    return page, offset
+
+
+def search_filled_page(query, year, genre_id, limit, page, offset):
+    """
+    Builds a logical page of up to `limit` results matching genre_id, reading as many
+    upstream pages as needed (a few at a time, concurrently) starting at (page, offset).
+    Returns the results, the cursor of the next logical page (None at the end) and
+    the upstream total_pages.
+    """
+    max_pages = current_app.config['SEARCH_FILL_MAX_PAGES']
+    concurrency = current_app.config['SEARCH_FILL_CONCURRENCY']
+
+    # the first page tells how many pages there are
+    first = fetch_search_page(query, page, year)
+    total_pages = first.get('total_pages') or 0
+    batch = [(page, first)]
+    fetched = 1
+    results = []
+
+    while True:
+        for page, data in batch:
+            items = data.get('results', [])
+            for index in range(offset, len(items)):
+                if not matches_genre(items[index], genre_id):
+                    continue
+                results.append(format_movie(items[index]))
+
+                if len(results) == limit:
+                    if index + 1 < len(items):
+                        return results, encode_cursor(page, index + 1), total_pages
+                    if page < total_pages:
+                        return results, encode_cursor(page + 1, 0), total_pages
+                    return results, None, total_pages
+            offset = 0
+
+        last_page = batch[-1][0]
+        if last_page >= total_pages:
+            return results, None, total_pages
+        # bound the upstream work of one request, the client continues from the cursor
+        if fetched >= max_pages:
+            return results, encode_cursor(last_page + 1, 0), total_pages
+
+        count = min(concurrency, total_pages - last_page, max_pages - fetched)
+        pages = list(range(last_page + 1, last_page + 1 + count))
+        batch = list(zip(pages, fetch_search_pages(query, pages, year)))
+        fetched += count
+
+
+# connects to the TMDB API and searches for movies
+# a query string is mandatory (movie title), not year, page and genre have defaultss
+# results are cached 24h under a canonical key (see search_cache_key), concurrent misses of the
+# same search make a single TMDB call, and every genre filter reuses the same cached TMDB page
+# on a cache miss the local catalog (search results mirrored into movies, full-text indexed)
+# answers first, TMDB only when the catalog doesn't have enough of the results
+# pages carry an ETag (content hash), a matching If-None-Match gets a 304
+# with 'limit' (and then 'cursor') it returns full pages of 'limit' genre matches instead of
+# filtering a single TMDB page: {'results', 'next_cursor', 'total_pages'}
+@movies_bp.route('/search', methods=['GET'])
+def search_movies():
+    # TMDB gets the query as typed (trimmed), cache keys the normalized one
+    query = request.args.get('query', '').strip()
+    page = request.args.get('page', 1, type=int)
+    year = request.args.get('year', '').strip() or None
+    genre_id = request.args.get('genre', '').strip() or None
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+
+    if not query:
+        return jsonify({'error': 'Query parameter is required'}), 400
+
+    if limit is not None or cursor:
+        return search_movies_filled(query, year, genre_id, limit, cursor)
+
+    # the filtered view is cached on its own key, the TMDB page it comes from on another one
+    key = search_cache_key(query, page, year, genre_id)
+
+    # cached views keep their content hash (ETag) next to them
+    entry = cache.get(key)
+    if entry is None and current_app.config['SEARCH_LOCAL_FIRST']:
+        payload = search_catalog(query, page, year, genre_id)
+        if payload is not None:
+            entry = tagged(payload)
+
+    try:
+        if entry is None:
+            entry = cached_single_flight(key, lambda: load_search_view(query, page, year, genre_id), timeout=86400)
+        etag, payload = untag(entry)
+
+        if current_app.config['SEARCH_PREFETCH_DEPTH']:
+            schedule_prefetch(query, page, year, genre_id, payload.get('total_pages'))
+        return conditional_json(etag, payload)
+
+    except requests.exceptions.RequestException as e:
+        if e.response is not None:
+             return jsonify(e.response.json()), e.response.status_code
+        return jsonify({'error': 'Failed to fetch data from TMDB'}), 502
+
+
+def search_movies_filled(query, year, genre_id, limit, cursor):
+    if limit is None:
+        limit = current_app.config['SEARCH_FILL_DEFAULT_LIMIT']
+    if limit < 1 or limit > current_app.config['SEARCH_FILL_MAX_LIMIT']:
+        return jsonify({'error': f"limit must be between 1 and {current_app.config['SEARCH_FILL_MAX_LIMIT']}"}), 400
+
+    try:
+        page, offset = decode_cursor(cursor) if cursor else (1, 0)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        results, next_cursor, total_pages = search_filled_page(query, year, genre_id, limit, page, offset)
+        payload = {
             'results': results,
-            'page': data.get('page'),
-            'total_pages': data.get('total_pages')
-        }), 200
+            'next_cursor': next_cursor,
+            'total_pages': total_pages
+        }
+        # assembled per request from cached pages, hashed here
+        return conditional_json(content_etag(payload), payload)
+
+    except requests.exceptions.RequestException as e:
+        if e.response is not None:
+             return jsonify(e.response.json()), e.response.status_code
+        return jsonify({'error': 'Failed to fetch data from TMDB'}), 502
+
+
+# movie details with cast, videos and similar movies, for the movie modal
+# one TMDB call (append_to_response) whose parts are cached on their own keys (see movie_details),
+# so /cast/<id> and this route share the same fill
+@movies_bp.route('/<int:tmdb_id>', methods=['GET'])
+def get_movie(tmdb_id):
+    try:
+        parts = get_movie_parts(tmdb_id)
+        payload = {
+            **parts['movie'],
+            'cast': parts['cast'],
+            'videos': parts['videos'],
+            'similar': parts['similar']
+        }
+        return conditional_json(content_etag(payload), payload)
 
     except requests.exceptions.RequestException as e:
+        print(f"Error calling TMDB Movie API: {e}")
         if e.response is not None:
              return jsonify(e.response.json()), e.response.status_code
-        return jsonify({'error': 'Failed to fetch data from TMDB'}), 502
\ No newline at end of file
+        return jsonify({'error': 'Failed to fetch movie from TMDB'}), 502
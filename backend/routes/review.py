@@ -1,100 +1,372 @@
-from flask import Blueprint, request, jsonify
+import base64
+import json
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from datetime import datetime
+from sqlalchemy import and_, or_, select, update, delete, literal
+from sqlalchemy.exc import IntegrityError
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, User, Movie, Rating
+from models import db, Movie, Rating, MovieRatingStats
+from ratings_store import (
+    upsert_insert, movie_values, parse_csv_rows, import_ratings,
+    iter_user_ratings, export_chunks, gzip_chunks,
+    add_rating_stats, change_rating_stats, remove_rating_stats, valid_score, SCORE_ERROR
+)
+from http_cache import (
+    content_etag, version, ratings_version, bump_ratings_version,
+    etag_matches, not_modified, with_validator
+)
+from catalog import CATALOG_VERSION_KEY
+from query_budget import query_budget
 
 reviews_bp = Blueprint('reviews', __name__)
 
-# Return all movies rated by the user
+
+def encode_ratings_cursor(created_at, rating_id):
+    """Opaque keyset cursor: (created_at, id) of the last rating of a page"""
+    raw = json.dumps([created_at.isoformat(), rating_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_ratings_cursor(cursor):
+    try:
+        created_at, rating_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return datetime.fromisoformat(created_at), int(rating_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+
+def format_rating_row(row):
+    """Item of the ratings list, built from a row of user_ratings_query"""
+    return {
+        "movie": {
+            "tmdb_id": row.tmdb_id,
+            "title": row.title,
+            "overview": row.overview,
+            "poster_path": row.poster_path,
+            "backdrop_path": row.backdrop_path,
+            "release_date": row.release_date.strftime('%Y-%m-%d') if row.release_date else None,
+            "rating": row.score,
+            "rating_id": row.id
+        }
+    }
+
+
+def user_ratings_query(user_id):
+    """
+    The user's ratings with their movie in one joined query: only the needed columns
+    are selected, no Rating/Movie entity is loaded (nor lazy loads per row).
+    """
+    return db.session.query(
+        Rating.id,
+        Rating.score,
+        Rating.created_at,
+        Movie.tmdb_id,
+        Movie.title,
+        Movie.overview,
+        Movie.poster_path,
+        Movie.backdrop_path,
+        Movie.release_date
+    ).join(Movie, Rating.movie_id == Movie.id).filter(Rating.user_id == user_id)
+
+
+def user_ratings_page_query(user_id, limit, cursor):
+    """Keyset page of the user's ratings ordered by (created_at, id), one extra row tells if there is a next page"""
+    query = user_ratings_query(user_id)
+
+    if cursor:
+        created_at, rating_id = cursor
+        # the >= bound lets the (user_id, created_at) index seek to the page, the OR alone only filters
+        query = query.filter(Rating.created_at >= created_at, or_(
+            Rating.created_at > created_at,
+            and_(Rating.created_at == created_at, Rating.id > rating_id)
+        ))
+
+    return query.order_by(Rating.created_at, Rating.id).limit(limit + 1)
+
+
+def get_user_ratings_page(user_id, limit, cursor):
+    """One keyset page of the user's ratings ordered by (created_at, id)"""
+    rows = user_ratings_page_query(user_id, limit, cursor).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_ratings_cursor(rows[-1].created_at, rows[-1].id)
+
+    return [format_rating_row(row) for row in rows], next_cursor
+
+
+# Return the movies rated by the user
+# with 'limit' and/or 'cursor': keyset pages {'results', 'next_cursor'}
+# without them: the whole list, while RATINGS_UNPAGINATED_COMPAT is on (current front end)
+# the ETag comes from the user's ratings version (changed by every rating write) and the catalog
+# version (details of rated movies), so a matching If-None-Match gets a 304 without querying the ratings
 @reviews_bp.route('/ratings', methods=['GET'])
 @jwt_required()
 def get_user_ratings():
     current_user_id = get_jwt_identity()
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+
+    # versions are read before the ratings: a write committed in between only makes the body newer than its tag
+    etag = content_etag([
+        ratings_version(current_user_id), version(CATALOG_VERSION_KEY), current_user_id, limit, cursor,
+        current_app.config['RATINGS_UNPAGINATED_COMPAT']
+    ])
+    if etag_matches(etag):
+        return not_modified(etag, 'private, no-cache')
+
+    response, status = user_ratings_response(current_user_id, limit, cursor)
+    if status == 200:
+        with_validator(response, etag, 'private, no-cache')
+    return response, status
+
+
+def user_ratings_response(current_user_id, limit, cursor):
+    """Body of GET /reviews/ratings (a keyset page or the whole list) and its status"""
+    if limit is not None or cursor or not current_app.config['RATINGS_UNPAGINATED_COMPAT']:
+        if limit is None:
+            limit = current_app.config['RATINGS_PAGE_DEFAULT_LIMIT']
+        if limit < 1 or limit > current_app.config['RATINGS_PAGE_MAX_LIMIT']:
+            return jsonify({'error': f"limit must be between 1 and {current_app.config['RATINGS_PAGE_MAX_LIMIT']}"}), 400
 
-    # Query all ratings for this user and adds movie info
-    user_ratings = Rating.query.filter_by(user_id=current_user_id).join(Movie).all()
+        try:
+            position = decode_ratings_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-    results = []
-    for rating in user_ratings:
-        results.append({
-            "movie": {
-                "tmdb_id": rating.movie.tmdb_id,
-                "title": rating.movie.title,
-                "overview": rating.movie.overview,
-                "poster_path": rating.movie.poster_path,
-                "backdrop_path": rating.movie.backdrop_path,
-                "release_date": rating.movie.release_date.strftime('%Y-%m-%d') if rating.movie.release_date else None,
-                "rating": rating.score,
-                "rating_id": rating.id
-            }
-        })
+        results, next_cursor = get_user_ratings_page(int(current_user_id), limit, position)
+        return jsonify({'results': results, 'next_cursor': next_cursor}), 200
+
+    # compatibility mode: the whole list, same single query as the pages
+    rows = user_ratings_query(int(current_user_id)).order_by(Rating.created_at, Rating.id).all()
+    return jsonify([format_rating_row(row) for row in rows]), 200
+
+
+def tmdb_movie_id(tmdb_id):
+    """Local movie id of a TMDB id, as a subquery of the write statements"""
+    return select(Movie.id).where(Movie.tmdb_id == tmdb_id).scalar_subquery()
+
+
+def user_rating(user_id, tmdb_id):
+    """Criteria of the user's rating of a TMDB movie (update, delete): a unique index lookup"""
+    return Rating.user_id == user_id, Rating.movie_id == tmdb_movie_id(tmdb_id)
+
+
+def movie_exists(tmdb_id):
+    return db.session.query(Movie.id).filter_by(tmdb_id=tmdb_id).first() is not None
+
+
+# most movies per GET /reviews/stats request (one search page is 20)
+STATS_MAX_IDS = 100
+
+
+def format_rating_stats(stats):
+    if stats is None:
+        return {"count": 0, "average": None, "histogram": {}, "last_rated_at": None}
+    return {
+        "count": stats.rating_count,
+        "average": round(stats.average, 2) if stats.average is not None else None,
+        "histogram": {str(score): count for score, count in stats.histogram.items() if count},
+        "last_rated_at": stats.last_rated_at.isoformat() if stats.last_rated_at else None
+    }
+
+
+# Community rating stats of movies (search results, movie modal)
+# ?ids=603,604 (TMDB ids), read from movie_rating_stats: one primary key lookup per movie
+@reviews_bp.route('/stats', methods=['GET'])
+@jwt_required()
+def get_rating_stats():
+    try:
+        tmdb_ids = [int(value) for value in request.args.get('ids', '').split(',') if value.strip()]
+    except ValueError:
+        return jsonify({'error': 'ids must be a comma separated list of TMDB ids'}), 400
+
+    if not tmdb_ids:
+        return jsonify({'error': 'ids parameter is required'}), 400
+    if len(tmdb_ids) > STATS_MAX_IDS:
+        return jsonify({'error': f'At most {STATS_MAX_IDS} ids per request'}), 400
+
+    rows = db.session.execute(
+        select(Movie.tmdb_id, MovieRatingStats)
+        .join(MovieRatingStats, MovieRatingStats.movie_id == Movie.id)
+        .where(Movie.tmdb_id.in_(tmdb_ids))
+    ).all()
+    found = dict(rows)
+
+    return jsonify({str(tmdb_id): format_rating_stats(found.get(tmdb_id)) for tmdb_id in tmdb_ids}), 200
+
+
+# Export all the user's ratings, streamed from a server-side cursor
+# ?format=ndjson (default) or csv (same columns as the bulk import, plus rated_at)
+# gzip on the fly when the client accepts it
+@reviews_bp.route('/ratings/export', methods=['GET'])
+@jwt_required()
+def export_ratings():
+    current_user_id = get_jwt_identity()
+    fmt = request.args.get('format', 'ndjson')
 
-    return jsonify(results), 200
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+
+    partitions = iter_user_ratings(int(current_user_id), current_app.config['EXPORT_BATCH_SIZE'])
+    chunks = export_chunks(partitions, fmt)
+
+    headers = {'Content-Disposition': f'attachment; filename=ratings.{fmt}'}
+    if 'gzip' in request.accept_encodings:
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+        headers['Vary'] = 'Accept-Encoding'
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
 
 
 # Create a new rating (cascade to create Movie if not exists)
+# one transaction: INSERT movie ON CONFLICT DO NOTHING, INSERT rating SELECT ... ON CONFLICT DO NOTHING,
+# then the movie's rating stats upsert
 @reviews_bp.route('/ratings', methods=['POST'])
 @jwt_required()
 def create_rating():
     current_user_id = get_jwt_identity()
     data = request.get_json()
 
-    print(data)
-
     tmdb_id = data.get('tmdb_id')
     score = data.get('score')
     movie_data = data.get('movie_data') # dict
 
     if tmdb_id is None or score is None:
         return jsonify({'error': 'Missing tmdb_id or score'}), 400
+    if not valid_score(score):
+        return jsonify({'error': SCORE_ERROR}), 400
+
+    # a bad date only matters if the movie has to be created
+    release_date = None
+    bad_release_date = False
+    if movie_data and movie_data.get('release_date'):
+        try:
+            release_date = datetime.strptime(movie_data['release_date'], '%Y-%m-%d')
+        except ValueError:
+            bad_release_date = True
+
+    insert = upsert_insert(Movie)
+    if insert is None:
+        return create_rating_portable(int(current_user_id), tmdb_id, score, movie_data, release_date, bad_release_date)
 
-    # Check if Movie exists; if not, create it
+    # two users rating a new movie at the same time both end up here, the second insert is a no-op
+    if movie_data and not bad_release_date:
+        db.session.execute(
+            insert.values(**movie_values(tmdb_id, movie_data, release_date))
+            .on_conflict_do_nothing(index_elements=['tmdb_id'])
+        )
+
+    now = datetime.utcnow()
+    new_rating = select(
+        literal(int(current_user_id), db.Integer),
+        Movie.id,
+        literal(score, db.Integer),
+        literal(now, db.DateTime)
+    ).where(Movie.tmdb_id == tmdb_id)
+
+    created = db.session.execute(
+        upsert_insert(Rating)
+        .from_select(['user_id', 'movie_id', 'score', 'created_at'], new_rating)
+        .on_conflict_do_nothing(index_elements=['user_id', 'movie_id'])
+        .returning(Rating.movie_id, Rating.score)
+    ).first()
+
+    if created is None:
+        # nothing inserted: either the movie is unknown or the rating already exists
+        db.session.rollback()
+        if not movie_exists(tmdb_id):
+            if bad_release_date:
+                return jsonify({'error': 'Release date is not in the default pattern.'}), 400
+            return jsonify({'error': 'Movie not found locally and no data provided to create it'}), 400
+        return jsonify({'error': 'Rating already exists.'}), 409
+
+    add_rating_stats([tuple(created)], now)
+    db.session.commit()
+    bump_ratings_version(current_user_id)
+
+    return jsonify({
+        'message': 'Rating created successfully',
+        'tmdb_id': tmdb_id,
+        'score': score,
+        'movie_data': movie_data
+    }), 201
+
+
+def create_rating_portable(user_id, tmdb_id, score, movie_data, release_date, bad_release_date):
+    """ORM version of create_rating for databases without ON CONFLICT"""
     movie = Movie.query.filter_by(tmdb_id=tmdb_id).first()
 
     if not movie:
         if not movie_data:
             return jsonify({'error': 'Movie not found locally and no data provided to create it'}), 400
-        
-        release_date = None
-        if movie_data.get('release_date'):
-            try:
-                release_date = datetime.strptime(movie_data['release_date'], '%Y-%m-%d')
-            except ValueError:
-                return jsonify({'error': 'Release date is not in the default pattern.'}), 400
+        if bad_release_date:
+            return jsonify({'error': 'Release date is not in the default pattern.'}), 400
 
-        movie = Movie(
-            tmdb_id=tmdb_id,
-            title=movie_data.get('title', 'Unknown Title'),
-            poster_path=movie_data.get('poster_path'),
-            backdrop_path=movie_data.get('backdrop_path'),
-            overview=movie_data.get('overview'),
-            release_date=release_date
-        )
+        movie = Movie(**movie_values(tmdb_id, movie_data, release_date))
         db.session.add(movie)
-        db.session.commit()
+        db.session.flush()
 
-    #  prevent duplicated rating
-    existing_rating = Rating.query.filter_by(user_id=current_user_id, movie_id=movie.id).first()
-    if existing_rating:
+    rating = Rating(user_id=user_id, movie_id=movie.id, score=score)
+    db.session.add(rating)
+    try:
+        db.session.flush()
+        add_rating_stats([(movie.id, rating.score)], rating.created_at)
+        db.session.commit()
+    except IntegrityError:
+        # the unique indexes have the last word on concurrent duplicates
+        db.session.rollback()
         return jsonify({'error': 'Rating already exists.'}), 409
-    
-    new_rating = Rating(
-        user_id=current_user_id,
-        movie_id=movie.id,
-        score=score
-    )
-    db.session.add(new_rating)
-    db.session.commit()
+    bump_ratings_version(user_id)
 
     return jsonify({
         'message': 'Rating created successfully',
         'tmdb_id': tmdb_id,
-        'score': new_rating.score,
+        'score': score,
         'movie_data': movie_data
     }), 201
 
 
+# Import many ratings at once (Letterboxd/IMDb migrations)
+# body: JSON array of POST /reviews/ratings payloads (or flat rows), or a CSV upload ('file' field
+# or text/csv body) with the columns tmdb_id, score, title, release_date, poster_path, backdrop_path, overview
+# statements grow with the number of batches: no query budget
+@reviews_bp.route('/ratings/bulk', methods=['POST'])
+@jwt_required()
+@query_budget(None)
+def bulk_import_ratings():
+    current_user_id = get_jwt_identity()
+
+    if 'file' in request.files:
+        try:
+            rows = parse_csv_rows(request.files['file'].read().decode('utf-8-sig'))
+        except UnicodeDecodeError:
+            return jsonify({'error': 'CSV file must be UTF-8 encoded'}), 400
+    elif request.mimetype == 'text/csv':
+        rows = parse_csv_rows(request.get_data(as_text=True))
+    else:
+        rows = request.get_json(silent=True)
+        if not isinstance(rows, list):
+            return jsonify({'error': 'Expected a JSON array or a CSV file'}), 400
+
+    max_rows = current_app.config['BULK_IMPORT_MAX_ROWS']
+    if len(rows) > max_rows:
+        return jsonify({'error': f'At most {max_rows} rows per import'}), 413
+
+    if upsert_insert(Movie) is None:
+        return jsonify({'error': 'Bulk import is not supported on this database'}), 501
+
+    summary = import_ratings(int(current_user_id), rows, current_app.config['BULK_IMPORT_BATCH_SIZE'])
+    bump_ratings_version(current_user_id)
+    return jsonify(summary), 200
+
+
 # Update the rating of a movie
+# the rating row is locked to read the old score (the movie is resolved by a subquery on tmdb_id),
+# then the rating and the movie's rating stats are updated in the same transaction
 @reviews_bp.route('/ratings/<int:tmdb_id>', methods=['PUT'])
 @jwt_required()
 def update_rating(tmdb_id):
@@ -104,38 +376,58 @@ def update_rating(tmdb_id):
 
     if new_score is None:
         return jsonify({'error': 'New score is required'}), 400
+    if not valid_score(new_score):
+        return jsonify({'error': SCORE_ERROR}), 400
 
-    # find movie by tmdb_id and get its rating
-    movie = Movie.query.filter_by(tmdb_id=tmdb_id).first()
-    if not movie:
-        return jsonify({'error': 'Movie not found'}), 404
-    rating = Rating.query.filter_by(user_id=current_user_id, movie_id=movie.id).first()
-    if not rating:
+    rating = db.session.execute(
+        select(Rating.id, Rating.movie_id, Rating.score)
+        .where(*user_rating(int(current_user_id), tmdb_id))
+        .with_for_update()
+    ).first()
+
+    if rating is None:
+        db.session.rollback()
+        if not movie_exists(tmdb_id):
+            return jsonify({'error': 'Movie not found'}), 404
         return jsonify({'error': 'Rating not found'}), 404
 
-    # update score
-    rating.score = new_score
-    
+    stored_score = db.session.execute(
+        update(Rating)
+        .where(Rating.id == rating.id)
+        .values(score=new_score)
+        .returning(Rating.score)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    change_rating_stats(rating.movie_id, rating.score, stored_score)
     db.session.commit()
+    bump_ratings_version(current_user_id)
 
-    return jsonify({'message': 'Rating updated successfully', 'new_score': rating.score}), 200
+    return jsonify({'message': 'Rating updated successfully', 'new_score': new_score}), 200
 
 
 # Delete a rating (movie is not deleted)
+# DELETE ... RETURNING (the movie is resolved by a subquery on tmdb_id), then the movie's
+# rating stats are decremented in the same transaction
 @reviews_bp.route('/ratings/<int:tmdb_id>', methods=['DELETE'])
 @jwt_required()
 def delete_rating(tmdb_id):
     current_user_id = get_jwt_identity()
 
-    movie = Movie.query.filter_by(tmdb_id=tmdb_id).first()
-    if not movie:
-        return jsonify({'error': 'Movie not found'}), 404
+    deleted = db.session.execute(
+        delete(Rating)
+        .where(*user_rating(int(current_user_id), tmdb_id))
+        .returning(Rating.movie_id, Rating.score)
+        .execution_options(synchronize_session=False)
+    ).first()
 
-    rating = Rating.query.filter_by(user_id=current_user_id, movie_id=movie.id).first()
-    if not rating:
+    if deleted is None:
+        db.session.rollback()
+        if not movie_exists(tmdb_id):
+            return jsonify({'error': 'Movie not found'}), 404
         return jsonify({'error': 'Rating not found'}), 404
 
-    db.session.delete(rating)
+    remove_rating_stats(deleted.movie_id, deleted.score)
     db.session.commit()
+    bump_ratings_version(current_user_id)
 
     return jsonify({'message': 'Rating deleted successfully'}), 200
\ No newline at end of file
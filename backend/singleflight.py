@@ -0,0 +1,86 @@
+import math
+import time
+import uuid
+import threading
+from concurrent.futures import Future
+from extensions import cache, tmdb
+
+# how often the workers waiting for a key look for the result
+POLL_INTERVAL = 0.05
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def default_lock_ttl():
+    """
+    How long a worker may hold the fetch lock of a key, and the others wait for its result:
+    one TMDB call at its worst (see TMDBClient.max_call_seconds), so followers don't load the
+    key themselves while the leader is still retrying
+    """
+    return tmdb.max_call_seconds() + 1
+
+
+def cached_single_flight(key, loader, timeout, lock_ttl=None):
+    """
+    Cache lookup where a miss is loaded only once, however many requests want it.
+    - in this process: the first caller loads, the others wait on the same Future
+    - across workers: a short lock in the cache backend (SET NX on Redis) elects the
+      worker that calls loader, the others poll the cache until the value shows up
+    loader errors are raised to every caller waiting in this process.
+    """
+    lock_ttl = lock_ttl or default_lock_ttl()
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = Future()
+            _inflight[key] = future
+
+    if not leader:
+        return future.result()
+
+    try:
+        value = _load_once(key, loader, timeout, lock_ttl)
+        future.set_result(value)
+        return value
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def _load_once(key, loader, timeout, lock_ttl):
+    lock_key = f"{key}:lock"
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + lock_ttl
+
+    while True:
+        # cache timeouts are whole seconds
+        if cache.add(lock_key, token, timeout=max(1, math.ceil(lock_ttl))):
+            try:
+                value = loader()
+                cache.set(key, value, timeout=timeout)
+                return value
+            finally:
+                # only release our own lock, it may have expired and been taken by someone else
+                if cache.get(lock_key) == token:
+                    cache.delete(lock_key)
+
+        # another worker is fetching it
+        time.sleep(POLL_INTERVAL)
+        value = cache.get(key)
+        if value is not None:
+            return value
+
+        if time.monotonic() >= deadline:
+            # the lock holder is stuck or died, don't make the request wait any longer
+            value = loader()
+            cache.set(key, value, timeout=timeout)
+            return value
@@ -9,6 +9,9 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 from app import create_app, db
 from models import User
+from catalog import wait_for_mirrors
+from routes.movies import wait_for_prefetches
+from user_lookup import remember_user
 from flask_jwt_extended import create_access_token
 
 @pytest.fixture
@@ -25,7 +28,13 @@ def app():
         "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
         "JWT_SECRET_KEY": "test-secret-key",
         "CACHE_TYPE": "SimpleCache", 
-        "CACHE_DEFAULT_TIMEOUT": 300
+        "CACHE_DEFAULT_TIMEOUT": 300,
+        "TMDB_BASE_URL": "https://tmdb.test/3",
+        "TMDB_RETRY_BACKOFF": 0,
+        # a route running more SQL statements than its budget fails the test
+        "SQL_QUERY_BUDGET_STRICT": True,
+        # no background TMDB calls unless a test turns it on
+        "SEARCH_PREFETCH_DEPTH": 0
     }
 
     app = create_app(config_override=test_config)
@@ -37,6 +46,9 @@ def app():
         
         yield app
         
+        # next search pages loaded and search results written into the catalog in the background
+        wait_for_prefetches()
+        wait_for_mirrors()
         db.session.remove()
         db.drop_all()
 
@@ -56,6 +68,8 @@ def user1_auth(app):
         user.set_password("password")
         db.session.add(user)
         db.session.commit()
+        # like /auth/login, which caches the user record
+        remember_user(user)
         token = create_access_token(identity=str(user.id))
         return {'Authorization': f'Bearer {token}'}
 
@@ -66,5 +80,7 @@ def user2_auth(app):
         user.set_password("password")
         db.session.add(user)
         db.session.commit()
+        # like /auth/login, which caches the user record
+        remember_user(user)
         token = create_access_token(identity=str(user.id))
         return {'Authorization': f'Bearer {token}'}
\ No newline at end of file
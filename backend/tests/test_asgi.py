@@ -0,0 +1,221 @@
+import asyncio
+import pytest
+import httpx
+import msgpack
+import requests
+from unittest.mock import patch, Mock
+from starlette.testclient import TestClient
+from extensions import cache, tmdb_async
+from asgi import create_asgi_app
+
+MOCK_SEARCH_RESULTS = {
+    "page": 1,
+    "total_pages": 1,
+    "results": [
+        {"id": 101, "title": "Batman Begins", "poster_path": "/batman.jpg", "genre_ids": [28, 80]},
+        {"id": 102, "title": "Batman & Robin", "poster_path": None, "genre_ids": [878]}
+    ]
+}
+
+MOCK_MOVIE = {
+    "id": 550,
+    "title": "Fight Club",
+    "credits": {"cast": [{"id": 819, "name": "Edward Norton", "profile_path": None, "order": 0}]}
+}
+
+
+@pytest.fixture
+def upstream_calls():
+    """Fake TMDB behind the async gateway, records the requested paths"""
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if request.url.path.endswith('/search/movie'):
+            return httpx.Response(200, json=MOCK_SEARCH_RESULTS)
+        if request.url.path.endswith('/genre/movie/list'):
+            return httpx.Response(200, json={"genres": [{"id": 28, "name": "Action"}]})
+        if request.url.path.endswith('/movie/550'):
+            return httpx.Response(200, json=MOCK_MOVIE)
+        return httpx.Response(404, json={"status_message": "The resource you requested could not be found."})
+
+    tmdb_async.transport = httpx.MockTransport(handler)
+    yield calls
+    tmdb_async.transport = None
+    tmdb_async.close()
+
+
+@pytest.fixture
+def asgi_client(app):
+    with TestClient(create_asgi_app(app)) as client:
+        yield client
+
+
+def test_asgi_search_formats_and_caches(asgi_client, upstream_calls):
+    response = asgi_client.get('/movies/search?query=Batman&genre=28')
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [movie['tmdb_id'] for movie in data['results']] == [101]
+    assert data['results'][0]['poster_path'] == "https://image.tmdb.org/t/p/w500/batman.jpg"
+
+    asgi_client.get('/movies/search?query=Batman&genre=28')
+    assert len(upstream_calls) == 1
+
+
+def test_asgi_search_missing_query(asgi_client, upstream_calls):
+    response = asgi_client.get('/movies/search')
+    assert response.status_code == 400
+    assert response.json()['error'] == 'Query parameter is required'
+
+
+def test_asgi_genres(asgi_client, upstream_calls):
+    response = asgi_client.get('/genres/')
+    assert response.status_code == 200
+    assert response.json() == [{"id": 28, "name": "Action"}]
+    assert response.headers['Access-Control-Allow-Origin'] == '*'
+
+
+def test_asgi_cast_shares_cache_with_sync_route(asgi_client, client, upstream_calls):
+    response = asgi_client.get('/cast/550')
+    assert response.status_code == 200
+    assert response.json()[0]['name'] == "Edward Norton"
+
+    # the Flask route reads the entry filled by the async path
+    assert client.get('/cast/550').get_json()[0]['name'] == "Edward Norton"
+    # and the details that came with it
+    assert client.get('/movies/550').get_json()['title'] == "Fight Club"
+    assert len(upstream_calls) == 1
+
+
+def test_asgi_cast_upstream_error(asgi_client, upstream_calls):
+    response = asgi_client.get('/cast/1')
+    assert response.status_code == 404
+    assert "status_message" in response.json()
+
+
+def test_asgi_connection_error(asgi_client):
+    def handler(request):
+        raise httpx.ConnectError("Offline")
+
+    tmdb_async.transport = httpx.MockTransport(handler)
+    try:
+        response = asgi_client.get('/genres/')
+    finally:
+        tmdb_async.transport = None
+        tmdb_async.close()
+
+    assert response.status_code == 502
+    assert response.json()['error'] == 'Failed to fetch genres from TMDB'
+
+
+def test_asgi_delegates_other_routes_to_flask(asgi_client):
+    response = asgi_client.get('/')
+    assert response.status_code == 200
+    assert response.json() == {"msg": "Hello world!"}
+
+
+def tmdb_answer(path, params):
+    """(status, body) of the fake TMDB, for both upstream clients"""
+    if path.endswith('/search/movie'):
+        return 200, {**MOCK_SEARCH_RESULTS, "page": int(params.get('page', 1)), "total_pages": 2}
+    if path.endswith('/genre/movie/list'):
+        return 200, {"genres": [{"id": 28, "name": "Action"}]}
+    if path.endswith('/movie/550'):
+        return 200, MOCK_MOVIE
+    return 404, {"status_message": "The resource you requested could not be found."}
+
+
+def requests_answer(url, params=None, **kwargs):
+    status, body = tmdb_answer(url, params or {})
+    response = Mock()
+    response.status_code = status
+    response.json.return_value = body
+    if status >= 400:
+        response.raise_for_status.side_effect = requests.exceptions.HTTPError(response=response)
+    return response
+
+
+@pytest.fixture
+def both_upstreams():
+    def handler(request):
+        status, body = tmdb_answer(request.url.path, dict(request.url.params))
+        return httpx.Response(status, json=body)
+
+    tmdb_async.transport = httpx.MockTransport(handler)
+    with patch('tmdb.requests.Session.get', side_effect=requests_answer):
+        yield
+    tmdb_async.transport = None
+    tmdb_async.close()
+
+
+def test_asgi_and_flask_answer_the_same(client, asgi_client, both_upstreams):
+    """Same requests on a cold cache through each front end: same status, validators and body"""
+    cursor = client.get('/movies/search?query=Batman&genre=28&limit=1').get_json()['next_cursor']
+
+    for url in [
+        '/movies/search?query=Batman',
+        '/movies/search?query=Batman&genre=28&page=2',
+        '/movies/search?query=Batman&genre=28&limit=1',
+        f'/movies/search?query=Batman&genre=28&limit=1&cursor={cursor}',
+        '/movies/search?query=Batman&limit=0',
+        '/movies/search?query=Batman&cursor=not-a-cursor',
+        '/movies/search',
+        '/movies/550',
+        '/movies/1',
+        '/genres/',
+        '/cast/550',
+        '/cast/1',
+    ]:
+        cache.clear()
+        expected = client.get(url, headers={'Accept-Encoding': 'identity'})
+        cache.clear()
+        response = asgi_client.get(url, headers={'Accept-Encoding': 'identity'})
+
+        assert response.status_code == expected.status_code, url
+        for header in ('ETag', 'Content-Type', 'Cache-Control', 'Vary'):
+            assert response.headers.get(header) == expected.headers.get(header), (url, header)
+        assert response.json() == expected.get_json(), url
+
+
+def test_asgi_answers_conditional_and_negotiated_requests(asgi_client, upstream_calls):
+    first = asgi_client.get('/movies/search?query=Batman')
+    assert first.headers['Cache-Control'] == 'no-cache'
+
+    again = asgi_client.get('/movies/search?query=Batman', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+
+    packed = asgi_client.get('/genres/', headers={'Accept': 'application/msgpack'})
+    assert packed.headers['Content-Type'] == 'application/msgpack'
+    assert msgpack.unpackb(packed.content) == [{"id": 28, "name": "Action"}]
+    assert len(upstream_calls) == 2
+
+
+def test_asgi_fills_the_cache_of_the_flask_routes(asgi_client, client, upstream_calls):
+    asgi_client.get('/movies/search?query=Batman')
+    asgi_client.get('/genres/')
+    asgi_client.get('/movies/550')
+
+    # no sync upstream call needed anymore
+    with patch('tmdb.requests.Session.get', side_effect=AssertionError("TMDB called")):
+        assert client.get('/movies/search?query=batman').status_code == 200
+        assert client.get('/genres/').status_code == 200
+        assert client.get('/cast/550').get_json()[0]['name'] == "Edward Norton"
+    assert len(upstream_calls) == 3
+
+
+def test_client_of_a_previous_loop_is_closed(upstream_calls):
+    async def client():
+        return tmdb_async.client
+
+    first_loop = asyncio.new_event_loop()
+    try:
+        first = first_loop.run_until_complete(client())
+        second = asyncio.run(client())
+        assert second is not first
+
+        # its aclose waits for that loop to run again
+        first_loop.run_until_complete(asyncio.sleep(0))
+        assert first.is_closed
+    finally:
+        first_loop.close()
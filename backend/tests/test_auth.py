@@ -1,5 +1,11 @@
-import json
+from unittest.mock import patch
+from sqlalchemy import event
 from flask_jwt_extended import create_access_token
+from werkzeug.security import generate_password_hash, DEFAULT_PBKDF2_ITERATIONS
+from extensions import hasher
+from models import db, User
+from passwords import normalize_method, START_METHOD
+from user_lookup import get_user
 
 # --------------------------------------------------------------------------
 # REGISTER TESTS
@@ -123,4 +129,130 @@ def test_protected_route_user_doesnt_exist(client, app):
 
     # 3. Assertions
     assert response.status_code == 404
-    assert response.get_json()['msg'] == "User not found"
\ No newline at end of file
+    assert response.get_json()['msg'] == "User not found"
+
+# --------------------------------------------------------------------------
+# PASSWORD HASHING
+# --------------------------------------------------------------------------
+
+def test_login_rehashes_old_parameters(client, app):
+    """A hash made with other parameters is replaced at the next successful login."""
+    with app.app_context():
+        db.session.add(User(email="old@test.com", password_hash=generate_password_hash("secret", "pbkdf2:sha256:1000")))
+        db.session.commit()
+
+    response = client.post('/auth/login', json={"email": "old@test.com", "password": "secret"})
+    assert response.status_code == 200
+
+    with app.app_context():
+        user = User.query.filter_by(email="old@test.com").one()
+        assert user.password_hash.startswith(app.config['PASSWORD_HASH_METHOD'] + '$')
+        assert user.check_password("secret")
+        upgraded = user.password_hash
+
+    # the new hash still logs in, and isn't rehashed again
+    assert client.post('/auth/login', json={"email": "old@test.com", "password": "secret"}).status_code == 200
+    with app.app_context():
+        assert User.query.filter_by(email="old@test.com").one().password_hash == upgraded
+
+def test_saturated_hasher_answers_503(client, app):
+    client.post('/auth/register', json={"email": "busy@test.com", "password": "secret"})
+
+    app.config['PASSWORD_HASH_MAX_PENDING'] = 0
+    hasher.init_app(app)
+
+    response = client.post('/auth/login', json={"email": "busy@test.com", "password": "secret"})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert client.post('/auth/register', json={"email": "new@test.com", "password": "x"}).status_code == 503
+
+def test_hashing_pool_is_not_forked_from_the_worker(client):
+    # the pool processes don't inherit the threads and locks of the request worker
+    assert START_METHOD in ('forkserver', 'spawn')
+    assert hasher.executor._mp_context.get_start_method() == START_METHOD
+
+    client.post('/auth/register', json={"email": "pool@test.com", "password": "secret"})
+    assert client.post('/auth/login', json={"email": "pool@test.com", "password": "secret"}).status_code == 200
+
+def test_hashes_wait_for_a_slot_of_the_host(client, app):
+    client.post('/auth/register', json={"email": "host@test.com", "password": "secret"})
+
+    app.config['PASSWORD_HASH_HOST_LIMIT'] = 1
+    hasher.init_app(app)
+    # another worker is hashing
+    with patch.object(hasher, 'host_wait', 0.1):
+        hasher._host_slots.acquire()
+        try:
+            assert client.post('/auth/login', json={"email": "host@test.com", "password": "secret"}).status_code == 503
+        finally:
+            hasher._host_slots.release()
+    assert client.post('/auth/login', json={"email": "host@test.com", "password": "secret"}).status_code == 200
+
+def test_normalize_method():
+    assert normalize_method('scrypt') == 'scrypt:32768:8:1'
+    assert normalize_method('scrypt:65536:8:1') == 'scrypt:65536:8:1'
+    assert normalize_method('pbkdf2') == f'pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}'
+
+def test_calibrate_cli(app):
+    result = app.test_cli_runner().invoke(args=['passwords', 'calibrate', '--target-ms', '1'])
+
+    assert result.exit_code == 0
+    # nothing is that fast here: the cheapest candidate, with a warning
+    assert 'PASSWORD_HASH_METHOD=scrypt:16384:8:1' in result.output
+    assert 'Warning' in result.output
+
+
+# --------------------------------------------------------------------------
+# USER LOOKUP
+# --------------------------------------------------------------------------
+
+def login_token(client, email):
+    client.post('/auth/register', json={"email": email, "password": "secret"})
+    token = client.post('/auth/login', json={"email": email, "password": "secret"}).get_json()['access_token']
+    return {'Authorization': f'Bearer {token}'}
+
+def test_authenticated_requests_use_the_cached_user(client, app):
+    headers = login_token(client, "cached@test.com")
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get('/auth/protected', headers=headers)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+    assert response.get_json()['logged_in_as'] == "cached@test.com"
+    assert statements == []
+
+def test_user_is_loaded_once_per_request(app):
+    with app.test_request_context():
+        user = User(email="memo@test.com", password_hash="x")
+        db.session.add(user)
+        db.session.commit()
+
+        with patch('user_lookup.cache.get', return_value=None) as cache_get:
+            assert get_user(user.id).email == "memo@test.com"
+            assert get_user(user.id) is get_user(user.id)
+        assert cache_get.call_count == 1
+        assert get_user(9999) is None
+
+def test_user_changes_invalidate_the_cache(client, app):
+    headers = login_token(client, "before@test.com")
+    assert client.get('/auth/protected', headers=headers).get_json()['logged_in_as'] == "before@test.com"
+
+    # (in the app context of the fixture, which the test requests share)
+    user = User.query.filter_by(email="before@test.com").one()
+    user.email = "after@test.com"
+    db.session.commit()
+    assert client.get('/auth/protected', headers=headers).get_json()['logged_in_as'] == "after@test.com"
+
+    db.session.delete(User.query.filter_by(email="after@test.com").one())
+    db.session.commit()
+    response = client.get('/auth/protected', headers=headers)
+    assert response.status_code == 404
+    assert response.get_json()['msg'] == "User not found"
@@ -0,0 +1,87 @@
+import pickle
+from datetime import datetime
+from unittest.mock import patch
+from cachelib import SimpleCache
+from cachelib.serializers import RedisSerializer
+import cache_serializer
+from cache_serializer import CompactSerializer, MSGPACK, MSGPACK_ZLIB, MSGPACK_ZSTD
+from tiered_cache import TieredCache
+
+SEARCH_PAGE = {
+    "results": [{"tmdb_id": i, "title": f"Movie {i}", "overview": "A long overview " * 10,
+                 "poster_path": None, "release_date": "2008-07-16"} for i in range(20)],
+    "page": 1,
+    "total_pages": 3
+}
+
+
+def test_round_trip_of_cached_values():
+    serializer = CompactSerializer()
+
+    for value in [SEARCH_PAGE, [{"id": 28, "name": "Action"}], {1: 'int keys'}, 'token', 1.5, True, None, 42, -3]:
+        assert serializer.loads(serializer.dumps(value)) == value
+
+
+def test_integers_stay_plain_for_incr():
+    serializer = CompactSerializer()
+
+    assert serializer.dumps(42) == b'42'
+    # value after a Redis INCR
+    assert serializer.loads(b'43') == 43
+
+
+def test_large_values_are_compressed():
+    serializer = CompactSerializer(min_compress_bytes=1024)
+
+    small = serializer.dumps([{"id": 28, "name": "Action"}])
+    large = serializer.dumps(SEARCH_PAGE)
+
+    assert small[:1] == MSGPACK
+    assert large[:1] == (MSGPACK_ZSTD if cache_serializer.zstandard else MSGPACK_ZLIB)
+    assert len(large) < len(RedisSerializer().dumps(SEARCH_PAGE)) / 2
+
+
+def test_zlib_without_zstandard():
+    with patch.object(cache_serializer, 'zstandard', None):
+        serializer = CompactSerializer(min_compress_bytes=0)
+
+    data = serializer.dumps(SEARCH_PAGE)
+    assert data[:1] == MSGPACK_ZLIB
+    assert serializer.loads(data) == SEARCH_PAGE
+
+    # a zstd entry written by a worker that has the package is a miss
+    assert serializer.loads(MSGPACK_ZSTD + b'...') is None
+
+
+def test_reads_entries_of_the_default_serializer():
+    serializer = CompactSerializer()
+
+    assert serializer.loads(RedisSerializer().dumps(SEARCH_PAGE)) == SEARCH_PAGE
+    assert serializer.loads(RedisSerializer().dumps(7)) == 7
+
+
+def test_values_msgpack_cant_encode_are_pickled():
+    serializer = CompactSerializer()
+    value = {'at': datetime(2026, 1, 1)}
+
+    data = serializer.dumps(value)
+    assert data[:1] == b'!' and pickle.loads(data[1:]) == value
+    assert serializer.loads(data) == value
+
+
+def test_corrupted_value_is_a_miss():
+    serializer = CompactSerializer()
+
+    assert serializer.loads(MSGPACK_ZLIB + b'not zlib') is None
+    assert serializer.loads(MSGPACK + b'\xc1') is None
+
+
+def test_tiered_cache_hands_the_serializer_to_l2():
+    l2 = SimpleCache()
+    tiered = TieredCache(l2)
+    serializer = CompactSerializer()
+
+    tiered.serializer = serializer
+
+    assert l2.serializer is serializer
+    assert tiered.serializer is serializer
@@ -1,10 +1,15 @@
+import math
 import pytest
 from unittest.mock import patch, Mock
 import requests
+import caching
+from singleflight import default_lock_ttl
 
+# /movie/<id> with append_to_response=credits,...: the cast comes in 'credits'
 MOCK_TMDB_CAST_RESPONSE = {
     "id": 550,
-    "cast": [
+    "title": "Fight Club",
+    "credits": {"cast": [
         {
             "adult": False,
             "gender": 2,
@@ -33,15 +38,16 @@ MOCK_TMDB_CAST_RESPONSE = {
             "credit_id": "52fe4250c3a36847f80149f7",
             "order": 1
         }
-    ]
+    ]}
 }
+MOCK_CAST = MOCK_TMDB_CAST_RESPONSE['credits']['cast']
 def test_get_movie_cast_success(client):
     """
     Test that the endpoint correctly fetches data from TMDB,
     formats the image URLs, and returns the simplified structure.
     """
-    # We patch 'routes.cast.requests.get' because that is where requests is used
-    with patch('routes.cast.requests.get') as mock_get:
+    # We patch the pooled session of the TMDB gateway, used by every route
+    with patch('tmdb.requests.Session.get') as mock_get:
         # Configure the mock to return a successful response (200 OK)
         mock_response = Mock()
         mock_response.status_code = 200
@@ -74,7 +80,7 @@ def test_get_movie_cast_tmdb_404(client):
     """
     Test how the backend handles it when TMDB returns a 404 (Movie not found).
     """
-    with patch('routes.cast.requests.get') as mock_get:
+    with patch('tmdb.requests.Session.get') as mock_get:
         # Configure the mock to simulate a 404 from TMDB
         mock_response = Mock()
         mock_response.status_code = 404
@@ -96,7 +102,7 @@ def test_get_movie_cast_tmdb_500(client):
     """
     Test how the backend handles an internal server error from TMDB.
     """
-    with patch('routes.cast.requests.get') as mock_get:
+    with patch('tmdb.requests.Session.get') as mock_get:
         mock_response = Mock()
         mock_response.status_code = 500
         mock_response.json.return_value = {"status_message": "Internal Error"}
@@ -114,7 +120,7 @@ def test_get_movie_cast_connection_error(client):
     Test actual network failure (e.g., DNS failure, timeout) where
     requests.get raises an exception without a response object.
     """
-    with patch('routes.cast.requests.get') as mock_get:
+    with patch('tmdb.requests.Session.get') as mock_get:
         # Simulate a total network failure
         mock_get.side_effect = requests.exceptions.ConnectionError("Connection refused")
 
@@ -130,11 +136,11 @@ def test_get_movie_cast_empty_list(client):
     """
     Test a movie that exists but has no cast info.
     """
-    with patch('routes.cast.requests.get') as mock_get:
+    with patch('tmdb.requests.Session.get') as mock_get:
         mock_response = Mock()
         mock_response.status_code = 200
         # Return empty cast list
-        mock_response.json.return_value = {"id": 1, "cast": []}
+        mock_response.json.return_value = {"id": 1, "credits": {"cast": []}}
         mock_get.return_value = mock_response
 
         response = client.get('/cast/1')
@@ -142,4 +148,178 @@ def test_get_movie_cast_empty_list(client):
         assert response.status_code == 200
         data = response.get_json()
         assert isinstance(data, list)
-        assert len(data) == 0
\ No newline at end of file
+        assert len(data) == 0
+
+def test_get_movie_cast_caching(client):
+    """
+    The formatted cast is cached per movie: a second modal open of the same
+    movie does not call TMDB, another movie does.
+    """
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = MOCK_TMDB_CAST_RESPONSE
+        mock_get.return_value = mock_response
+
+        client.get('/cast/550')
+        response = client.get('/cast/550')
+        assert response.status_code == 200
+        assert len(response.get_json()) == 2
+        assert mock_get.call_count == 1
+
+        client.get('/cast/551')
+        assert mock_get.call_count == 2
+
+
+def test_get_movie_cast_stale_while_revalidate(client, app):
+    """
+    Past the soft TTL the stale list is returned right away and the refresh
+    happens in the background.
+    """
+    app.config['CAST_CACHE_SOFT_TTL'] = 0
+
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = MOCK_TMDB_CAST_RESPONSE
+        mock_get.return_value = mock_response
+
+        client.get('/cast/550')
+        assert mock_get.call_count == 1
+
+        # TMDB now has a smaller cast, but the stale one is served
+        refreshed = Mock()
+        refreshed.status_code = 200
+        refreshed.json.return_value = {"id": 550, "credits": {"cast": MOCK_CAST[:1]}}
+        mock_get.return_value = refreshed
+
+        response = client.get('/cast/550')
+        assert len(response.get_json()) == 2
+
+        caching.wait_for_refreshes(timeout=5)
+        assert mock_get.call_count == 2
+
+        app.config['CAST_CACHE_SOFT_TTL'] = 3600
+        response = client.get('/cast/550')
+        assert len(response.get_json()) == 1
+        assert mock_get.call_count == 2
+
+
+def test_get_movie_cast_failed_refresh_keeps_stale_copy(client, app):
+    app.config['CAST_CACHE_SOFT_TTL'] = 0
+
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = MOCK_TMDB_CAST_RESPONSE
+        mock_get.return_value = mock_response
+        client.get('/cast/550')
+
+        mock_get.side_effect = requests.exceptions.ConnectionError("Offline")
+        response = client.get('/cast/550')
+        caching.wait_for_refreshes(timeout=5)
+
+        assert response.status_code == 200
+        assert len(response.get_json()) == 2
+        assert len(client.get('/cast/550').get_json()) == 2
+
+
+def test_refresh_marker_lasts_one_upstream_call(app):
+    """A worker dying mid-refresh blocks the next refresh for one TMDB call at most, not a soft TTL"""
+    adds = []
+
+    with patch('caching.cache.add', side_effect=lambda key, value, timeout: adds.append((key, timeout)) or False):
+        caching.schedule_refresh("cast:550", Mock(), soft_ttl=86400, ttl=7 * 86400)
+
+    assert adds == [("cast:550:refreshing", math.ceil(default_lock_ttl()))]
+    assert adds[0][1] <= 61
+
+
+def credits_by_movie(casts):
+    """Session.get side effect answering /movie/<id> from {movie_id: cast or status}"""
+    def get(url, **kwargs):
+        movie_id = int(url.split('/movie/')[1].split('/')[0])
+        response = Mock()
+        value = casts[movie_id]
+        if isinstance(value, int):
+            response.status_code = value
+            response.json.return_value = {"status_message": "Error"}
+            response.raise_for_status.side_effect = requests.exceptions.HTTPError(response=response)
+        else:
+            response.status_code = 200
+            response.json.return_value = {"id": movie_id, "credits": {"cast": value}}
+        return response
+    return get
+
+
+def test_get_casts_batch_fetches_only_the_misses(client):
+    cast = MOCK_CAST
+
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_get.side_effect = credits_by_movie({550: cast, 551: cast[:1], 552: []})
+        client.get('/cast/550')
+        assert mock_get.call_count == 1
+
+        response = client.get('/cast?ids=550,551,552,551')
+
+        assert response.status_code == 200
+        data = response.get_json()
+        assert list(data) == ['550', '551', '552']
+        assert [member['name'] for member in data['550']] == ["Edward Norton", "Brad Pitt"]
+        assert len(data['551']) == 1 and data['552'] == []
+        # 550 came from the cache
+        assert mock_get.call_count == 3
+
+        # the batch filled the same entries as /cast/<id>
+        assert len(client.get('/cast/551').get_json()) == 1
+        assert client.get('/cast?ids=552,551').status_code == 200
+        assert mock_get.call_count == 3
+
+
+def test_get_casts_limit_keeps_top_billed(client):
+    cast = list(reversed(MOCK_CAST))
+
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_get.side_effect = credits_by_movie({550: cast})
+
+        data = client.get('/cast?ids=550&limit=1').get_json()
+        assert [member['name'] for member in data['550']] == ["Edward Norton"]
+
+        # the cached entry keeps the whole cast
+        assert len(client.get('/cast?ids=550').get_json()['550']) == 2
+
+
+def test_get_casts_unknown_movie_is_null(client):
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_get.side_effect = credits_by_movie({550: MOCK_CAST, 999: 404})
+
+        response = client.get('/cast?ids=550,999')
+        assert response.status_code == 200
+        assert response.get_json()['999'] is None
+        assert len(response.get_json()['550']) == 2
+
+
+def test_get_casts_upstream_failure(client):
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_get.side_effect = credits_by_movie({550: MOCK_CAST, 551: 500})
+
+        # the cast that loaded is kept, the failed movie says so
+        response = client.get('/cast?ids=550,551')
+        assert response.status_code == 200
+        data = response.get_json()
+        assert len(data['550']) == 2
+        assert data['551'] == {'error': 'Failed to fetch cast from TMDB'}
+
+        response = client.get('/cast?ids=551')
+        assert response.status_code == 502
+        assert response.get_json()['error'] == 'Failed to fetch cast from TMDB'
+
+
+@pytest.mark.parametrize('query', ['', '?ids=', '?ids=1,abc', '?ids=0', '?ids=1&limit=0', '?ids=1&limit=x'])
+def test_get_casts_invalid_parameters(client, query):
+    assert client.get(f'/cast{query}').status_code == 400
+
+
+def test_get_casts_too_many_ids(client, app):
+    app.config['CAST_BATCH_MAX_IDS'] = 2
+    assert client.get('/cast?ids=1,2,3').status_code == 400
@@ -1,4 +1,3 @@
-import pytest
 from unittest.mock import patch, Mock
 import requests
 
@@ -23,8 +22,8 @@ def test_get_genres_success(client):
     Test that the endpoint correctly fetches genres from TMDB
     and returns the list.
     """
-    # Patch requests.get inside the routes.genres module
-    with patch('routes.genres.requests.get') as mock_get:
+    # Patch the pooled session of the TMDB gateway
+    with patch('tmdb.requests.Session.get') as mock_get:
         # Configure the mock to return success
         mock_response = Mock()
         mock_response.status_code = 200
@@ -53,7 +52,7 @@ def test_get_genres_caching(client):
     Test that the second call to the endpoint does NOT hit the API
     (verifies that @cache.cached is working).
     """
-    with patch('routes.genres.requests.get') as mock_get:
+    with patch('tmdb.requests.Session.get') as mock_get:
         mock_response = Mock()
         mock_response.status_code = 200
         mock_response.json.return_value = MOCK_GENRES_RESPONSE
@@ -74,7 +73,7 @@ def test_get_genres_tmdb_error(client):
     """
     Test handling of TMDB API errors (e.g., 401 Unauthorized, 500 Server Error).
     """
-    with patch('routes.genres.requests.get') as mock_get:
+    with patch('tmdb.requests.Session.get') as mock_get:
         mock_response = Mock()
         mock_response.status_code = 401
         mock_response.json.return_value = {"status_message": "Invalid API key"}
@@ -95,7 +94,7 @@ def test_get_genres_connection_error(client):
     """
     Test handling of network failures (e.g., DNS issues).
     """
-    with patch('routes.genres.requests.get') as mock_get:
+    with patch('tmdb.requests.Session.get') as mock_get:
         # Simulate a crash in the requests library
         mock_get.side_effect = requests.exceptions.ConnectionError("TMDB Unreachable")
 
@@ -103,4 +102,24 @@ def test_get_genres_connection_error(client):
 
         assert response.status_code == 502
         data = response.get_json()
-        assert data['error'] == 'Failed to fetch genres from TMDB'
\ No newline at end of file
+        assert data['error'] == 'Failed to fetch genres from TMDB'
+
+def test_get_genres_etag_and_not_modified(client):
+    """A client that has the current list gets a 304 without body, and no TMDB call."""
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = MOCK_GENRES_RESPONSE
+        mock_get.return_value = mock_response
+
+        first = client.get('/genres/')
+        etag = first.headers['ETag']
+        second = client.get('/genres/', headers={'If-None-Match': etag})
+
+        assert mock_get.call_count == 1
+
+    assert first.status_code == 200 and etag.startswith('"')
+    assert second.status_code == 304
+    assert second.data == b''
+    assert second.headers['ETag'] == etag
+    assert client.get('/genres/', headers={'If-None-Match': '"other"'}).status_code == 200
@@ -0,0 +1,44 @@
+import gc
+import importlib.util
+import os
+from unittest.mock import Mock, patch
+from extensions import db
+
+CONF_PATH = os.path.join(os.path.dirname(__file__), '..', 'gunicorn.conf.py')
+
+
+def load_conf(**env):
+    with patch.dict(os.environ, env):
+        spec = importlib.util.spec_from_file_location('gunicorn_conf', CONF_PATH)
+        conf = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(conf)
+    return conf
+
+
+def test_worker_class_and_threads_from_environment():
+    conf = load_conf(GUNICORN_WORKER_CLASS='gthread', GUNICORN_THREADS='4', WEB_CONCURRENCY='3')
+    assert (conf.worker_class, conf.threads, conf.workers) == ('gthread', 4, 3)
+    assert conf.preload_app is True
+
+    conf = load_conf(GUNICORN_WORKER_CLASS='sync')
+    assert conf.threads == 1
+
+
+def test_when_ready_freezes_the_preloaded_objects():
+    conf = load_conf()
+    try:
+        conf.when_ready(Mock())
+        assert gc.get_freeze_count() > 0
+    finally:
+        gc.unfreeze()
+
+
+def test_post_fork_forgets_inherited_connections(app):
+    conf = load_conf(GUNICORN_WORKER_CLASS='sync')
+    server = Mock()
+    server.app.wsgi.return_value = app
+
+    with patch.object(db.engine, 'dispose') as dispose:
+        conf.post_fork(server, Mock())
+
+    dispose.assert_called_once_with(close=False)
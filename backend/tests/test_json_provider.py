@@ -0,0 +1,70 @@
+import json
+from datetime import datetime
+from unittest.mock import patch, Mock
+import msgpack
+import pytest
+import json_provider
+
+PAYLOAD = {"results": [{"tmdb_id": 603, "title": "Matrix – Reloaded", "popularity": 1.5, "genre_ids": [28]}], "page": 1, "total_pages": None}
+
+
+def test_same_data_as_the_json_module(app):
+    body = app.json.dumps(PAYLOAD)
+
+    assert json.loads(body) == PAYLOAD
+    assert app.json.loads(body) == PAYLOAD
+
+
+def test_types_of_the_default_provider(app):
+    # int keys as strings, dates as HTTP dates, like Flask's provider
+    data = {1: datetime(2026, 1, 2, 3, 4, 5)}
+
+    assert json.loads(app.json.dumps(data)) == {"1": "Fri, 02 Jan 2026 03:04:05 GMT"}
+    assert json.loads(app.json.dumps(2 ** 70)) == 2 ** 70
+
+
+def test_json_module_without_orjson(app):
+    with patch.object(json_provider, 'orjson', None):
+        assert json.loads(app.json.dumps(PAYLOAD)) == PAYLOAD
+        with app.test_request_context():
+            assert json.loads(app.json.response(PAYLOAD).get_data()) == PAYLOAD
+
+
+def mock_genres(mock_get):
+    mock_response = Mock()
+    mock_response.status_code = 200
+    mock_response.json.return_value = {"genres": [{"id": 28, "name": "Action"}]}
+    mock_get.return_value = mock_response
+
+
+@pytest.mark.parametrize('accept', [None, '*/*', 'application/json, application/msgpack;q=0.5'])
+def test_json_unless_msgpack_is_preferred(client, accept):
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_genres(mock_get)
+        response = client.get('/genres/', headers={'Accept': accept} if accept else {})
+
+    assert response.mimetype == 'application/json'
+    assert response.get_json() == [{"id": 28, "name": "Action"}]
+    assert 'Accept' in response.headers['Vary']
+
+
+def test_msgpack_negotiation(client):
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_genres(mock_get)
+        as_json = client.get('/genres/')
+        as_msgpack = client.get('/genres/', headers={'Accept': 'application/msgpack'})
+
+    assert as_msgpack.mimetype == 'application/msgpack'
+    assert msgpack.unpackb(as_msgpack.data) == [{"id": 28, "name": "Action"}]
+    # another representation, another strong ETag (that still validates the content)
+    assert as_msgpack.headers['ETag'] != as_json.headers['ETag']
+    revalidated = client.get('/genres/', headers={'Accept': 'application/msgpack', 'If-None-Match': as_msgpack.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert revalidated.headers['ETag'] == as_msgpack.headers['ETag']
+    # a JSON client with the msgpack tag gets the JSON body
+    assert client.get('/genres/', headers={'If-None-Match': as_msgpack.headers['ETag']}).status_code == 200
+
+    # errors too
+    error = client.get('/movies/search', headers={'Accept': 'application/msgpack'})
+    assert error.status_code == 400
+    assert msgpack.unpackb(error.data) == {'error': 'Query parameter is required'}
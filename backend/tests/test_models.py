@@ -1,4 +1,9 @@
-from models import User, Movie, Rating
+import pytest
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from models import db, User, Movie, Rating
+from routes.review import user_ratings_page_query, user_rating
 
 # test representation that looks ugly on terminal if it is not made
 def test_models_repr():
@@ -11,4 +16,46 @@ def test_models_repr():
     assert repr(movie) == '<Movie Inception>'
 
     rating = Rating(score=10)
-    assert repr(rating) == '<Rating 10>'
\ No newline at end of file
+    assert repr(rating) == '<Rating 10>'
+
+# query plans of the ratings hot paths: they must use the indexes, not scan the table
+def explain_statement(statement):
+    """Plan of a statement built by the app, compiled as it is sent to the database"""
+    compiled = statement.compile(dialect=db.engine.dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    rows = db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).fetchall()
+    return " ".join(row[-1] for row in rows)
+
+def test_rating_lookup_uses_unique_index(app):
+    """Lookup done by update/delete_rating."""
+    plan = explain_statement(select(Rating.id).where(*user_rating(1, 550)))
+
+    assert "ix_ratings_user_id_movie_id" in plan
+    assert "SCAN ratings" not in plan
+
+def test_user_ratings_keyset_page_uses_index(app):
+    """Keyset pages of GET /reviews/ratings, the statement of the route."""
+    first = explain_statement(user_ratings_page_query(1, 50, None).statement)
+    next_page = explain_statement(user_ratings_page_query(1, 50, (datetime(2026, 1, 1), 5)).statement)
+
+    for plan in (first, next_page):
+        assert "ix_ratings_user_id_created_at" in plan
+        assert "SCAN ratings" not in plan
+        # ORDER BY created_at, id comes from the index
+        assert "TEMP B-TREE" not in plan
+    # the cursor seeks into the index rather than filtering the user's whole list
+    assert "created_at>?" in next_page
+
+def test_duplicate_rating_rejected_by_database(app):
+    user = User(email="dup@test.com", password_hash="x")
+    movie = Movie(tmdb_id=1, title="Dup")
+    db.session.add_all([user, movie])
+    db.session.commit()
+
+    db.session.add_all([
+        Rating(user_id=user.id, movie_id=movie.id, score=1),
+        Rating(user_id=user.id, movie_id=movie.id, score=2)
+    ])
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+    db.session.rollback()
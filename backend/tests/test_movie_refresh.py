@@ -0,0 +1,167 @@
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import patch, Mock
+import requests
+from sqlalchemy import event
+from extensions import cache
+from models import db, Movie
+from movie_refresh import (
+    get_queue, enqueue_stale, refresh_batch, drain, run_worker, Pacer, RefreshStats, RedisQueue, STATS_KEY
+)
+
+TMDB_MOVIES = {
+    550: {"id": 550, "title": "Fight Club", "poster_path": "/fight.jpg", "overview": "An insomniac office worker...",
+          "release_date": "1999-10-15", "genres": [{"id": 18, "name": "Drama"}], "popularity": 61.4},
+    551: {"id": 551, "title": "The Poseidon Adventure", "poster_path": None, "overview": "",
+          "release_date": "1972-12-13", "genres": [{"id": 12, "name": "Adventure"}], "popularity": 9.1},
+}
+
+
+def tmdb_movies(url, **kwargs):
+    """Session.get side effect: TMDB_MOVIES by id, 404 for the others"""
+    tmdb_id = int(url.rsplit('/', 1)[1])
+    response = Mock()
+    if tmdb_id in TMDB_MOVIES:
+        response.status_code = 200
+        response.json.return_value = TMDB_MOVIES[tmdb_id]
+    else:
+        response.status_code = 404
+        response.json.return_value = {"status_message": "The resource you requested could not be found."}
+        response.raise_for_status.side_effect = requests.exceptions.HTTPError(response=response)
+    return response
+
+
+@pytest.fixture
+def queue(app):
+    queue = get_queue()
+    queue.clear()
+    yield queue
+    queue.clear()
+
+
+@pytest.fixture
+def movies(app):
+    """Stored as clients sent them, plus one refreshed recently"""
+    fresh = datetime.utcnow() - timedelta(days=1)
+    old = datetime.utcnow() - timedelta(days=60)
+    rows = [
+        Movie(id=1, tmdb_id=550, title="fight club", poster_path=None),
+        Movie(id=2, tmdb_id=551, title="Poseidon", overview="old", refreshed_at=old),
+        Movie(id=3, tmdb_id=999, title="Gone", refreshed_at=None),
+        Movie(id=4, tmdb_id=552, title="Fresh", refreshed_at=fresh),
+    ]
+    db.session.add_all(rows)
+    db.session.commit()
+    return rows
+
+
+def test_stale_movies_are_queued_once(queue, movies):
+    assert enqueue_stale(queue) == 3
+    assert enqueue_stale(queue) == 0
+    assert queue.size() == 3
+    # never refreshed first
+    assert queue.pop(10) == [1, 3, 2]
+
+
+def test_refresh_command_updates_the_stale_movies(app, queue, movies):
+    with patch('tmdb.requests.Session.get', side_effect=tmdb_movies):
+        result = app.test_cli_runner().invoke(args=['movies', 'refresh'])
+
+    assert result.exit_code == 0, result.output
+    assert 'Queued 3 stale movies' in result.output
+    assert 'Done: 2 refreshed, 1 not found on TMDB, 0 errors' in result.output
+    assert queue.size() == 0
+
+    db.session.expire_all()
+    fight_club = db.session.get(Movie, 1)
+    assert fight_club.title == "Fight Club"
+    assert fight_club.poster_path == "https://image.tmdb.org/t/p/w500/fight.jpg"
+    assert fight_club.release_date == datetime(1999, 10, 15)
+    assert fight_club.genre_ids == [18] and fight_club.refreshed_at is not None
+    assert db.session.get(Movie, 2).title == "The Poseidon Adventure"
+
+    # not on TMDB anymore: kept as is, not stale for a while
+    gone = db.session.get(Movie, 3)
+    assert gone.title == "Gone" and gone.refreshed_at is not None
+    assert db.session.get(Movie, 4).title == "Fresh"
+
+    status = app.test_cli_runner().invoke(args=['movies', 'status'])
+    assert 'Stale movies: 0' in status.output
+    assert '2 refreshed' in status.output
+
+
+def test_batch_is_written_with_one_update(app, queue, movies):
+    updates = []
+
+    def count_updates(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith('UPDATE movies'):
+            updates.append(executemany)
+
+    event.listen(db.engine, 'before_cursor_execute', count_updates)
+    try:
+        with patch('tmdb.requests.Session.get', side_effect=tmdb_movies):
+            counts = refresh_batch([1, 2], Pacer(0))
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count_updates)
+
+    assert counts == {'refreshed': 2, 'not_found': 0, 'errors': 0}
+    assert updates == [True]
+
+
+def test_upstream_errors_leave_movies_stale(app, queue, movies):
+    enqueue_stale(queue)
+
+    with patch('tmdb.requests.Session.get', side_effect=requests.exceptions.ConnectionError("Offline")):
+        stats = drain(queue, RefreshStats(), log=lambda line: None)
+
+    assert (stats.refreshed, stats.errors, stats.batches) == (0, 3, 1)
+    assert cache.get(STATS_KEY)['errors'] == 3
+    # the next scan queues them again
+    assert enqueue_stale(queue) == 3
+
+
+def test_pacer_spaces_the_calls():
+    sleeps = []
+    pacer = Pacer(rate=4)
+
+    with patch('movie_refresh.time.sleep', side_effect=sleeps.append), \
+         patch('movie_refresh.time.monotonic', return_value=100.0):
+        pacer.wait()
+        pacer.wait()
+
+    assert sleeps == [0.25]
+
+
+def test_pacer_waits_for_the_tmdb_budget():
+    sleeps = []
+
+    with patch('movie_refresh.time.sleep', side_effect=sleeps.append), \
+         patch('movie_refresh.tmdb.budget', side_effect=[0, 0, 5]):
+        Pacer(rate=0).wait()
+
+    assert sleeps == [0.25, 0.25]
+
+
+def test_worker_scans_once_per_interval(app, queue, movies):
+    rounds = iter([False, False, True])
+
+    with patch('tmdb.requests.Session.get', side_effect=tmdb_movies), patch('movie_refresh.time.sleep'):
+        lines = []
+        run_worker(interval=3600, log=lines.append, should_stop=lambda: next(rounds))
+
+    # a single scan for the two rounds, and the queue was worked
+    assert [line for line in lines if line.startswith('Queued')] == ['Queued 3 stale movies, backlog 3']
+    assert queue.size() == 0
+
+
+def test_redis_queue_commands():
+    client = Mock()
+    client.sadd.return_value = 2
+    client.spop.return_value = [b'1', b'3']
+    queue = RedisQueue(client)
+
+    assert queue.push([1, 3]) == 2
+    assert queue.push([]) == 0
+    assert queue.pop(2) == [1, 3]
+    client.sadd.assert_called_once_with('movies:refresh:queue', 1, 3)
+    client.spop.assert_called_once_with('movies:refresh:queue', 2)
@@ -1,6 +1,16 @@
-import pytest
+import gzip
+import json
+import threading
+from datetime import datetime
 from unittest.mock import patch, Mock
 import requests
+from extensions import cache
+from models import db, Movie
+from catalog import wait_for_mirrors, search_local, schedule_mirror
+import http_cache
+import caching
+from extensions import tmdb
+from routes.movies import wait_for_prefetches, search_cache_key, search_page_key
 
 MOCK_SEARCH_RESULTS = {
     "page": 1,
@@ -44,7 +54,7 @@ def test_search_movies_success(client):
     """
     Test a basic successful search. Verifies data formatting.
     """
-    with patch('routes.movies.requests.get') as mock_get:
+    with patch('tmdb.requests.Session.get') as mock_get:
         mock_response = Mock()
         mock_response.status_code = 200
         mock_response.json.return_value = MOCK_SEARCH_RESULTS
@@ -74,7 +84,7 @@ def test_search_movies_with_year_param(client):
     Test that passing 'year' in the URL correctly adds 'primary_release_year'
     to the TMDB API parameters.
     """
-    with patch('routes.movies.requests.get') as mock_get:
+    with patch('tmdb.requests.Session.get') as mock_get:
         mock_response = Mock()
         mock_response.status_code = 200
         mock_response.json.return_value = {"results": [], "page": 1, "total_pages": 1}
@@ -96,7 +106,7 @@ def test_search_movies_filter_by_genre(client):
     We request Genre ID 28 (Action). 
     Movie 101 has it (Keep). Movie 102 does not (Discard).
     """
-    with patch('routes.movies.requests.get') as mock_get:
+    with patch('tmdb.requests.Session.get') as mock_get:
         mock_response = Mock()
         mock_response.status_code = 200
         mock_response.json.return_value = MOCK_SEARCH_RESULTS
@@ -119,7 +129,7 @@ def test_search_movies_tmdb_error_response(client):
     """
     Test when TMDB returns a specific error (e.g., 422 Validation Failed).
     """
-    with patch('routes.movies.requests.get') as mock_get:
+    with patch('tmdb.requests.Session.get') as mock_get:
         mock_response = Mock()
         mock_response.status_code = 422
         mock_response.json.return_value = {"errors": ["query must be provided"]}
@@ -138,7 +148,7 @@ def test_search_movies_connection_failure(client):
     """
     Test a total network failure (ConnectionError).
     """
-    with patch('routes.movies.requests.get') as mock_get:
+    with patch('tmdb.requests.Session.get') as mock_get:
         mock_get.side_effect = requests.exceptions.ConnectionError("Offline")
 
         response = client.get('/movies/search?query=Fail')
@@ -152,7 +162,7 @@ def test_search_movies_caching(client):
     Test that repeated searches for the SAME query use the cache,
     but different queries trigger a new API call.
     """
-    with patch('routes.movies.requests.get') as mock_get:
+    with patch('tmdb.requests.Session.get') as mock_get:
         # Setup the mock
         mock_response = Mock()
         mock_response.status_code = 200
@@ -172,4 +182,551 @@ def test_search_movies_caching(client):
         # 3. Third Search: "Superman" (Different Query) -> Cache Miss -> Hits API again
         # This confirms that 'query_string=True' is working correctly
         client.get('/movies/search?query=Superman')
-        assert mock_get.call_count == 2  # Count goes up to 2
\ No newline at end of file
+        assert mock_get.call_count == 2  # Count goes up to 2
+
+# ----------------------------------------------------------------------
+# Filled pages (limit / cursor)
+# ----------------------------------------------------------------------
+
+def make_paged_search(total_pages, per_page=4):
+    """TMDB mock where only even movie ids are Action (28)"""
+    def fake_get(url, params=None, **kwargs):
+        page = params['page']
+        response = Mock()
+        response.status_code = 200
+        response.json.return_value = {
+            "page": page,
+            "total_pages": total_pages,
+            "results": [
+                {"id": movie_id, "title": f"Movie {movie_id}", "genre_ids": [28] if movie_id % 2 == 0 else [18]}
+                for movie_id in range((page - 1) * per_page + 1, page * per_page + 1)
+            ]
+        }
+        return response
+    return fake_get
+
+
+def test_search_filled_page_reads_several_upstream_pages(client):
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_get.side_effect = make_paged_search(total_pages=5)
+
+        response = client.get('/movies/search?query=Batman&genre=28&limit=5')
+
+        assert response.status_code == 200
+        data = response.get_json()
+        # 2 matches per upstream page: pages 1, 2 and the first match of page 3
+        assert [movie['tmdb_id'] for movie in data['results']] == [2, 4, 6, 8, 10]
+        assert data['total_pages'] == 5
+        assert data['next_cursor']
+        # page 1 alone (learns total_pages), then pages 2-5 in one concurrent batch
+        assert mock_get.call_count == 5
+
+        # the next logical page starts right after movie 10
+        response = client.get(f"/movies/search?query=Batman&genre=28&limit=5&cursor={data['next_cursor']}")
+        data = response.get_json()
+        assert [movie['tmdb_id'] for movie in data['results']] == [12, 14, 16, 18, 20]
+        assert data['next_cursor'] is None
+        # every upstream page came from the cache
+        assert mock_get.call_count == 5
+
+
+def test_search_filled_page_reuses_cached_upstream_pages(client):
+    """Different genre filters of the same search share the raw TMDB pages."""
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_get.side_effect = make_paged_search(total_pages=2)
+
+        client.get('/movies/search?query=Batman&genre=28&limit=10')
+        assert mock_get.call_count == 2
+
+        response = client.get('/movies/search?query=Batman&genre=18&limit=10')
+        assert [movie['tmdb_id'] for movie in response.get_json()['results']] == [1, 3, 5, 7]
+        assert mock_get.call_count == 2
+
+
+def test_search_filled_page_bounds_upstream_pages(client, app):
+    app.config['SEARCH_FILL_MAX_PAGES'] = 2
+
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_get.side_effect = make_paged_search(total_pages=50)
+
+        data = client.get('/movies/search?query=Batman&genre=28&limit=20').get_json()
+
+        # partial page, the cursor continues on page 3
+        assert len(data['results']) == 4
+        assert mock_get.call_count == 2
+        assert data['next_cursor']
+
+
+def test_search_filled_page_bad_parameters(client):
+    assert client.get('/movies/search?query=Batman&limit=0').status_code == 400
+    assert client.get('/movies/search?query=Batman&limit=1000').status_code == 400
+
+    response = client.get('/movies/search?query=Batman&cursor=not-a-cursor')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid cursor'
+
+
+def test_search_filled_page_tmdb_failure(client):
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_get.side_effect = requests.exceptions.ConnectionError("Offline")
+
+        response = client.get('/movies/search?query=Batman&genre=28&limit=5')
+
+        assert response.status_code == 502
+
+# ----------------------------------------------------------------------
+# Local catalog
+# ----------------------------------------------------------------------
+
+CATALOG_SEARCH_RESULTS = {
+    **MOCK_SEARCH_RESULTS,
+    "total_pages": 1,
+    "total_results": 2,
+    "results": [{**item, "popularity": 50.0 - i} for i, item in enumerate(MOCK_SEARCH_RESULTS["results"])]
+}
+
+def mock_tmdb_search(mock_get, data):
+    mock_response = Mock()
+    mock_response.status_code = 200
+    mock_response.json.return_value = data
+    mock_get.return_value = mock_response
+
+def expire_search(query, page=1, genre_id=None):
+    """Drops the cached view and TMDB page of a search, as when they expired"""
+    cache.delete(search_cache_key(query, page, None, genre_id))
+    cache.delete(search_page_key(query, page, None))
+
+def test_search_results_are_mirrored_into_catalog(client, app):
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_tmdb_search(mock_get, CATALOG_SEARCH_RESULTS)
+        client.get('/movies/search?query=Batman')
+
+    wait_for_mirrors()
+    with app.app_context():
+        movie = Movie.query.filter_by(tmdb_id=101).one()
+        assert movie.title == "Batman Begins"
+        assert movie.genre_ids == [28, 80]
+        assert movie.popularity == 50.0
+        assert movie.poster_path == "https://image.tmdb.org/t/p/w500/batman.jpg"
+        assert movie.release_date == datetime(2005, 6, 15)
+
+def test_mirror_queue_is_bounded(app):
+    gate = threading.Event()
+    movies = [{"tmdb_id": 101, "title": "Batman Begins"}]
+
+    with app.app_context(), patch.dict(app.config, {'CATALOG_MIRROR_MAX_PENDING': 2}), \
+         patch('catalog._mirror', side_effect=lambda app, movies: gate.wait(5)) as mirror:
+        scheduled = [schedule_mirror(movies) for _ in range(4)]
+        gate.set()
+        wait_for_mirrors()
+
+    # the worker is busy with the first, the second waits, the others are dropped
+    assert [future is not None for future in scheduled] == [True, True, False, False]
+    assert mirror.call_count == 2
+
+def test_search_answers_from_catalog_when_recall_is_enough(client):
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_tmdb_search(mock_get, CATALOG_SEARCH_RESULTS)
+        first = client.get('/movies/search?query=Batman').get_json()
+        wait_for_mirrors()
+
+        # the cached pages expired, the catalog has both results TMDB returned
+        expire_search("Batman")
+        second = client.get('/movies/search?query=Batman')
+        assert mock_get.call_count == 1
+
+        assert second.status_code == 200
+        assert second.get_json() == first
+
+        expire_search("Batman", genre_id="28")
+        filtered = client.get('/movies/search?query=Batman&genre=28').get_json()
+        assert [movie['tmdb_id'] for movie in filtered['results']] == [101]
+        assert mock_get.call_count == 1
+
+def test_search_falls_back_to_tmdb_when_recall_is_low(client, app):
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_tmdb_search(mock_get, CATALOG_SEARCH_RESULTS)
+        client.get('/movies/search?query=Batman')
+        wait_for_mirrors()
+
+    with app.app_context():
+        # one of the two results TMDB returned is left
+        db.session.delete(Movie.query.filter_by(tmdb_id=102).one())
+        db.session.commit()
+
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_tmdb_search(mock_get, CATALOG_SEARCH_RESULTS)
+        expire_search("Batman")
+        client.get('/movies/search?query=Batman')
+        assert mock_get.call_count == 1
+
+    with patch('tmdb.requests.Session.get') as mock_get, patch.dict(app.config, {'SEARCH_LOCAL_FIRST': False}):
+        mock_tmdb_search(mock_get, CATALOG_SEARCH_RESULTS)
+        wait_for_mirrors()
+        expire_search("Batman")
+
+        client.get('/movies/search?query=Batman')
+        assert mock_get.call_count == 1
+
+def test_local_recall_comes_from_the_title_index(client, app):
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_tmdb_search(mock_get, CATALOG_SEARCH_RESULTS)
+        client.get('/movies/search?query=Batman')
+        wait_for_mirrors()
+
+        with app.app_context():
+            # still stored, but its title doesn't match the query anymore (refreshed from TMDB)
+            Movie.query.filter_by(tmdb_id=102).one().title = "The Dark Knight"
+            db.session.commit()
+
+        expire_search("Batman")
+        client.get('/movies/search?query=Batman')
+        assert mock_get.call_count == 2
+
+def test_broader_search_is_not_answered_from_a_narrower_one(client):
+    """'batman' prefix-matches everything 'batman begins' mirrored, but TMDB returns more for it"""
+    narrower = {**CATALOG_SEARCH_RESULTS, "total_results": 1, "results": CATALOG_SEARCH_RESULTS["results"][:1]}
+    broader = {
+        **CATALOG_SEARCH_RESULTS,
+        "total_results": 3,
+        "results": CATALOG_SEARCH_RESULTS["results"] + [
+            {"id": 103, "title": "Batman Returns", "genre_ids": [28], "release_date": "1992-06-19"}
+        ]
+    }
+
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_tmdb_search(mock_get, narrower)
+        client.get('/movies/search?query=Batman Begins')
+        mock_tmdb_search(mock_get, CATALOG_SEARCH_RESULTS)
+        client.get('/movies/search?query=Batman&year=2005')
+        wait_for_mirrors()
+
+        # never asked to TMDB: no reference, even though both stored titles match
+        mock_tmdb_search(mock_get, broader)
+        response = client.get('/movies/search?query=Batman').get_json()
+        assert mock_get.call_count == 3
+        assert [movie['tmdb_id'] for movie in response['results']] == [101, 102, 103]
+        wait_for_mirrors()
+
+        # asked before: 2 of its 3 results are stored, under the 0.8 recall
+        with client.application.app_context():
+            db.session.delete(Movie.query.filter_by(tmdb_id=103).one())
+            db.session.commit()
+        expire_search("Batman")
+        client.get('/movies/search?query=Batman')
+        assert mock_get.call_count == 4
+
+def test_search_page_sequence_keeps_its_source(client):
+    pages = {
+        1: {**CATALOG_SEARCH_RESULTS, "total_pages": 2},
+        2: {**CATALOG_SEARCH_RESULTS, "page": 2, "total_pages": 2, "results": [
+            {"id": 103, "title": "Batman Returns", "genre_ids": [28], "release_date": "1992-06-19"}
+        ]}
+    }
+
+    def tmdb_page(url, params=None, **kwargs):
+        response = Mock()
+        response.status_code = 200
+        response.json.return_value = pages[params['page']]
+        return response
+
+    with patch('tmdb.requests.Session.get', side_effect=tmdb_page) as mock_get:
+        client.get('/movies/search?query=Batman')
+        client.get('/movies/search?query=Batman&page=2')
+        wait_for_mirrors()
+        assert mock_get.call_count == 2
+
+        with client.application.app_context():
+            db.session.delete(Movie.query.filter_by(tmdb_id=102).one())
+            db.session.commit()
+
+        # page 1 isn't stored enough: the sequence goes to TMDB, page 2 too though it is stored
+        expire_search("Batman")
+        expire_search("Batman", page=2)
+        client.get('/movies/search?query=Batman')
+        client.get('/movies/search?query=Batman&page=2')
+        assert mock_get.call_count == 4
+        wait_for_mirrors()
+
+        # both stored again: the next sequence comes from the catalog
+        expire_search("Batman")
+        expire_search("Batman", page=2)
+        first = client.get('/movies/search?query=Batman').get_json()
+        second = client.get('/movies/search?query=Batman&page=2').get_json()
+        assert mock_get.call_count == 4
+        assert [movie['tmdb_id'] for movie in first['results'] + second['results']] == [101, 102, 103]
+
+def test_search_local_prefix_year_and_order(app):
+    with app.app_context():
+        db.session.add_all([
+            Movie(tmdb_id=1, title="The Matrix", release_date=datetime(1999, 3, 31), popularity=80),
+            Movie(tmdb_id=2, title="The Matrix Reloaded", release_date=datetime(2003, 5, 15), popularity=60),
+            Movie(tmdb_id=3, title="Matrimony", release_date=datetime(1999, 1, 1), popularity=99),
+            Movie(tmdb_id=4, title="Dark City", release_date=datetime(1998, 2, 27), popularity=40)
+        ])
+        db.session.commit()
+
+        movies, total = search_local("matri", None, 1)
+        assert total == 3
+        assert {movie.tmdb_id for movie in movies} == {1, 2, 3}
+
+        movies, total = search_local("the MATRIX!", "1999", 1)
+        assert [movie.tmdb_id for movie in movies] == [1] and total == 1
+
+        assert search_local("matrix", None, 2) == ([], 0)
+        assert search_local("  ", None, 1) is None
+
+# ----------------------------------------------------------------------
+# Cache keys
+# ----------------------------------------------------------------------
+
+def test_equivalent_searches_share_one_cache_entry(client):
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_tmdb_search(mock_get, MOCK_SEARCH_RESULTS)
+
+        for url in [
+            '/movies/search?query=Matrix',
+            '/movies/search?query=matrix%20',
+            '/movies/search?query=%20MATRIX&page=1',
+            '/movies/search?page=1&query=matrix&year=&genre=',
+        ]:
+            assert client.get(url).status_code == 200
+
+        assert mock_get.call_count == 1
+        assert mock_get.call_args.kwargs['params']['query'] == 'Matrix'
+        assert cache.get("search:page=1&query=matrix") is not None
+
+def test_genre_filters_share_the_tmdb_page(client):
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_tmdb_search(mock_get, MOCK_SEARCH_RESULTS)
+
+        all_genres = client.get('/movies/search?query=Batman').get_json()
+        action = client.get('/movies/search?query=Batman&genre=28').get_json()
+        scifi = client.get('/movies/search?genre=878&query=batman').get_json()
+
+        assert mock_get.call_count == 1
+        assert len(all_genres['results']) == 2
+        assert [movie['tmdb_id'] for movie in action['results']] == [101]
+        assert [movie['tmdb_id'] for movie in scifi['results']] == [102]
+
+def test_search_cache_key_is_canonical():
+    from routes.movies import search_cache_key
+
+    assert search_cache_key(" The  Matrix ", 1) == search_cache_key("the matrix", None, "", "")
+    assert search_cache_key("matrix", 2, "1999", "28") == "search:genre=28&page=2&query=matrix&year=1999"
+
+# ----------------------------------------------------------------------
+# Validators and compression
+# ----------------------------------------------------------------------
+
+def test_search_etag_survives_cache_and_catalog(client):
+    """Same page content, same ETag, whether it comes from the cache or the local catalog."""
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_tmdb_search(mock_get, CATALOG_SEARCH_RESULTS)
+        etag = client.get('/movies/search?query=Batman').headers['ETag']
+        wait_for_mirrors()
+
+        assert client.get('/movies/search?query=batman', headers={'If-None-Match': etag}).status_code == 304
+
+        expire_search("Batman")
+        from_catalog = client.get('/movies/search?query=Batman', headers={'If-None-Match': etag})
+        assert from_catalog.status_code == 304
+        assert mock_get.call_count == 1
+
+def test_filled_search_pages_have_etags(client):
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_tmdb_search(mock_get, CATALOG_SEARCH_RESULTS)
+        first = client.get('/movies/search?query=Batman&limit=5')
+        again = client.get('/movies/search?query=Batman&limit=5', headers={'If-None-Match': first.headers['ETag']})
+
+    assert again.status_code == 304
+
+def test_large_bodies_are_compressed(client, app):
+    app.config['COMPRESS_MIN_BYTES'] = 100
+
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_tmdb_search(mock_get, CATALOG_SEARCH_RESULTS)
+        plain = client.get('/movies/search?query=Batman')
+        gzipped = client.get('/movies/search?query=Batman', headers={'Accept-Encoding': 'gzip'})
+        brotli_body = client.get('/movies/search?query=Batman', headers={'Accept-Encoding': 'gzip, br'})
+
+    assert 'Content-Encoding' not in plain.headers
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(gzipped.data)) == plain.get_json()
+    assert 'Accept-Encoding' in gzipped.headers['Vary']
+    # one strong ETag per representation, each still validates the page
+    assert gzipped.headers['ETag'] == plain.headers['ETag'][:-1] + '-gzip"'
+    revalidated = client.get('/movies/search?query=Batman', headers={'Accept-Encoding': 'gzip', 'If-None-Match': gzipped.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert revalidated.headers['ETag'] == gzipped.headers['ETag']
+    # not the tag of the uncompressed body
+    assert client.get('/movies/search?query=Batman', headers={'If-None-Match': gzipped.headers['ETag']}).status_code == 200
+
+    # the tag names the negotiated encoding even when the body is too small to compress
+    app.config['COMPRESS_MIN_BYTES'] = 100000
+    small = client.get('/movies/search?query=Batman', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in small.headers
+    assert small.headers['ETag'] == gzipped.headers['ETag']
+    app.config['COMPRESS_MIN_BYTES'] = 100
+
+    if http_cache.brotli:
+        assert brotli_body.headers['Content-Encoding'] == 'br'
+        assert json.loads(http_cache.brotli.decompress(brotli_body.data)) == plain.get_json()
+
+    app.config['COMPRESS_MIN_BYTES'] = 100000
+    assert 'Content-Encoding' not in client.get('/movies/search?query=Batman', headers={'Accept-Encoding': 'gzip'}).headers
+
+
+
+def mock_search_pages(mock_get):
+    """Every requested page answers with MOCK_SEARCH_RESULTS, numbered as asked"""
+    def get(url, params=None, **kwargs):
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {**MOCK_SEARCH_RESULTS, "page": params['page']}
+        return mock_response
+    mock_get.side_effect = get
+
+
+def test_next_search_page_is_prefetched(client, app):
+    app.config['SEARCH_PREFETCH_DEPTH'] = 2
+
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_search_pages(mock_get)
+
+        client.get('/movies/search?query=Batman&genre=28')
+        wait_for_prefetches(timeout=5)
+        assert sorted(call.kwargs['params']['page'] for call in mock_get.call_args_list) == [1, 2, 3]
+
+        # the scroll is served from the cache, and prefetches the page after the last one prefetched
+        response = client.get('/movies/search?query=Batman&genre=28&page=2')
+        assert response.get_json()['page'] == 2
+        wait_for_prefetches(timeout=5)
+        assert sorted(call.kwargs['params']['page'] for call in mock_get.call_args_list) == [1, 2, 3, 4]
+
+        # pending or cached pages aren't fetched twice
+        client.get('/movies/search?query=Batman&genre=28&page=2')
+        wait_for_prefetches(timeout=5)
+        assert mock_get.call_count == 4
+
+
+def test_prefetch_stops_at_the_last_page(client, app):
+    app.config['SEARCH_PREFETCH_DEPTH'] = 3
+
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_search_pages(mock_get)
+
+        client.get('/movies/search?query=Batman&page=4')
+        wait_for_prefetches(timeout=5)
+        # total_pages is 5
+        assert sorted(call.kwargs['params']['page'] for call in mock_get.call_args_list) == [4, 5]
+
+
+def test_prefetch_is_skipped_when_the_tmdb_budget_is_low(client, app):
+    app.config['SEARCH_PREFETCH_DEPTH'] = 1
+    app.config['SEARCH_PREFETCH_MIN_BUDGET'] = app.config['TMDB_RATE_LIMIT']
+
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_search_pages(mock_get)
+
+        client.get('/movies/search?query=Batman')
+        wait_for_prefetches(timeout=5)
+        assert mock_get.call_count == 1
+        assert tmdb.budget() == app.config['TMDB_RATE_LIMIT'] - 1
+
+
+MOCK_MOVIE_DETAILS = {
+    "id": 550,
+    "title": "Fight Club",
+    "poster_path": "/fight.jpg",
+    "runtime": 139,
+    "genres": [{"id": 18, "name": "Drama"}],
+    "credits": {"cast": [{"id": 819, "name": "Edward Norton", "order": 0}]},
+    "videos": {"results": [{"key": "qtRKdVHc-cE", "name": "Trailer", "site": "YouTube", "type": "Trailer"}]},
+    "similar": {"results": [{"id": 807, "title": "Se7en", "poster_path": None}]}
+}
+
+
+def mock_details(mock_get, data=MOCK_MOVIE_DETAILS):
+    mock_response = Mock()
+    mock_response.status_code = 200
+    mock_response.json.return_value = data
+    mock_get.return_value = mock_response
+
+
+def test_movie_details_in_one_upstream_call(client):
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_details(mock_get)
+
+        response = client.get('/movies/550')
+
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['title'] == "Fight Club" and data['runtime'] == 139
+        assert data['poster_path'] == "https://image.tmdb.org/t/p/w500/fight.jpg"
+        assert data['genres'] == [{"id": 18, "name": "Drama"}]
+        assert data['cast'][0]['name'] == "Edward Norton"
+        assert data['videos'][0]['key'] == "qtRKdVHc-cE"
+        assert [movie['tmdb_id'] for movie in data['similar']] == [807]
+
+        assert mock_get.call_count == 1
+        assert mock_get.call_args.kwargs['params']['append_to_response'] == "credits,videos,similar"
+
+        # the cast part was cached by the same call
+        assert client.get('/cast/550').get_json()[0]['name'] == "Edward Norton"
+        assert client.get('/movies/550').status_code == 200
+        assert mock_get.call_count == 1
+
+
+def test_cast_fill_serves_the_movie_details(client):
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_details(mock_get)
+
+        client.get('/cast/550')
+        response = client.get('/movies/550')
+
+        assert response.get_json()['runtime'] == 139
+        assert mock_get.call_count == 1
+
+
+def test_stale_movie_details_are_refreshed_once(client, app):
+    app.config['MOVIE_CACHE_SOFT_TTL'] = 0
+    app.config['CAST_CACHE_SOFT_TTL'] = 0
+
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_details(mock_get)
+        client.get('/movies/550')
+
+        mock_details(mock_get, {**MOCK_MOVIE_DETAILS, "runtime": 140})
+        assert client.get('/movies/550').get_json()['runtime'] == 139
+        caching.wait_for_refreshes(timeout=5)
+        assert mock_get.call_count == 2
+
+        app.config['MOVIE_CACHE_SOFT_TTL'] = 3600
+        app.config['CAST_CACHE_SOFT_TTL'] = 3600
+        assert client.get('/movies/550').get_json()['runtime'] == 140
+        assert mock_get.call_count == 2
+
+
+def test_movie_details_tmdb_404(client):
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_response = Mock()
+        mock_response.status_code = 404
+        mock_response.json.return_value = {"status_message": "The resource you requested could not be found."}
+        mock_response.raise_for_status.side_effect = requests.exceptions.HTTPError(response=mock_response)
+        mock_get.return_value = mock_response
+
+        response = client.get('/movies/999999999')
+
+        assert response.status_code == 404
+        assert "status_message" in response.get_json()
+
+
+def test_movie_details_connection_error(client):
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_get.side_effect = requests.exceptions.ConnectionError("Connection refused")
+
+        response = client.get('/movies/550')
+
+        assert response.status_code == 502
+        assert response.get_json()['error'] == 'Failed to fetch movie from TMDB'
@@ -1,6 +1,15 @@
 # tests/test_reviews.py
+import gzip
+import io
+import json
 import pytest
-from models import Movie, Rating, db
+from contextlib import contextmanager
+from unittest.mock import patch
+from sqlalchemy import event
+from models import Movie, Rating, MovieRatingStats, db
+from ratings_store import rebuild_rating_stats
+from catalog import schedule_mirror, wait_for_mirrors
+from query_budget import QueryBudgetExceeded
 
 # ==============================================================================
 # BASIC CRUD
@@ -217,6 +226,26 @@ def test_update_rating_missing_score_field(client, user1_auth):
     assert res.status_code == 400
     assert "New score is required" in res.get_json()['error']
 
+def test_scores_out_of_the_scale_are_rejected(client, user1_auth, app):
+    """Logic: a score is an integer from 1 to 10, the rating stats count it in its bucket."""
+    for score in ["abc", 1000, 0, 4.5, True]:
+        res = client.post('/reviews/ratings', json={"tmdb_id": 1, "score": score, "movie_data": {"title": "One"}}, headers=user1_auth)
+        assert res.status_code == 400
+        assert res.get_json()['error'] == 'Score must be an integer from 1 to 10'
+
+    client.post('/reviews/ratings', json={"tmdb_id": 1, "score": 7, "movie_data": {"title": "One"}}, headers=user1_auth)
+    for score in ["zz", 11]:
+        assert client.put('/reviews/ratings/1', json={"score": score}, headers=user1_auth).status_code == 400
+
+    rows = [{"tmdb_id": 2, "score": "12", "movie_data": {"title": "Two"}}, {"tmdb_id": 3, "score": "9", "movie_data": {"title": "Three"}}]
+    data = client.post('/reviews/ratings/bulk', json=rows, headers=user1_auth).get_json()
+    assert [r['status'] for r in data['results']] == ['error', 'created']
+    assert data['results'][0]['error'] == 'Score must be an integer from 1 to 10'
+
+    with app.app_context():
+        stats = MovieRatingStats.query.join(Movie).filter(Movie.tmdb_id == 1).one()
+        assert (stats.rating_count, stats.score_sum, stats.score_7) == (1, 7, 1)
+
 def test_update_rating_not_found_but_movie_exists(client, user1_auth, app):
     """
     Movie exists (e.g., added by someone else), but this user hasn't rated it yet.
@@ -295,4 +324,442 @@ def test_delete_rating_success(client, user1_auth, app):
         
         # Rating for User 1 should be gone
         rating = Rating.query.filter_by(user_id=1, movie_id=movie.id).first()
-        assert rating is None
\ No newline at end of file
+        assert rating is None
+# ==============================================================================
+# KEYSET PAGINATION
+# ==============================================================================
+
+def rate_movies(client, auth, tmdb_ids):
+    for tmdb_id in tmdb_ids:
+        client.post('/reviews/ratings', json={
+            "tmdb_id": tmdb_id,
+            "score": tmdb_id % 5 + 1,
+            "movie_data": {"title": f"Movie {tmdb_id}", "release_date": "2020-01-01"}
+        }, headers=auth)
+
+def test_get_ratings_keyset_pages(client, user1_auth, user2_auth):
+    """Walks all pages with the cursor: every rating exactly once, in creation order."""
+    rate_movies(client, user1_auth, range(1, 8))
+    rate_movies(client, user2_auth, [100])
+
+    seen = []
+    cursor = None
+    pages = 0
+    while True:
+        url = '/reviews/ratings?limit=3' + (f'&cursor={cursor}' if cursor else '')
+        res = client.get(url, headers=user1_auth)
+        assert res.status_code == 200
+        data = res.get_json()
+        seen += [item['movie']['tmdb_id'] for item in data['results']]
+        pages += 1
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+
+    assert seen == list(range(1, 8))
+    assert pages == 3
+
+def test_get_ratings_page_item_shape(client, user1_auth):
+    rate_movies(client, user1_auth, [42])
+
+    res = client.get('/reviews/ratings?limit=10', headers=user1_auth)
+    item = res.get_json()['results'][0]['movie']
+
+    assert item['tmdb_id'] == 42
+    assert item['title'] == "Movie 42"
+    assert item['release_date'] == "2020-01-01"
+    assert item['rating'] == 42 % 5 + 1
+    assert 'rating_id' in item
+
+def test_get_ratings_pagination_bad_parameters(client, user1_auth):
+    assert client.get('/reviews/ratings?limit=0', headers=user1_auth).status_code == 400
+
+    res = client.get('/reviews/ratings?cursor=garbage', headers=user1_auth)
+    assert res.status_code == 400
+    assert res.get_json()['error'] == 'Invalid cursor'
+
+def test_get_ratings_paginated_by_default_without_compat_flag(client, user1_auth, app):
+    app.config['RATINGS_UNPAGINATED_COMPAT'] = False
+    app.config['RATINGS_PAGE_DEFAULT_LIMIT'] = 2
+    rate_movies(client, user1_auth, [1, 2, 3])
+
+    data = client.get('/reviews/ratings', headers=user1_auth).get_json()
+
+    assert len(data['results']) == 2
+    assert data['next_cursor']
+
+# ==============================================================================
+# WRITE PATH ROUND TRIPS
+# ==============================================================================
+
+@contextmanager
+def count_statements(app):
+    """Collects the SQL statements sent to the database inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+def test_create_rating_is_three_statements(client, user1_auth, app):
+    """Movie upsert + rating insert + stats upsert, no lookups before them."""
+    payload = {"tmdb_id": 1234, "score": 4, "movie_data": {"title": "Upsert"}}
+
+    with count_statements(app) as statements:
+        res = client.post('/reviews/ratings', json=payload, headers=user1_auth)
+
+    assert res.status_code == 201
+    writes = [s for s in statements if s.lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE', 'SELECT'))]
+    assert len(writes) == 3
+    assert all('ON CONFLICT' in s for s in writes)
+
+def test_update_and_delete_statements(client, user1_auth, app):
+    """Update: locked read of the old score, UPDATE, stats UPDATE. Delete: DELETE RETURNING, stats UPDATE."""
+    client.post('/reviews/ratings', json={"tmdb_id": 77, "score": 1, "movie_data": {"title": "One"}}, headers=user1_auth)
+
+    with count_statements(app) as statements:
+        assert client.put('/reviews/ratings/77', json={"score": 3}, headers=user1_auth).status_code == 200
+        assert client.delete('/reviews/ratings/77', headers=user1_auth).status_code == 200
+
+    writes = [s for s in statements if s.lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE', 'SELECT'))]
+    assert len(writes) == 5
+
+def test_second_user_rating_same_new_movie(client, user1_auth, user2_auth, app):
+    """The movie insert of the second user is a no-op, not a unique violation."""
+    payload = {"tmdb_id": 31, "score": 5, "movie_data": {"title": "Shared", "release_date": "2001-01-01"}}
+
+    assert client.post('/reviews/ratings', json=payload, headers=user1_auth).status_code == 201
+    assert client.post('/reviews/ratings', json=payload, headers=user2_auth).status_code == 201
+
+    with app.app_context():
+        assert Movie.query.count() == 1
+        assert Rating.query.count() == 2
+
+def test_bad_date_ignored_when_movie_exists(client, user1_auth, app):
+    with app.app_context():
+        db.session.add(Movie(tmdb_id=32, title="Known"))
+        db.session.commit()
+
+    payload = {"tmdb_id": 32, "score": 5, "movie_data": {"title": "Known", "release_date": "31-12-2001"}}
+    assert client.post('/reviews/ratings', json=payload, headers=user1_auth).status_code == 201
+
+def test_create_rating_portable_fallback(client, user1_auth, app):
+    """Databases without ON CONFLICT go through the ORM version."""
+    payload = {"tmdb_id": 33, "score": 2, "movie_data": {"title": "Portable"}}
+
+    with patch('routes.review.upsert_insert', return_value=None):
+        assert client.post('/reviews/ratings', json={"tmdb_id": 34, "score": 2}, headers=user1_auth).status_code == 400
+        assert client.post('/reviews/ratings', json={**payload, "movie_data": {"title": "x", "release_date": "bad"}}, headers=user1_auth).status_code == 400
+        assert client.post('/reviews/ratings', json=payload, headers=user1_auth).status_code == 201
+        assert client.post('/reviews/ratings', json=payload, headers=user1_auth).status_code == 409
+
+    with app.app_context():
+        assert Rating.query.count() == 1
+
+# ==============================================================================
+# BULK IMPORT
+# ==============================================================================
+
+def test_bulk_import_json(client, user1_auth, app):
+    with app.app_context():
+        db.session.add(Movie(tmdb_id=2, title="Already stored"))
+        db.session.commit()
+
+    client.post('/reviews/ratings', json={"tmdb_id": 3, "score": 1, "movie_data": {"title": "Rated"}}, headers=user1_auth)
+
+    rows = [
+        {"tmdb_id": 1, "score": 5, "movie_data": {"title": "New", "release_date": "1999-03-31"}},
+        {"tmdb_id": 2, "score": 4},                          # movie exists, no data needed
+        {"tmdb_id": 3, "score": 2, "movie_data": {"title": "Rated"}},  # already rated
+        {"tmdb_id": 4, "score": 3},                          # unknown movie, no data
+        {"tmdb_id": 1, "score": 1},                          # duplicate in the import
+        {"tmdb_id": "x", "score": 1},
+        {"tmdb_id": 5, "score": 1, "movie_data": {"title": "Bad", "release_date": "31/03/1999"}}
+    ]
+    res = client.post('/reviews/ratings/bulk', json=rows, headers=user1_auth)
+
+    assert res.status_code == 200
+    data = res.get_json()
+    assert [r['status'] for r in data['results']] == ['created', 'created', 'exists', 'error', 'error', 'error', 'error']
+    assert data['created'] == 2 and data['exists'] == 1 and data['error'] == 4
+    assert data['results'][3]['error'] == 'Movie not found locally and no data provided to create it'
+    assert data['results'][4]['error'] == 'Duplicate tmdb_id in import'
+
+    with app.app_context():
+        assert Rating.query.filter_by(user_id=1).count() == 3
+        assert Rating.query.join(Movie).filter(Movie.tmdb_id == 3).first().score == 1  # untouched
+
+def test_bulk_import_csv_upload_in_batches(client, user1_auth, app):
+    app.config['BULK_IMPORT_BATCH_SIZE'] = 2
+    lines = ["tmdb_id,score,title,release_date,poster_path,backdrop_path,overview"]
+    lines += [f"{i},{i % 5 + 1},Movie {i},2001-01-0{i},,," for i in range(1, 6)]
+    upload = (io.BytesIO("\n".join(lines).encode()), 'letterboxd.csv')
+
+    res = client.post('/reviews/ratings/bulk', data={'file': upload}, headers=user1_auth,
+                      content_type='multipart/form-data')
+
+    assert res.status_code == 200
+    assert res.get_json()['created'] == 5
+
+    with app.app_context():
+        movie = Movie.query.filter_by(tmdb_id=3).first()
+        assert movie.title == "Movie 3"
+        assert movie.poster_path is None
+        assert movie.release_date.day == 3
+
+def test_bulk_import_csv_body(client, user1_auth):
+    body = "tmdb_id,score,title\n10,4,Ten\n"
+    res = client.post('/reviews/ratings/bulk', data=body, headers={**user1_auth, 'Content-Type': 'text/csv'})
+
+    assert res.status_code == 200
+    assert res.get_json()['results'] == [{'row': 1, 'tmdb_id': 10, 'status': 'created'}]
+
+def test_bulk_import_bad_requests(client, user1_auth, app):
+    assert client.post('/reviews/ratings/bulk', json={"tmdb_id": 1}, headers=user1_auth).status_code == 400
+
+    app.config['BULK_IMPORT_MAX_ROWS'] = 1
+    rows = [{"tmdb_id": 1, "score": 1}, {"tmdb_id": 2, "score": 1}]
+    assert client.post('/reviews/ratings/bulk', json=rows, headers=user1_auth).status_code == 413
+
+    upload = (io.BytesIO("tmdb_id,score,title\n1,4,Amélie\n".encode('latin-1')), 'ratings.csv')
+    res = client.post('/reviews/ratings/bulk', data={'file': upload}, headers=user1_auth,
+                      content_type='multipart/form-data')
+    assert res.status_code == 400
+    assert res.get_json()['error'] == 'CSV file must be UTF-8 encoded'
+
+def test_bulk_import_long_movie_fields(client, user1_auth, app):
+    rows = [
+        {"tmdb_id": 1, "score": 5, "movie_data": {"title": "T" * 300}},
+        {"tmdb_id": 2, "score": 5, "movie_data": {"title": "Poster", "poster_path": "https://x/" + "p" * 300}}
+    ]
+    data = client.post('/reviews/ratings/bulk', json=rows, headers=user1_auth).get_json()
+
+    # the title is cut to the column, a cut URL is refused for its row only
+    assert [r['status'] for r in data['results']] == ['created', 'error']
+    assert data['results'][1]['error'] == 'poster_path is longer than 255 characters'
+    with app.app_context():
+        assert Movie.query.filter_by(tmdb_id=1).one().title == "T" * 255
+
+# ==============================================================================
+# EXPORT
+# ==============================================================================
+
+def test_export_ndjson(client, user1_auth, user2_auth, app):
+    app.config['EXPORT_BATCH_SIZE'] = 2
+    rate_movies(client, user1_auth, [1, 2, 3, 4, 5])
+    rate_movies(client, user2_auth, [6])
+
+    res = client.get('/reviews/ratings/export', headers=user1_auth)
+
+    assert res.status_code == 200
+    assert res.is_streamed
+    assert res.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in res.get_data(as_text=True).splitlines()]
+    assert [row['tmdb_id'] for row in rows] == [1, 2, 3, 4, 5]
+    assert rows[0]['title'] == "Movie 1"
+    assert rows[0]['release_date'] == "2020-01-01"
+    assert rows[0]['rated_at']
+
+def test_export_csv_can_be_imported_back(client, user1_auth, user2_auth):
+    rate_movies(client, user1_auth, [1, 2, 3])
+
+    exported = client.get('/reviews/ratings/export?format=csv', headers=user1_auth).get_data(as_text=True)
+    assert exported.splitlines()[0] == "tmdb_id,score,title,release_date,poster_path,backdrop_path,overview,rated_at"
+
+    res = client.post('/reviews/ratings/bulk', data=exported, headers={**user2_auth, 'Content-Type': 'text/csv'})
+    assert res.get_json()['created'] == 3
+
+def test_export_gzip(client, user1_auth):
+    rate_movies(client, user1_auth, [1, 2])
+
+    res = client.get('/reviews/ratings/export', headers={**user1_auth, 'Accept-Encoding': 'gzip'})
+
+    assert res.headers['Content-Encoding'] == 'gzip'
+    lines = gzip.decompress(res.get_data()).decode().splitlines()
+    assert len(lines) == 2
+
+def test_export_bad_format(client, user1_auth):
+    assert client.get('/reviews/ratings/export?format=xml', headers=user1_auth).status_code == 400
+
+# ==============================================================================
+# COMMUNITY RATING STATS
+# ==============================================================================
+
+def stats_of(app, tmdb_id):
+    with app.app_context():
+        stats = db.session.query(MovieRatingStats).join(Movie, Movie.id == MovieRatingStats.movie_id) \
+            .filter(Movie.tmdb_id == tmdb_id).first()
+        if stats is None:
+            return None
+        return stats.rating_count, stats.score_sum, {k: v for k, v in stats.histogram.items() if v}
+
+def test_stats_follow_create_update_delete(client, user1_auth, user2_auth, app):
+    payload = {"tmdb_id": 603, "score": 8, "movie_data": {"title": "The Matrix"}}
+    client.post('/reviews/ratings', json=payload, headers=user1_auth)
+    client.post('/reviews/ratings', json={**payload, "score": 6}, headers=user2_auth)
+    assert stats_of(app, 603) == (2, 14, {6: 1, 8: 1})
+
+    # a rejected duplicate doesn't count
+    assert client.post('/reviews/ratings', json=payload, headers=user1_auth).status_code == 409
+    assert stats_of(app, 603) == (2, 14, {6: 1, 8: 1})
+
+    client.put('/reviews/ratings/603', json={"score": 10}, headers=user1_auth)
+    assert stats_of(app, 603) == (2, 16, {6: 1, 10: 1})
+
+    client.delete('/reviews/ratings/603', headers=user2_auth)
+    assert stats_of(app, 603) == (1, 10, {10: 1})
+
+def test_stats_follow_bulk_import_and_portable_create(client, user1_auth, user2_auth, app):
+    rows = [
+        {"tmdb_id": 1, "score": 5, "movie_data": {"title": "One"}},
+        {"tmdb_id": 2, "score": 3, "movie_data": {"title": "Two"}}
+    ]
+    client.post('/reviews/ratings/bulk', json=rows, headers=user1_auth)
+    client.post('/reviews/ratings/bulk', json=rows, headers=user1_auth)  # all 'exists', no change
+
+    with patch('routes.review.upsert_insert', return_value=None), patch('ratings_store.upsert_insert', return_value=None):
+        client.post('/reviews/ratings', json={"tmdb_id": 1, "score": 4}, headers=user2_auth)
+
+    assert stats_of(app, 1) == (2, 9, {4: 1, 5: 1})
+    assert stats_of(app, 2) == (1, 3, {3: 1})
+
+def test_rebuild_matches_incremental_stats(client, user1_auth, user2_auth, app):
+    for auth, score in ((user1_auth, 2), (user2_auth, 7)):
+        client.post('/reviews/ratings', json={"tmdb_id": 11, "score": score, "movie_data": {"title": "Eleven"}}, headers=auth)
+    client.put('/reviews/ratings/11', json={"score": 9}, headers=user1_auth)
+    incremental = stats_of(app, 11)
+
+    with app.app_context():
+        db.session.query(MovieRatingStats).update({'rating_count': 99})  # drift
+        db.session.commit()
+        assert rebuild_rating_stats() == 1
+
+    assert stats_of(app, 11) == incremental == (2, 16, {7: 1, 9: 1})
+
+def test_stats_rebuild_cli(client, user1_auth, app):
+    client.post('/reviews/ratings', json={"tmdb_id": 12, "score": 3, "movie_data": {"title": "Twelve"}}, headers=user1_auth)
+
+    result = app.test_cli_runner().invoke(args=['stats', 'rebuild'])
+
+    assert result.exit_code == 0
+    assert 'Rebuilt rating stats of 1 movies' in result.output
+
+def test_get_rating_stats(client, user1_auth, user2_auth):
+    client.post('/reviews/ratings', json={"tmdb_id": 603, "score": 8, "movie_data": {"title": "The Matrix"}}, headers=user1_auth)
+    client.post('/reviews/ratings', json={"tmdb_id": 603, "score": 5}, headers=user2_auth)
+
+    res = client.get('/reviews/stats?ids=603,604', headers=user1_auth)
+
+    assert res.status_code == 200
+    data = res.get_json()
+    assert data['603']['count'] == 2
+    assert data['603']['average'] == 6.5
+    assert data['603']['histogram'] == {"5": 1, "8": 1}
+    assert data['603']['last_rated_at'] is not None
+    assert data['604'] == {"count": 0, "average": None, "histogram": {}, "last_rated_at": None}
+
+def test_get_rating_stats_bad_ids(client, user1_auth):
+    assert client.get('/reviews/stats', headers=user1_auth).status_code == 400
+    assert client.get('/reviews/stats?ids=603,abc', headers=user1_auth).status_code == 400
+    too_many = ','.join(str(i) for i in range(101))
+    assert client.get(f'/reviews/stats?ids={too_many}', headers=user1_auth).status_code == 400
+
+# ==============================================================================
+# VALIDATORS
+# ==============================================================================
+
+def test_get_ratings_not_modified_until_a_rating_changes(client, user1_auth, user2_auth, app):
+    rate_movies(client, user1_auth, [1, 2])
+    first = client.get('/reviews/ratings', headers=user1_auth)
+    etag = first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+
+    # answered without querying the ratings
+    with count_statements(app) as statements:
+        unchanged = client.get('/reviews/ratings', headers={**user1_auth, 'If-None-Match': etag})
+    assert unchanged.status_code == 304
+    assert not any('ratings' in statement for statement in statements)
+
+    # another user's writes don't touch this list, a page has its own tag
+    rate_movies(client, user2_auth, [3])
+    assert client.get('/reviews/ratings', headers={**user1_auth, 'If-None-Match': etag}).status_code == 304
+    assert client.get('/reviews/ratings?limit=1', headers={**user1_auth, 'If-None-Match': etag}).status_code == 200
+
+    for change in [
+        lambda: rate_movies(client, user1_auth, [4]),
+        lambda: client.put('/reviews/ratings/1', json={"score": 2}, headers=user1_auth),
+        lambda: client.delete('/reviews/ratings/2', headers=user1_auth),
+        lambda: client.post('/reviews/ratings/bulk', json=[{"tmdb_id": 5, "score": 1, "movie_data": {"title": "Five"}}], headers=user1_auth)
+    ]:
+        change()
+        response = client.get('/reviews/ratings', headers={**user1_auth, 'If-None-Match': etag})
+        assert response.status_code == 200
+        etag = response.headers['ETag']
+
+def test_get_ratings_etag_changes_with_movie_details(client, user1_auth, app):
+    rate_movies(client, user1_auth, [101])
+    etag = client.get('/reviews/ratings', headers=user1_auth).headers['ETag']
+
+    # a search mirrors new details of the rated movie into the catalog
+    details = [{"tmdb_id": 101, "title": "Batman Begins", "genre_ids": [28], "popularity": 50.0}]
+    with app.app_context():
+        schedule_mirror(details)
+        wait_for_mirrors()
+    changed = client.get('/reviews/ratings', headers={**user1_auth, 'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.get_json()[0]['movie']['title'] == "Batman Begins"
+
+    # same details again, new popularity or genres, movies nobody rated: same tag
+    for other in [
+        details,
+        [{**details[0], "genre_ids": [28, 80], "popularity": 80.0}],
+        [{"tmdb_id": 999, "title": "Not Rated"}],
+    ]:
+        with app.app_context():
+            schedule_mirror(other)
+            wait_for_mirrors()
+        assert client.get('/reviews/ratings', headers={**user1_auth, 'If-None-Match': changed.headers['ETag']}).status_code == 304
+
+def test_get_ratings_not_modified_has_the_tag_of_the_body(client, user1_auth):
+    rate_movies(client, user1_auth, [1, 2])
+
+    for headers in [{}, {'Accept': 'application/msgpack'}, {'Accept-Encoding': 'gzip'}]:
+        body = client.get('/reviews/ratings', headers={**user1_auth, **headers})
+        revalidated = client.get('/reviews/ratings', headers={**user1_auth, **headers, 'If-None-Match': body.headers['ETag']})
+        assert revalidated.status_code == 304
+        assert revalidated.headers['ETag'] == body.headers['ETag']
+        assert revalidated.headers['Vary'] == body.headers['Vary']
+
+# ==============================================================================
+# QUERY BUDGET
+# ==============================================================================
+
+def test_get_ratings_is_one_query(client, user1_auth, app):
+    """The whole list comes from one joined query, not one movie lookup per rating."""
+    rate_movies(client, user1_auth, range(1, 6))
+    app.config['SQL_QUERY_BUDGET'] = 1
+
+    with count_statements(app) as statements:
+        response = client.get('/reviews/ratings', headers=user1_auth)
+
+    assert response.status_code == 200
+    assert [item['movie']['title'] for item in response.get_json()] == [f"Movie {i}" for i in range(1, 6)]
+    assert len(statements) == 1
+
+def test_query_budget_exceeded(client, user1_auth, app, capsys):
+    rate_movies(client, user1_auth, [1])
+    app.config['SQL_QUERY_BUDGET'] = 0
+
+    with pytest.raises(QueryBudgetExceeded, match='GET /reviews/ratings ran 1 SQL statements'):
+        client.get('/reviews/ratings', headers=user1_auth)
+
+    app.config['SQL_QUERY_BUDGET_STRICT'] = False
+    assert client.get('/reviews/ratings', headers=user1_auth).status_code == 200
+    assert 'ran 1 SQL statements (budget 0)' in capsys.readouterr().out
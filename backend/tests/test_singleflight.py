@@ -0,0 +1,122 @@
+import threading
+import time
+from unittest.mock import patch, Mock
+from extensions import cache, tmdb
+from singleflight import cached_single_flight, default_lock_ttl
+
+
+def run_concurrently(app, count, target):
+    """Calls target from count threads (each with its own app context) and returns their results"""
+    results = [None] * count
+    start = threading.Barrier(count)
+
+    def worker(i):
+        with app.app_context():
+            start.wait()
+            try:
+                results[i] = target()
+            except Exception as e:
+                results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    return results
+
+
+def test_concurrent_misses_share_one_load(app):
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"results": []}
+
+    results = run_concurrently(app, 8, lambda: cached_single_flight("search:query=matrix", loader, timeout=60))
+
+    assert len(calls) == 1
+    assert all(result == {"results": []} for result in results)
+    assert cache.get("search:query=matrix") == {"results": []}
+
+
+def test_loader_error_reaches_every_waiter_and_is_not_cached(app):
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.2)
+        raise RuntimeError("TMDB down")
+
+    results = run_concurrently(app, 4, lambda: cached_single_flight("genres", loader, timeout=60))
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert len(calls) < 4
+    assert cache.get("genres") is None
+    assert cache.get("genres:lock") is None
+
+
+def test_waits_for_the_worker_holding_the_lock(app):
+    """Another worker holds the lock: this one polls the cache instead of calling TMDB."""
+    cache.set("genres:lock", "other-worker", timeout=10)
+    loader = Mock(return_value=["not", "used"])
+
+    def other_worker_finishes():
+        time.sleep(0.2)
+        with app.app_context():
+            cache.set("genres", [{"id": 28, "name": "Action"}], timeout=60)
+
+    threading.Thread(target=other_worker_finishes).start()
+
+    assert cached_single_flight("genres", loader, timeout=60) == [{"id": 28, "name": "Action"}]
+    loader.assert_not_called()
+
+
+def test_stuck_lock_holder_does_not_block_forever(app):
+    cache.set("genres:lock", "dead-worker", timeout=10)
+    loader = Mock(return_value=["fresh"])
+
+    with patch('singleflight.POLL_INTERVAL', 0.01):
+        assert cached_single_flight("genres", loader, timeout=60, lock_ttl=0.1) == ["fresh"]
+
+    loader.assert_called_once()
+
+
+def test_followers_wait_for_the_whole_tmdb_retry_budget(app):
+    app.config.update(TMDB_CONNECT_TIMEOUT=1, TMDB_READ_TIMEOUT=4, TMDB_MAX_RETRIES=2,
+                      TMDB_RETRY_BACKOFF=0.5, TMDB_MAX_RETRY_AFTER=4)
+    tmdb.init_app(app)
+    # 3 attempts of 1 + 4 s, 2 waits of at most 4 s
+    assert tmdb.max_call_seconds() == 23
+    assert default_lock_ttl() == 24
+
+    cache.set("genres:lock", "retrying-worker", timeout=60)
+    loader = Mock(return_value=["fresh"])
+    clock = iter(range(0, 100, 5))
+
+    with patch('singleflight.time.sleep'), patch('singleflight.time.monotonic', side_effect=lambda: next(clock)):
+        assert cached_single_flight("genres", loader, timeout=60) == ["fresh"]
+
+    # polled at 5, 10, 15 and 20 s, loaded itself only past the 24 s of the leader's lock
+    loader.assert_called_once()
+    assert next(clock) == 30
+
+def test_concurrent_search_requests_make_one_tmdb_call(app):
+    with patch('tmdb.requests.Session.get') as mock_get:
+        def slow_get(*args, **kwargs):
+            time.sleep(0.2)
+            response = Mock()
+            response.status_code = 200
+            response.json.return_value = {"page": 1, "total_pages": 1, "results": []}
+            return response
+
+        mock_get.side_effect = slow_get
+
+        def search():
+            return app.test_client().get('/movies/search?query=Matrix').status_code
+
+        results = run_concurrently(app, 6, search)
+
+        assert results == [200] * 6
+        assert mock_get.call_count == 1
@@ -0,0 +1,182 @@
+import json
+import time
+import pytest
+from unittest.mock import patch, Mock
+from cachelib import SimpleCache
+from app import create_app
+from flask_jwt_extended import create_access_token
+from extensions import cache
+from models import db, User
+from tiered_cache import LocalLRU, TieredCache
+
+
+def make_cache(**kwargs):
+    options = {'max_bytes': 10_000, 'l1_ttl': 60, 'prefixes': ['genres', 'search:']}
+    options.update(kwargs)
+    return TieredCache(SimpleCache(), **options)
+
+
+def test_hot_key_is_served_from_l1():
+    tiered = make_cache()
+    tiered.l2.set('genres', [{"id": 28}])
+
+    assert tiered.get('genres') == [{"id": 28}]   # L1 miss, L2 hit
+    assert tiered.get('genres') == [{"id": 28}]   # L1 hit
+    assert tiered.get('search:query=none') is None
+
+    stats = tiered.stats()
+    assert stats['l1']['hits'] == 1 and stats['l1']['misses'] == 2 and stats['l1']['keys'] == 1
+    assert stats['l2'] == {'hits': 1, 'misses': 1, 'evictions': None}
+
+
+def test_only_configured_prefixes_and_never_locks_go_to_l1():
+    tiered = make_cache()
+    tiered.set('user:1', 'x')
+    tiered.set('genres:lock', 'token')
+
+    assert tiered.get('user:1') == 'x'
+    assert tiered.get('genres:lock') == 'token'
+    assert tiered.stats()['l1']['keys'] == 0
+
+
+def test_get_many_reads_l2_once_for_the_l1_misses():
+    tiered = make_cache(prefixes=['cast:'])
+    tiered.set('cast:1', [1])
+    tiered.l2.set('cast:2', [2])
+    tiered.l2.set('other', 'x')
+
+    with patch.object(tiered.l2, 'get_many', wraps=tiered.l2.get_many) as l2_get_many:
+        assert tiered.get_many('cast:1', 'cast:2', 'cast:3', 'other') == [[1], [2], None, 'x']
+
+    l2_get_many.assert_called_once_with('cast:2', 'cast:3', 'other')
+    assert tiered.stats()['l2'] == {'hits': 2, 'misses': 1, 'evictions': None}
+    # cast:2 is now in L1
+    assert tiered.local.get('cast:2') == [2]
+
+
+def test_byte_budget_evicts_least_recently_used():
+    lru = LocalLRU(max_bytes=3000)
+    payload = 'x' * 900
+
+    lru.set('a', payload, 60)
+    lru.set('b', payload, 60)
+    lru.set('c', payload, 60)
+    lru.get('a')               # 'b' is now the least recently used
+    lru.set('d', payload, 60)
+
+    assert lru.get('b') is None
+    assert lru.get('a') == payload and lru.get('d') == payload
+    assert lru.stats()['evictions'] == 1
+    assert lru.stats()['bytes'] <= 3000
+
+    # larger than the whole budget: not kept
+    assert lru.set('huge', 'x' * 5000, 60) is False
+
+
+def test_l1_entries_expire():
+    lru = LocalLRU(max_bytes=1000)
+    lru.set('genres', [1], ttl=0.05)
+    time.sleep(0.1)
+
+    assert lru.get('genres') is None
+    assert lru.stats()['expirations'] == 1
+
+
+def test_writes_and_deletes_replace_the_l1_copy():
+    tiered = make_cache()
+    tiered.set('genres', [1])
+    tiered.set('genres', [2])
+    assert tiered.get('genres') == [2]
+
+    tiered.delete('genres')
+    assert tiered.get('genres') is None
+
+
+def test_invalidation_message_of_another_worker():
+    tiered = make_cache()
+    tiered.instance_id = 'me'
+    tiered.set('genres', [1])
+    tiered.set('search:query=a', [2])
+
+    tiered.invalidate(json.dumps({'origin': 'me', 'keys': ['genres']}))
+    assert tiered.local.get('genres') == [1]      # own message
+
+    tiered.invalidate(json.dumps({'origin': 'other', 'keys': ['genres']}).encode())
+    assert tiered.local.get('genres') is None
+    assert tiered.local.get('search:query=a') == [2]
+
+    tiered.invalidate(json.dumps({'origin': 'other', 'keys': '*'}))
+    assert tiered.local.get('search:query=a') is None
+
+    tiered.invalidate(b'not json')
+
+
+def test_writes_are_published_when_l2_is_redis():
+    l2 = SimpleCache()
+    l2._write_client = Mock()
+    tiered = TieredCache(l2, prefixes=['genres'])
+
+    with patch.object(tiered, '_ensure_listener'):
+        tiered.instance_id = 'me'
+        tiered.set('genres', [1])
+        tiered.delete('genres')
+        tiered.set('other', 1)
+
+    messages = [json.loads(call.args[1]) for call in l2._write_client.publish.call_args_list]
+    assert messages == [{'origin': 'me', 'keys': ['genres']}, {'origin': 'me', 'keys': ['genres']}]
+
+
+@pytest.fixture
+def tiered_app():
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+        "CACHE_TYPE": "tiered_cache.TieredCache",
+        "CACHE_L2_TYPE": "SimpleCache",
+        "TMDB_BASE_URL": "https://tmdb.test/3",
+        "JWT_SECRET_KEY": "test-secret-key",
+        "CACHE_STATS_ENABLED": True
+    })
+    with app.app_context():
+        cache.clear()
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def stats_auth():
+    user = User(email="stats@test.com", password_hash="x")
+    db.session.add(user)
+    db.session.commit()
+    return {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}
+
+
+def test_genres_route_through_both_tiers(tiered_app):
+    client = tiered_app.test_client()
+
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"genres": [{"id": 28, "name": "Action"}]}
+        mock_get.return_value = mock_response
+
+        for _ in range(3):
+            assert client.get('/genres/').get_json() == [{"id": 28, "name": "Action"}]
+
+    stats = client.get('/cache/stats', headers=stats_auth()).get_json()
+    assert mock_get.call_count == 1
+    assert stats['l1']['hits'] >= 2
+    # the genres, and the user record of the stats request
+    assert stats['l1']['keys'] == 2
+    # one TMDB call, timed
+    assert stats['tmdb']['genres']['calls'] == 1
+    assert stats['tmdb']['genres']['avg_ms'] >= 0
+
+
+def test_cache_stats_need_a_login(tiered_app):
+    assert tiered_app.test_client().get('/cache/stats').status_code == 401
+
+
+def test_cache_stats_are_off_by_default(client):
+    assert client.get('/cache/stats').status_code == 404
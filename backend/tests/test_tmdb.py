@@ -0,0 +1,142 @@
+import time
+import pytest
+from unittest.mock import patch, Mock
+import requests
+from extensions import tmdb
+
+
+def make_response(status_code, payload=None, headers=None):
+    response = Mock()
+    response.status_code = status_code
+    response.json.return_value = payload or {}
+    response.headers = headers or {}
+    if status_code >= 400:
+        response.raise_for_status.side_effect = requests.exceptions.HTTPError(response=response)
+    return response
+
+
+def test_session_is_reused_between_calls(app):
+    """Keep-alive: the same pooled session serves every call of the worker."""
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_get.return_value = make_response(200, {"ok": True})
+
+        first = tmdb.session
+        tmdb.get('/genre/movie/list')
+        tmdb.get('/genre/movie/list')
+
+        assert tmdb.session is first
+        assert mock_get.call_count == 2
+        assert first.headers['Authorization'].startswith('Bearer ')
+
+
+def test_calls_use_connect_and_read_timeouts(app):
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_get.return_value = make_response(200)
+
+        tmdb.get('/movie/1/credits', params={"language": "en-US"})
+
+        args, kwargs = mock_get.call_args
+        assert args[0] == 'https://tmdb.test/3/movie/1/credits'
+        assert kwargs['timeout'] == (app.config['TMDB_CONNECT_TIMEOUT'], app.config['TMDB_READ_TIMEOUT'])
+
+
+def test_retries_on_5xx_then_succeeds(app):
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_get.side_effect = [make_response(503), make_response(200, {"genres": []})]
+
+        data = tmdb.get('/genre/movie/list', endpoint='genres')
+
+        assert data == {"genres": []}
+        assert mock_get.call_count == 2
+        assert tmdb.stats()['genres']['retries'] == 1
+
+
+def test_retries_are_bounded(app):
+    """After TMDB_MAX_RETRIES the error reaches the caller with the response attached."""
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_get.return_value = make_response(500, {"status_message": "Internal Error"})
+
+        with pytest.raises(requests.exceptions.HTTPError) as error:
+            tmdb.get('/genre/movie/list', endpoint='genres')
+
+        assert error.value.response.status_code == 500
+        assert mock_get.call_count == app.config['TMDB_MAX_RETRIES'] + 1
+        assert tmdb.stats()['genres']['errors'] == 1
+
+
+def test_4xx_is_not_retried(app):
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_get.return_value = make_response(404)
+
+        with pytest.raises(requests.exceptions.HTTPError):
+            tmdb.get('/movie/0/credits')
+
+        assert mock_get.call_count == 1
+
+
+def test_429_honors_retry_after(app):
+    with patch('tmdb.requests.Session.get') as mock_get, patch('tmdb.time.sleep') as mock_sleep:
+        mock_get.side_effect = [make_response(429, headers={'Retry-After': '2'}), make_response(200)]
+
+        tmdb.get('/search/movie')
+
+        mock_sleep.assert_called_once_with(2.0)
+
+
+def test_long_retry_after_is_returned_to_the_caller(app):
+    """Past TMDB_MAX_RETRY_AFTER (the read timeout by default) the request doesn't wait"""
+    assert tmdb.max_retry_after == app.config['TMDB_READ_TIMEOUT']
+
+    with patch('tmdb.requests.Session.get') as mock_get, patch('tmdb.time.sleep') as mock_sleep:
+        mock_get.return_value = make_response(429, headers={'Retry-After': '3600'})
+
+        with pytest.raises(requests.exceptions.HTTPError) as error:
+            tmdb.get('/search/movie')
+
+        assert error.value.response.status_code == 429
+        assert mock_get.call_count == 1
+        mock_sleep.assert_not_called()
+
+    with patch('tmdb.requests.Session.get') as mock_get, patch('tmdb.time.sleep') as mock_sleep:
+        mock_get.side_effect = [make_response(503, headers={'Retry-After': '3'}), make_response(200)]
+
+        tmdb.get('/search/movie')
+
+        mock_sleep.assert_called_once_with(3.0)
+
+
+def test_latency_counters(app):
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_get.return_value = make_response(200)
+
+        tmdb.get('/search/movie', endpoint='search')
+        tmdb.get('/search/movie', endpoint='search')
+
+    stats = tmdb.stats()['search']
+    assert stats['calls'] == 2
+    assert stats['errors'] == 0
+    assert stats['max_ms'] >= stats['avg_ms'] >= 0
+
+
+def test_budget_counts_the_calls_of_the_last_second(app):
+    app.config['TMDB_RATE_LIMIT'] = 3
+    tmdb.init_app(app)
+
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_get.return_value = make_response(200)
+        tmdb.get('/genre/movie/list')
+        tmdb.get('/genre/movie/list')
+        assert tmdb.budget() == 1
+
+    with patch('tmdb.time.monotonic', return_value=time.monotonic() + 1.5):
+        assert tmdb.budget() == 3
+
+
+def test_budget_is_empty_while_rate_limited(app):
+    with patch('tmdb.requests.Session.get') as mock_get:
+        mock_get.return_value = make_response(429, headers={'Retry-After': '30'})
+
+        with patch('tmdb.time.sleep'), pytest.raises(requests.exceptions.HTTPError):
+            tmdb.get('/genre/movie/list')
+
+    assert tmdb.budget() == 0
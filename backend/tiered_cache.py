@@ -0,0 +1,298 @@
+"""
+Two-tier Flask-Caching backend: a bounded in-process LRU (L1) in front of the shared
+backend (L2, Redis in production).
+
+Hot keys (genres, searches, casts) are served from the worker's memory after the first
+hit. Writes and deletes go to L2 and are broadcast on a Redis pub/sub channel, so the other
+workers drop their L1 copy; L1 entries also expire after a short TTL in case a message
+is lost. Values kept in L1 are shared between requests and must not be mutated.
+
+    CACHE_TYPE = 'tiered_cache.TieredCache'
+    CACHE_L2_TYPE = 'RedisCache'
+"""
+import json
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from flask_caching.backends.base import BaseCache
+from werkzeug.utils import import_string
+
+
+class LocalLRU:
+    """Thread-safe LRU with a budget in (pickled) bytes and a TTL per entry"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl):
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+        with self._lock:
+            self._remove(key)
+            # one entry may not take more than the whole budget
+            if size > self.max_bytes or ttl <= 0:
+                return False
+
+            self._entries[key] = (value, time.monotonic() + ttl, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'keys': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes
+            }
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+
+class TieredCache(BaseCache):
+
+    def __init__(self, l2, max_bytes=32 * 1024 * 1024, l1_ttl=60, prefixes=(),
+                 channel='cache:l1:invalidate', default_timeout=300):
+        super().__init__(default_timeout=default_timeout)
+        self.l2 = l2
+        self.local = LocalLRU(max_bytes)
+        self.l1_ttl = l1_ttl
+        # only these keys are kept in L1; coordination keys (locks) always go to L2
+        self.prefixes = tuple(prefixes)
+        self.channel = channel
+        self.l2_hits = 0
+        self.l2_misses = 0
+        self._redis = getattr(l2, '_write_client', None)
+        self._listener_pid = None
+        self._listener_lock = threading.Lock()
+        self.instance_id = None
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        l2_type = config.get('CACHE_L2_TYPE', 'RedisCache')
+        if '.' not in l2_type:
+            l2_type = 'flask_caching.backends.' + l2_type
+        l2 = import_string(l2_type).factory(app, config, args, dict(kwargs))
+
+        prefixes = [prefix.strip() for prefix in config.get('CACHE_L1_PREFIXES', '').split(',') if prefix.strip()]
+        return cls(
+            l2,
+            max_bytes=config.get('CACHE_L1_MAX_BYTES', 32 * 1024 * 1024),
+            l1_ttl=config.get('CACHE_L1_TTL', 60),
+            prefixes=prefixes,
+            default_timeout=kwargs.get('default_timeout', 300)
+        )
+
+    # Flask-Caching sets CACHE_SERIALIZER on the backend, it belongs to L2 (L1 keeps objects)
+    @property
+    def serializer(self):
+        return getattr(self.l2, 'serializer', None)
+
+    @serializer.setter
+    def serializer(self, serializer):
+        self.l2.serializer = serializer
+
+    def cached_locally(self, key):
+        return key.startswith(self.prefixes) and not key.endswith((':lock', ':refreshing'))
+
+    def get(self, key):
+        if not self.cached_locally(key):
+            return self._l2_get(key)
+
+        self._ensure_listener()
+        value = self.local.get(key)
+        if value is not None:
+            return value
+
+        value = self._l2_get(key)
+        if value is not None:
+            self.local.set(key, value, self.l1_ttl)
+        return value
+
+    def get_many(self, *keys):
+        """L1 first, the rest from L2 in one round trip (MGET on Redis)"""
+        if any(self.cached_locally(key) for key in keys):
+            self._ensure_listener()
+        values = [self.local.get(key) if self.cached_locally(key) else None for key in keys]
+
+        missing = [index for index, value in enumerate(values) if value is None]
+        if not missing:
+            return values
+
+        for index, value in zip(missing, self.l2.get_many(*(keys[index] for index in missing))):
+            if value is None:
+                self.l2_misses += 1
+                continue
+            self.l2_hits += 1
+            values[index] = value
+            if self.cached_locally(keys[index]):
+                self.local.set(keys[index], value, self.l1_ttl)
+        return values
+
+    def set(self, key, value, timeout=None):
+        result = self.l2.set(key, value, timeout=timeout)
+
+        if self.cached_locally(key):
+            self._ensure_listener()
+            timeout = self._normalize_timeout(timeout)
+            self.local.set(key, value, min(timeout, self.l1_ttl) if timeout else self.l1_ttl)
+            self._publish([key])
+        return result
+
+    def add(self, key, value, timeout=None):
+        # nothing to invalidate: add never replaces a value
+        return self.l2.add(key, value, timeout=timeout)
+
+    def delete(self, key):
+        result = self.l2.delete(key)
+        if self.cached_locally(key):
+            self.local.delete(key)
+            self._publish([key])
+        return result
+
+    def has(self, key):
+        if self.cached_locally(key) and self.local.get(key) is not None:
+            return True
+        return self.l2.has(key)
+
+    def clear(self):
+        result = self.l2.clear()
+        self.local.clear()
+        self._publish('*')
+        return result
+
+    def inc(self, key, delta=1):
+        return self.l2.inc(key, delta=delta)
+
+    def dec(self, key, delta=1):
+        return self.l2.dec(key, delta=delta)
+
+    def _l2_get(self, key):
+        value = self.l2.get(key)
+        if value is None:
+            self.l2_misses += 1
+        else:
+            self.l2_hits += 1
+        return value
+
+    def stats(self):
+        """Counters of this worker per tier (L2 evictions are Redis-wide)"""
+        l2_evictions = None
+        if self._redis is not None:
+            try:
+                l2_evictions = self._redis.info('stats').get('evicted_keys')
+            except Exception as e:
+                print(f"Error reading Redis stats: {e}")
+
+        return {
+            'l1': self.local.stats(),
+            'l2': {'hits': self.l2_hits, 'misses': self.l2_misses, 'evictions': l2_evictions}
+        }
+
+    def reset_stats(self):
+        self.local.reset_stats()
+        self.l2_hits = 0
+        self.l2_misses = 0
+
+    # invalidation across workers
+
+    def _publish(self, keys):
+        if self._redis is None:
+            return
+        self._ensure_listener()
+        try:
+            self._redis.publish(self.channel, json.dumps({'origin': self.instance_id, 'keys': keys}))
+        except Exception as e:
+            # the other workers' copies still expire after l1_ttl
+            print(f"Error publishing cache invalidation: {e}")
+
+    def _ensure_listener(self):
+        """One listener thread per process (started after a fork too)"""
+        if self._redis is None or self._listener_pid == os.getpid():
+            return
+
+        with self._listener_lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            self.instance_id = f"{os.getpid()}-{uuid.uuid4().hex}"
+            # a forked worker must not serve what the parent cached without listening
+            self.local.clear()
+            threading.Thread(target=self._listen, name='cache-invalidation', daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # messages sent while we weren't subscribed are lost, start from an empty L1
+                self.local.clear()
+                for message in pubsub.listen():
+                    self.invalidate(message['data'])
+            except Exception as e:
+                print(f"Cache invalidation listener error: {e}")
+                self.local.clear()
+                time.sleep(1)
+
+    def invalidate(self, data):
+        """Applies an invalidation message of another worker"""
+        try:
+            message = json.loads(data)
+        except (TypeError, ValueError):
+            return
+
+        if message.get('origin') == self.instance_id:
+            return
+        if message.get('keys') == '*':
+            self.local.clear()
+            return
+        for key in message.get('keys') or []:
+            self.local.delete(key)
@@ -0,0 +1,285 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+# statuses worth retrying: rate limited or upstream hiccup
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TMDBClient:
+    """Shared gateway to the TMDB API, one pooled keep-alive session per worker process"""
+
+    extension_name = 'tmdb'
+
+    def __init__(self, app=None):
+        self.api_key = None
+        self.base_url = None
+        self.connect_timeout = 3.05
+        self.read_timeout = 10.0
+        self.max_retries = 2
+        self.backoff = 0.25
+        self.max_retry_after = self.read_timeout
+        self.pool_size = 10
+        self.rate_limit = 40
+
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats = {}
+        # send times of the calls of the last second, and until when TMDB asked us to back off
+        self._sent = deque()
+        self._throttled_until = 0.0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.api_key = app.config.get('TMDB_API_KEY')
+        self.base_url = app.config.get('TMDB_BASE_URL')
+        self.connect_timeout = app.config.get('TMDB_CONNECT_TIMEOUT', self.connect_timeout)
+        self.read_timeout = app.config.get('TMDB_READ_TIMEOUT', self.read_timeout)
+        self.max_retries = app.config.get('TMDB_MAX_RETRIES', self.max_retries)
+        self.backoff = app.config.get('TMDB_RETRY_BACKOFF', self.backoff)
+        self.max_retry_after = app.config.get('TMDB_MAX_RETRY_AFTER', self.read_timeout)
+        self.pool_size = app.config.get('TMDB_POOL_SIZE', self.pool_size)
+        self.rate_limit = app.config.get('TMDB_RATE_LIMIT', self.rate_limit)
+
+        # config may have changed (new app), so the next call builds a fresh session
+        self.close()
+        self.reset_stats()
+        app.extensions[self.extension_name] = self
+
+    @property
+    def headers(self):
+        return {
+            "accept": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+
+    @property
+    def session(self):
+        """Returns the session of the current process (sockets must not be shared after a fork)"""
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    session.headers.update(self.headers)
+                    self._session = session
+                    self._pid = os.getpid()
+        return self._session
+
+    def close(self):
+        with self._lock:
+            if self._session is not None and self._pid == os.getpid():
+                self._session.close()
+            self._session = None
+            self._pid = None
+
+    def get(self, path, params=None, endpoint=None):
+        """
+        GET a TMDB resource and return the decoded JSON.
+        Raises requests.exceptions.RequestException on failure, with .response set
+        when TMDB answered with an error status.
+        """
+        endpoint = endpoint or path
+        url = f"{self.base_url}{path}"
+        start = time.perf_counter()
+        retries = 0
+
+        try:
+            while True:
+                response = self.session.get(
+                    url,
+                    params=params,
+                    timeout=(self.connect_timeout, self.read_timeout)
+                )
+                self._track(response)
+                delay = self._retry_wait(response, retries)
+                if delay is not None:
+                    time.sleep(delay)
+                    retries += 1
+                    continue
+                response.raise_for_status()
+                data = response.json()
+                break
+        except requests.exceptions.RequestException:
+            self._record(endpoint, start, retries, error=True)
+            raise
+
+        self._record(endpoint, start, retries)
+        return data
+
+    def _retry_wait(self, response, retries):
+        """
+        Seconds to wait before retrying response, None when it goes to the caller as is: not
+        a retryable status, no retries left, or a Retry-After longer than TMDB_MAX_RETRY_AFTER
+        (default the read timeout), not worth holding the request for.
+        """
+        if response.status_code not in RETRY_STATUSES or retries >= self.max_retries:
+            return None
+        delay = self._retry_delay(response, retries)
+        return delay if delay <= self.max_retry_after else None
+
+    def max_call_seconds(self):
+        """
+        Longest a get() can take: every attempt running into the timeouts, with the longest
+        wait before each retry (a capped Retry-After, or the backoff with its jitter)
+        """
+        attempts = self.max_retries + 1
+        longest_backoff = self.backoff * (2 ** max(self.max_retries - 1, 0)) * 1.5
+        return attempts * (self.connect_timeout + self.read_timeout) + self.max_retries * max(self.max_retry_after, longest_backoff)
+
+    def _retry_delay(self, response, attempt):
+        # TMDB tells us how long to wait when rate limiting or unavailable
+        if response.status_code in (429, 503):
+            try:
+                return float(response.headers.get('Retry-After'))
+            except (TypeError, ValueError):
+                pass
+        # exponential backoff with jitter so workers don't retry in lockstep
+        return self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+    def _track(self, response):
+        now = time.monotonic()
+        with self._lock:
+            self._sent.append(now)
+            if response.status_code == 429:
+                self._throttled_until = max(self._throttled_until, now + self._retry_delay(response, 0))
+
+    def budget(self):
+        """Calls this worker may still make in the current second (TMDB_RATE_LIMIT), 0 while TMDB rate limits us"""
+        now = time.monotonic()
+        with self._lock:
+            if now < self._throttled_until:
+                return 0
+            while self._sent and self._sent[0] <= now - 1:
+                self._sent.popleft()
+            return max(self.rate_limit - len(self._sent), 0)
+
+    def _record(self, endpoint, start, retries, error=False):
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, {
+                'calls': 0, 'errors': 0, 'retries': 0, 'total_ms': 0.0, 'max_ms': 0.0
+            })
+            stats['calls'] += 1
+            stats['retries'] += retries
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            if error:
+                stats['errors'] += 1
+
+    def stats(self):
+        """Per-endpoint latency counters of this worker"""
+        with self._lock:
+            snapshot = {}
+            for endpoint, stats in self._stats.items():
+                snapshot[endpoint] = dict(stats, avg_ms=stats['total_ms'] / stats['calls'])
+            return snapshot
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+            self._sent.clear()
+            self._throttled_until = 0.0
+
+
+class AsyncTMDBClient(TMDBClient):
+    """asyncio flavour of the gateway (httpx), used by the ASGI serving path"""
+
+    extension_name = 'tmdb_async'
+
+    def __init__(self, app=None):
+        self.max_connections = 200
+        # tests plug an httpx.MockTransport here
+        self.transport = None
+        self._client = None
+        self._loop = None
+        super().__init__(app)
+
+    def init_app(self, app):
+        self.max_connections = app.config.get('TMDB_ASYNC_MAX_CONNECTIONS', self.max_connections)
+        super().init_app(app)
+
+    @property
+    def client(self):
+        """Returns the httpx client of the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._retire()
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.pool_size
+                ),
+                transport=self.transport
+            )
+            self._loop = loop
+        return self._client
+
+    def _retire(self):
+        """Drops the client, closed on its own event loop (its connections belong to it)"""
+        client, loop = self._client, self._loop
+        self._client = None
+        self._loop = None
+        if client is None or loop.is_closed():
+            # nothing runs on a closed loop anymore, its sockets go with the collected client
+            return
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        else:
+            # closed as soon as that loop runs again
+            loop.create_task(client.aclose())
+
+    def close(self):
+        self._retire()
+
+    async def aclose(self):
+        if self._client is not None and self._loop is asyncio.get_running_loop():
+            client = self._client
+            self._client = None
+            self._loop = None
+            await client.aclose()
+        else:
+            self._retire()
+
+    async def get(self, path, params=None, endpoint=None):
+        """
+        GET a TMDB resource and return the decoded JSON.
+        Raises httpx.HTTPStatusError when TMDB answered with an error status,
+        httpx.HTTPError for transport failures.
+        """
+        endpoint = endpoint or path
+        url = f"{self.base_url}{path}"
+        start = time.perf_counter()
+        retries = 0
+
+        try:
+            while True:
+                response = await self.client.get(url, params=params)
+                self._track(response)
+                delay = self._retry_wait(response, retries)
+                if delay is not None:
+                    await asyncio.sleep(delay)
+                    retries += 1
+                    continue
+                response.raise_for_status()
+                data = response.json()
+                break
+        except httpx.HTTPError:
+            self._record(endpoint, start, retries, error=True)
+            raise
+
+        self._record(endpoint, start, retries)
+        return data
@@ -0,0 +1,76 @@
+"""
+Resolution of the JWT identity to the user (flask_jwt_extended current_user).
+
+The minimal user record is memoized for the request (g) and kept USER_CACHE_TTL seconds
+in the shared cache, so authenticated requests don't query the users table. ORM updates
+and deletes of a User drop the cached record once committed; writes done with bulk
+statements must call forget_user.
+"""
+from collections import namedtuple
+from flask import g, current_app, jsonify, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+from extensions import cache, jwt
+from models import db, User
+
+UserRecord = namedtuple('UserRecord', ['id', 'email'])
+
+
+def user_key(user_id):
+    return f"user:{user_id}"
+
+
+def remember_user(user):
+    """Caches the record of a user just loaded or created (login, registration)"""
+    record = {'id': user.id, 'email': user.email}
+    cache.set(user_key(user.id), record, timeout=current_app.config['USER_CACHE_TTL'])
+    return UserRecord(**record)
+
+
+def forget_user(user_id):
+    cache.delete(user_key(user_id))
+    if has_app_context():
+        g.get('users', {}).pop(user_id, None)
+
+
+def get_user(user_id):
+    """UserRecord of an id, or None when the user doesn't exist"""
+    memo = g.setdefault('users', {})
+    if user_id not in memo:
+        record = cache.get(user_key(user_id))
+        if record is not None:
+            memo[user_id] = UserRecord(**record)
+        else:
+            user = db.session.get(User, user_id)
+            memo[user_id] = remember_user(user) if user else None
+    return memo[user_id]
+
+
+@jwt.user_lookup_loader
+def load_user(jwt_header, jwt_data):
+    return get_user(int(jwt_data[current_app.config['JWT_IDENTITY_CLAIM']]))
+
+
+# valid token of a deleted user
+@jwt.user_lookup_error_loader
+def user_not_found(jwt_header, jwt_data):
+    return jsonify({"msg": "User not found"}), 404
+
+
+# invalidation: ids of the users changed in a transaction, dropped from the cache after its commit
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def mark_user_changed(mapper, connection, user):
+    object_session(user).info.setdefault('changed_users', set()).add(user.id)
+
+
+@event.listens_for(db.session, 'after_commit')
+def forget_changed_users(session):
+    for user_id in session.info.pop('changed_users', ()):
+        forget_user(user_id)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_changed_users(session):
+    session.info.pop('changed_users', None)